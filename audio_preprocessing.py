@@ -0,0 +1,209 @@
+import shutil
+import subprocess
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from superagi.lib.logger import logger
+from aws_helpers import derived_key
+from tracing import count, span
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+# Frames processed at a time when computing energies, bounds the temporary float copies
+ENERGY_BLOCK_FRAMES = 1 << 15
+
+
+class AudioPreprocessingError(Exception):
+    pass
+
+
+class TimeMap:
+    """
+    Piecewise mapping from times in the trimmed audio back to times in the original recording.
+
+    The trimmed audio is the kept regions of the original played back to back. Region ``i``
+    starts at ``processed_starts[i]`` in the trimmed audio and at ``original_starts[i]`` in
+    the original.
+    """
+
+    def __init__(self, processed_starts, original_starts):
+        self.processed_starts = np.asarray(processed_starts, dtype=np.float64)
+        self.original_starts = np.asarray(original_starts, dtype=np.float64)
+
+    @classmethod
+    def identity(cls) -> "TimeMap":
+        return cls([0.0], [0.0])
+
+    @classmethod
+    def from_regions(cls, regions: List[Tuple[float, float]]) -> "TimeMap":
+        """
+        :param regions: ``(start, end)`` seconds of the kept parts of the original, in order.
+        """
+        if not regions:
+            return cls.identity()
+        original_starts = np.array([start for start, _ in regions], dtype=np.float64)
+        lengths = np.array([end - start for start, end in regions], dtype=np.float64)
+        processed_starts = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+        return cls(processed_starts, original_starts)
+
+    def __call__(self, seconds):
+        """
+        Map processed times (a number or an array) to original times.
+        """
+        values = np.asarray(seconds, dtype=np.float64)
+        index = np.maximum(np.searchsorted(self.processed_starts, values, side="right") - 1, 0)
+        result = self.original_starts[index] + (values - self.processed_starts[index])
+        return float(result) if result.ndim == 0 else result
+
+    def to_original(self, seconds: float) -> float:
+        return self(seconds)
+
+    def to_dict(self) -> dict:
+        return {"processed_starts": self.processed_starts.tolist(), "original_starts": self.original_starts.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TimeMap":
+        return cls(data["processed_starts"], data["original_starts"])
+
+
+def _ffmpeg() -> str:
+    executable = shutil.which("ffmpeg")
+    if executable is None:
+        raise AudioPreprocessingError("ffmpeg was not found, install it to preprocess audio")
+    return executable
+
+
+def decode_audio(source: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode any audio or video ffmpeg can read into mono 16-bit samples at sample_rate.
+
+    :param source: Local path or URL (e.g. a presigned S3 URL, so ffmpeg can seek with range requests).
+    """
+    process = subprocess.run(
+        [_ffmpeg(), "-nostdin", "-v", "error", "-i", source, "-vn", "-ac", "1", "-ar", str(sample_rate),
+         "-f", "s16le", "pipe:1"], capture_output=True)
+    if process.returncode != 0:
+        raise AudioPreprocessingError(f"ffmpeg could not decode the audio: {process.stderr.decode(errors='replace')}")
+    return np.frombuffer(process.stdout, dtype=np.int16)
+
+
+def encode_flac(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """
+    Encode mono 16-bit samples as FLAC.
+    """
+    process = subprocess.run(
+        [_ffmpeg(), "-nostdin", "-v", "error", "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "-i", "pipe:0",
+         "-c:a", "flac", "-f", "flac", "pipe:1"], input=samples.astype(np.int16, copy=False).tobytes(), capture_output=True)
+    if process.returncode != 0:
+        raise AudioPreprocessingError(f"ffmpeg could not encode the audio: {process.stderr.decode(errors='replace')}")
+    return process.stdout
+
+
+def frame_energies(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """
+    Energy of each full frame in dBFS.
+    """
+    frame_count = len(samples) // frame_length
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    energies = np.empty(frame_count, dtype=np.float64)
+    for start in range(0, frame_count, ENERGY_BLOCK_FRAMES):
+        block = frames[start:start + ENERGY_BLOCK_FRAMES].astype(np.float32) / 32768.0
+        energies[start:start + ENERGY_BLOCK_FRAMES] = np.einsum("ij,ij->i", block, block) / frame_length
+    return 10.0 * np.log10(energies + 1e-10)
+
+
+def detect_speech(samples: np.ndarray, sample_rate: int = SAMPLE_RATE, frame_seconds: float = FRAME_SECONDS,
+                  min_silence_seconds: float = 2.0, padding_seconds: float = 0.3, threshold_db: Optional[float] = None,
+                  floor_db: float = -50.0, margin_db: float = 12.0) -> List[Tuple[float, float]]:
+    """
+    Energy based voice activity detection.
+
+    Frames louder than the threshold are voiced. Voiced stretches are widened by
+    ``padding_seconds`` on both sides, and only silences longer than ``min_silence_seconds``
+    (after padding) are dropped, so short pauses between words stay untouched.
+
+    :param threshold_db: Fixed threshold in dBFS. By default it is ``margin_db`` above the
+        noise floor (the 10th percentile of frame energies), and at least ``floor_db``.
+    :return: ``(start, end)`` seconds of the regions to keep. The whole recording if no frame is voiced.
+    """
+    frame_length = max(1, int(sample_rate * frame_seconds))
+    energies = frame_energies(samples, frame_length)
+    duration = len(samples) / sample_rate
+    if len(energies) == 0:
+        return [(0.0, duration)]
+
+    if threshold_db is None:
+        threshold_db = max(np.percentile(energies, 10) + margin_db, floor_db)
+    voiced = energies > threshold_db
+    if not voiced.any():
+        return [(0.0, duration)]
+
+    padding = int(round(padding_seconds / frame_seconds))
+    if padding:
+        voiced = np.convolve(voiced.astype(np.int32), np.ones(2 * padding + 1, dtype=np.int32), mode="same") > 0
+
+    # Runs of identical values: edges where voiced changes
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], voiced, [False])).astype(np.int8)))
+    starts, ends = edges[0::2], edges[1::2]
+
+    # Merge voiced runs separated by short silences
+    min_silence = int(round(min_silence_seconds / frame_seconds))
+    keep = np.concatenate(([True], starts[1:] - ends[:-1] >= min_silence))
+    run_starts = starts[keep]
+    run_ends = np.concatenate((ends[np.flatnonzero(keep)[1:] - 1], ends[-1:]))
+
+    return [(start * frame_length / sample_rate, min(end * frame_length / sample_rate, duration))
+            for start, end in zip(run_starts.tolist(), run_ends.tolist())]
+
+
+def trim(samples: np.ndarray, regions: List[Tuple[float, float]], sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    return np.concatenate([samples[int(start * sample_rate):int(end * sample_rate)] for start, end in regions])
+
+
+class PreprocessedAudio:
+    def __init__(self, uri: str, time_map: TimeMap, original_seconds: float, processed_seconds: float,
+                 original_bytes: int, processed_bytes: int):
+        self.uri = uri
+        self.time_map = time_map
+        self.original_seconds = original_seconds
+        self.processed_seconds = processed_seconds
+        self.original_bytes = original_bytes
+        self.processed_bytes = processed_bytes
+
+
+def preprocess_s3_audio(s3_client, bucket: str, key: str, **vad_options) -> PreprocessedAudio:
+    """
+    Decode the audio at s3://bucket/key, cut its silences, and upload it as mono 16 kHz FLAC
+    to the derived audio folder next to the original (``_derived/<name>.preprocessed.flac``,
+    see aws_helpers.derived_key). The caller deletes it once it is transcribed.
+
+    :param vad_options: Passed to detect_speech.
+    :return: The s3:// URI of the reduced audio and the map back to the original timeline.
+    """
+    original_bytes = s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    url = s3_client.generate_presigned_url("get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=3600)
+
+    with span("audio_decode"):
+        samples = decode_audio(url)
+    if len(samples) == 0:
+        raise AudioPreprocessingError(f"s3://{bucket}/{key} has no audio")
+    original_seconds = len(samples) / SAMPLE_RATE
+    with span("audio_vad"):
+        regions = detect_speech(samples, **vad_options)
+        reduced = trim(samples, regions)
+    del samples
+    with span("audio_encode"):
+        flac = encode_flac(reduced)
+
+    processed_key = derived_key(key, ".preprocessed.flac")
+    with span("s3_upload", service="s3"):
+        s3_client.put_object(Bucket=bucket, Key=processed_key, Body=flac, ContentType="audio/flac")
+    count("bytes_uploaded", len(flac), service="s3")
+
+    time_map = TimeMap.from_regions(regions)
+    processed = PreprocessedAudio(f"s3://{bucket}/{processed_key}", time_map, original_seconds,
+                                  len(reduced) / SAMPLE_RATE, original_bytes, len(flac))
+    logger.info(f"preprocess_s3_audio: s3://{bucket}/{key} {original_bytes} bytes -> {processed.uri} {len(flac)} bytes, "
+                f"{processed.processed_seconds:.1f} seconds kept in {len(regions)} regions")
+    return processed
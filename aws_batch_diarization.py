@@ -0,0 +1,96 @@
+import fnmatch
+import json
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional, Type
+from pydantic import BaseModel, Field
+from superagi.lib.logger import logger
+from aws_diarization import AWSDiarizationTool, DiarizationError
+from aws_helpers import configure_tracing, ensure_path, get_aws_client, is_derived_key
+
+GLOB_CHARACTERS = "*?["
+
+class AWSBatchDiarizationSchema(BaseModel):
+    target_files: List[str] = Field(
+        ...,
+        description="Names of the target audio files.  Entries may be glob patterns such as calls/*.mp3",
+    )
+    max_concurrency: Optional[int] = Field(
+        None,
+        description="Maximum number of files transcribed at the same time.  Leave blank for the default.",
+    )
+    bypass_cache: Optional[bool] = Field(
+        False,
+        description="Always run new transcriptions, even for audio that was already transcribed",
+    )
+    preprocess_audio: Optional[bool] = Field(
+        False,
+        description="Cut long silences and downsample the audio before transcribing it",
+    )
+
+class AWSBatchDiarizationTool(AWSDiarizationTool):
+    name = "AWS Batch Diarization Tool"
+    description = (
+        "Tool that transcribes many audio files into raw text at once.  Handles multiple speakers.  "
+        "Returns a JSON manifest mapping each file to its transcript or error.")
+    args_schema: Type[AWSBatchDiarizationSchema] = AWSBatchDiarizationSchema
+
+    # Keep well under the account's Transcribe concurrent job quota
+    max_concurrent_jobs: int = 20
+
+    def _execute(self, target_files: List[str], max_concurrency: Optional[int] = None, bypass_cache: Optional[bool] = False,
+                 preprocess_audio: Optional[bool] = False):
+        configure_tracing()
+        try:
+            files = self.expand_target_files(target_files)
+            concurrency = max(1, min(max_concurrency or self.max_concurrent_jobs, self.max_concurrent_jobs, len(files) or 1))
+            logger.info(f"_execute: {len(files)} files, concurrency: {concurrency}")
+
+            results = {}
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {executor.submit(self.diarize, target_file, bypass_cache, "text", preprocess_audio): target_file for target_file in files}
+                for future in as_completed(futures):
+                    target_file = futures[future]
+                    try:
+                        value = future.result()
+                        results[target_file] = {"transcript": value["transcript_file"], "raw_transcript": value["transcript_uri"]}
+                        logger.info(f"_execute: finished {target_file} ({len(results)}/{len(files)})")
+                    except DiarizationError as err:
+                        logger.error(f"Error occured. {err}")
+                        results[target_file] = {"error": str(err)}
+
+            manifest = {target_file: results[target_file] for target_file in files}
+            return json.dumps(manifest, indent=2)
+        except:
+            logger.error(f"Error occured. target_files: {target_files}\n\n{traceback.format_exc()}")
+            return f"Error occured. target_files: {target_files} \n\n{traceback.format_exc()}"
+
+    def expand_target_files(self, target_files: List[str]) -> List[str]:
+        """
+        Expand glob patterns against the files in the S3 bucket, keeping the input order and
+        dropping duplicates.
+        """
+        files = []
+        for target_file in target_files:
+            if any(character in os.path.basename(target_file) for character in GLOB_CHARACTERS):
+                files.extend(self.glob_s3(target_file))
+            else:
+                files.append(target_file)
+        return list(dict.fromkeys(files))
+
+    def glob_s3(self, pattern: str) -> List[str]:
+        directory = os.path.dirname(pattern)
+        file_pattern = os.path.basename(pattern)
+        prefix = ensure_path(directory, True).rstrip("/") + "/"
+
+        matches = []
+        paginator = get_aws_client('s3', self.region_name).get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.s3_bucket_name, Prefix=prefix, Delimiter="/"):
+            for item in page.get("Contents", []):
+                file_name = item["Key"][len(prefix):]
+                # Skip the audio the tools derive for Transcribe, e.g. preprocessed copies
+                if fnmatch.fnmatch(file_name, file_pattern) and not is_derived_key(item["Key"]):
+                    matches.append(os.path.join(directory, file_name))
+        logger.info(f"glob_s3: {pattern} matched {len(matches)} files under {prefix}")
+        return sorted(matches)
@@ -0,0 +1,74 @@
+import hashlib
+import threading
+from typing import Optional
+
+
+DEFAULT_MAX_POOL_CONNECTIONS = 25
+
+_clients = {}
+_lock = threading.Lock()
+_max_pool_connections = DEFAULT_MAX_POOL_CONNECTIONS
+
+
+def set_max_pool_connections(max_pool_connections: int):
+    """
+    Set the connection pool size used for clients created from now on.
+    """
+    global _max_pool_connections
+    _max_pool_connections = max_pool_connections
+
+
+def _credentials_fingerprint(*values: Optional[str]) -> str:
+    # Keep secrets out of the registry keys
+    return hashlib.sha256("\0".join(value or "" for value in values).encode("utf-8")).hexdigest()
+
+
+def get_client(service_name: str, region_name: Optional[str] = None, aws_access_key_id: Optional[str] = None,
+               aws_secret_access_key: Optional[str] = None, aws_session_token: Optional[str] = None,
+               max_pool_connections: Optional[int] = None):
+    """
+    Return a process-wide boto3 client for the service, region and credentials.
+
+    Clients are created once and shared by every tool invocation and thread (boto3
+    clients are thread-safe, sessions are not, so each client gets its own session).
+    This avoids re-resolving endpoints and reloading botocore models on every call and
+    lets all callers share one connection pool per client.
+
+    :param service_name: e.g. 'transcribe', 'polly' or 's3'.
+    :param region_name: AWS region of the client.
+    :param aws_access_key_id: Access key, None for the default credential chain.
+    :param aws_secret_access_key: Secret key, None for the default credential chain.
+    :param aws_session_token: Session token for temporary credentials.
+    :param max_pool_connections: Connection pool size, defaults to the value of set_max_pool_connections.
+    :return: The shared client.
+    """
+    max_pool_connections = max_pool_connections or _max_pool_connections
+    key = (service_name, region_name, aws_access_key_id,
+           _credentials_fingerprint(aws_secret_access_key, aws_session_token), max_pool_connections)
+
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    # boto3 takes a while to import, only pay for it once a client is actually needed
+    import boto3
+    from botocore.config import Config
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            session = boto3.session.Session(aws_access_key_id=aws_access_key_id,
+                                            aws_secret_access_key=aws_secret_access_key,
+                                            aws_session_token=aws_session_token,
+                                            region_name=region_name)
+            client = session.client(service_name, config=Config(max_pool_connections=max_pool_connections))
+            _clients[key] = client
+    return client
+
+
+def clear_clients():
+    """
+    Drop every pooled client, e.g. after rotating credentials.
+    """
+    with _lock:
+        _clients.clear()
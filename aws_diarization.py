@@ -1,25 +1,77 @@
-import time
-import boto3
 import traceback
-from typing import Type, Optional
+import queue
+import threading
+from concurrent.futures import Future, wait as futures_wait
+from typing import TYPE_CHECKING, Callable, Iterator, List, Type, Optional
 from pydantic import BaseModel, Field
 from superagi.tools.base_tool import BaseTool
-from superagi.config.config import get_config
 from superagi.lib.logger import logger
 from superagi.resource_manager.file_manager import FileManager
 import random
 import string
 import json
-import json, datetime
-import io
 import os
-from aws_helpers import add_file_to_resources, get_file_content, handle_s3_path, transcribe_valid_characters, ensure_path
+from aws_helpers import add_file_to_resources, configure_tracing, delete_s3_objects, fetch_s3_object, handle_s3_path, is_derived_key, transcribe_valid_characters, ensure_path, write_file_lines, get_aws_client, get_object_size, get_state_path, split_s3_uri
+from aws_jobs import get_job_waiter
+from job_registry import COMPLETED, FAILED, JobRecord, JobRegistry, execution_key, get_job_registry
+from result_cache import ResultCache, cache_key, get_shared_cache
+from tracing import span, timed_iter
+from transcript_formatter import (FILE_EXTENSIONS, OUTPUT_FORMATS, convert_time_stamp, header_lines, index_items,
+                                  iter_transcript_json_lines, render_segment)
+
+if TYPE_CHECKING:
+    from audio_preprocessing import TimeMap
+    from long_audio import LongAudioPlan, TranscriptMerger
+    from transcript_model import ColumnarTranscript
+
+TRANSCRIPT_CACHE_FILE = "transcript_cache.sqlite"
+TRANSCRIPT_CACHE_MAX_ENTRIES = 10000
+TRANSCRIPT_CACHE_MAX_AGE = 30 * 24 * 3600
+
+
+def get_transcript_cache() -> ResultCache:
+    """
+    The process-wide transcript cache, keyed on the source audio fingerprint and the
+    transcription settings. Its index lives under the resources root.
+    """
+    return get_shared_cache(get_state_path(TRANSCRIPT_CACHE_FILE), max_entries=TRANSCRIPT_CACHE_MAX_ENTRIES,
+                            max_age=TRANSCRIPT_CACHE_MAX_AGE)
+
+class DiarizationError(Exception):
+    pass
+
+def parse_output_formats(output_format: Optional[str]) -> List[str]:
+    output_formats = [value.strip().lower() for value in (output_format or "text").split(",") if value.strip()]
+    for value in output_formats:
+        if value not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {value!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+    return list(dict.fromkeys(output_formats)) or ["text"]
 
 class AWSDiarizationSchema(BaseModel):
     target_file: str = Field(
         ...,
         description="Name of the target audio file.",
     )
+    bypass_cache: Optional[bool] = Field(
+        False,
+        description="Always run a new transcription, even if this audio was already transcribed",
+    )
+    output_format: Optional[str] = Field(
+        "text",
+        description="Comma separated transcript formats to write: text, srt, vtt, jsonl",
+    )
+    preprocess_audio: Optional[bool] = Field(
+        False,
+        description="Cut long silences and downsample the audio before transcribing it. Timestamps still refer to the original recording",
+    )
+    long_audio: Optional[bool] = Field(
+        False,
+        description="Split a long recording into chunks transcribed in parallel, for a much faster result",
+    )
+    progressive: Optional[bool] = Field(
+        False,
+        description="Append the transcript to a .partial file as parts of the recording are transcribed, so it can be read before the end. Implies long_audio",
+    )
 
 class AWSDiarizationTool(BaseTool):
     name = "AWS Diarization Tool"
@@ -33,75 +85,529 @@ class AWSDiarizationTool(BaseTool):
     s3_bucket_name = "neutralaiz-superagi-demo"
     region_name = 'us-east-1'
     job_name_prefix = "AWSDiarizationJob"
+    # Estimate of a job's duration, which schedules its status checks, see expected_job_seconds
+    min_expected_job_seconds: float = 10.0
+    job_seconds_per_audio_second: float = 0.3
+    # Bitrate assumed to estimate the length of the source audio from its size, 128 kbit/s
+    audio_bytes_per_second: float = 16000.0
+    job_timeout: Optional[float] = None
+    # Longest wait for a free slot when the job registry is at its concurrent job limit
+    job_slot_timeout: Optional[float] = 900.0
+    language_code = 'en-US'
+    max_speaker_labels: int = 3
+    # Silences longer than this are cut when preprocessing the audio
+    min_silence_seconds: float = 2.0
+    # Chunk length and overlap of long audio mode
+    long_audio_chunk_seconds: float = 900.0
+    long_audio_overlap_seconds: float = 20.0
     resource_manager: Optional[FileManager] = None
     
-    def _execute(self, target_file: str):
+    def _execute(self, target_file: str, bypass_cache: Optional[bool] = False, output_format: Optional[str] = "text",
+                 preprocess_audio: Optional[bool] = False, long_audio: Optional[bool] = False, progressive: Optional[bool] = False):
+        configure_tracing()
         try:
-            file_name = os.path.basename(target_file)
-            path = os.path.dirname(target_file)
-
-            unique_string = ''.join(random.choices(string.ascii_uppercase + string.ascii_lowercase + string.digits, k=6))
-            
-            path = ensure_path(path, True)
-            
-            logger.info(f"_execute: file_name: {file_name}, path: {path}")
-
-            job_name = transcribe_valid_characters(self.job_name_prefix + "_" + unique_string + "_" + file_name)
-            job_uri = "s3://" + self.s3_bucket_name + "/" + path + ("/" if not file_name.startswith("/") and not path.endswith("/") else "") + file_name
-            
-            logger.info(f"_execute: job_name: {job_name}, job_uri: {job_uri}")
-
-            aws_access_key_id = get_config("AWS_ACCESS_KEY_ID")
-            aws_secret_access_key = get_config("AWS_SECRET_ACCESS_KEY")   
-            
-            transcribe = boto3.client('transcribe', region_name=self.region_name, 
-                                      aws_access_key_id=aws_access_key_id,
-                                      aws_secret_access_key=aws_secret_access_key)
-
-            transcribe.start_transcription_job(
+            # The partial transcript resource is written as a side effect of progress
+            progress = (lambda lines: None) if progressive else None
+            return self.diarize(target_file, bypass_cache, output_format, preprocess_audio, long_audio, progress)["result"]
+        except DiarizationError as err:
+            logger.error(f"Error occured. {err}")
+            return f"Error occured. {err}"
+
+    def expected_job_seconds(self, audio_seconds: float) -> float:
+        """
+        Rough duration of a transcription job, used to schedule status checks: some seconds of
+        scheduling plus a fraction of the length of the audio.
+        """
+        return self.min_expected_job_seconds + self.job_seconds_per_audio_second * audio_seconds
+
+    def job_uri(self, path: str, file_name: str) -> str:
+        return "s3://" + self.s3_bucket_name + "/" + path + ("/" if not file_name.startswith("/") and not path.endswith("/") else "") + file_name
+
+    def diarize(self, target_file: str, bypass_cache: bool = False, output_format: str = "text",
+                preprocess_audio: bool = False, long_audio: bool = False,
+                progress: Optional[Callable[[List[str]], None]] = None) -> dict:
+        """
+        Transcribe one audio file, or reuse its cached transcript.
+
+        :param progress: Called with the lines of the text transcript as they become available,
+            see transcribe. Implies long_audio. On a cache hit it gets every line at once, and
+            they are written to the ``.partial`` resource in one go.
+
+        A cache hit may come from another file or agent execution with the same audio, so its
+        transcript is copied next to target_file and formatted again there, see reuse_transcript.
+        :return: The transcript_uri of the raw Transcribe output, the formatted transcript_files
+            (transcript_file being the first of them) and the result message of writing them.
+        :raises DiarizationError: With the URI, path and traceback of the failure.
+        """
+        file_name = os.path.basename(target_file)
+        path = os.path.dirname(target_file)
+        job_uri = None
+        long_audio = long_audio or progress is not None
+        try:
+            with span("diarize", service="transcribe") as diarize_span:
+                path = ensure_path(path, True)
+
+                logger.info(f"diarize: file_name: {file_name}, path: {path}")
+
+                job_uri = self.job_uri(path, file_name)
+                output_formats = parse_output_formats(output_format)
+
+                if bypass_cache:
+                    return self.transcribe(job_uri, path, file_name, output_formats, preprocess_audio, long_audio,
+                                           reuse_completed=False, progress=progress)
+
+                cache = get_transcript_cache()
+                key = cache_key(self.source_fingerprint(job_uri), self.language_code, self.transcription_settings(),
+                                output_formats, *self.audio_options(preprocess_audio, long_audio))
+                value, hit = cache.get_or_compute(
+                    key, lambda: self.transcribe_for_cache(job_uri, path, file_name, output_formats, preprocess_audio, long_audio, progress),
+                    validate=lambda cached: get_object_size(cached["transcript_uri"], self.region_name) is not None)
+                logger.info(f"diarize: transcript cache {'hit' if hit else 'miss'} for {job_uri}, stats: {cache.stats()}")
+                diarize_span.set(cached=hit)
+
+                if hit:
+                    return self.reuse_transcript(value, path, file_name, output_formats, progress)
+                return value
+        except:
+            raise DiarizationError(f"URI: {job_uri} Path: {path}, file_name: {file_name} \n\n{traceback.format_exc()}")
+
+    def reuse_transcript(self, value: dict, path: str, file_name: str, output_formats: List[str],
+                         progress: Optional[Callable[[List[str]], None]] = None) -> dict:
+        """
+        Give this request its own copy of a cached transcription: the raw Transcribe output is
+        copied server-side under path, and the transcripts are formatted from it and written as
+        resources of this agent execution, named like a fresh transcription's.
+
+        :return: Like transcribe.
+        """
+        job_name, processed_data_filename = self.output_names(path, file_name)
+        bucket, key = split_s3_uri(value["transcript_uri"])
+        copy_key = path + ("/" if not path.endswith("/") else "") + job_name + ".json"
+        with span("s3_copy", service="s3"):
+            get_aws_client('s3', self.region_name).copy_object(Bucket=self.s3_bucket_name, Key=copy_key,
+                                                               CopySource={"Bucket": bucket, "Key": key})
+        transcript_uri = f"https://s3.{self.region_name}.amazonaws.com/{self.s3_bucket_name}/{copy_key}"
+        time_map = self.load_time_map(value.get("time_map"))
+
+        if progress is not None:
+            lines = list(self.process_to_lines(fetch_s3_object(transcript_uri, self.region_name), time_map=time_map))
+            write_file_lines(self.resource_manager, processed_data_filename + ".partial", lines)
+            progress(lines)
+
+        transcript_files, results = self.write_transcripts(self.get_transcript(transcript_uri), processed_data_filename,
+                                                           output_formats, time_map)
+        return {"transcript_uri": transcript_uri,
+                "transcript_file": transcript_files[0],
+                "transcript_files": transcript_files,
+                "result": "\n".join(results),
+                "time_map": value.get("time_map")}
+
+    def output_names(self, path: str, file_name: str):
+        """
+        A new job name for file_name, and the name under path its transcripts are written to.
+        """
+        unique_string = ''.join(random.choices(string.ascii_uppercase + string.ascii_lowercase + string.digits, k=6))
+        job_name = transcribe_valid_characters(self.job_name_prefix + "_" + unique_string + "_" + file_name)
+        processed_data_filename = transcribe_valid_characters(self.job_name_prefix + "_" + unique_string + "_" + "transcript" + "_" + file_name)
+        processed_data_filename = path + ("/" if not processed_data_filename.startswith("/") and not path.endswith("/") else "") + processed_data_filename
+        return job_name, processed_data_filename
+
+    def transcription_settings(self) -> dict:
+        return {"ShowSpeakerLabels": True, "MaxSpeakerLabels": self.max_speaker_labels}
+
+    def audio_options(self, preprocess_audio: bool, long_audio: bool) -> List[dict]:
+        """
+        Settings of the optional audio handling that change the transcript, for cache keys.
+        """
+        options = []
+        if preprocess_audio:
+            options.append({"preprocess_audio": {"min_silence_seconds": self.min_silence_seconds}})
+        if long_audio:
+            options.append({"long_audio": {"chunk_seconds": self.long_audio_chunk_seconds,
+                                           "overlap_seconds": self.long_audio_overlap_seconds}})
+        return options
+
+    def source_fingerprint(self, job_uri: str) -> dict:
+        """
+        Identify the content of the source audio object by its ETag, size and version.
+        """
+        bucket, key = split_s3_uri(job_uri)
+        head = get_aws_client('s3', self.region_name).head_object(Bucket=bucket, Key=key)
+        return {"ETag": head.get("ETag"), "ContentLength": head.get("ContentLength"), "VersionId": head.get("VersionId")}
+
+    def transcribe(self, job_uri: str, path: str, file_name: str, output_formats: List[str] = ("text",),
+                   preprocess_audio: bool = False, long_audio: bool = False, reuse_completed: bool = True,
+                   progress: Optional[Callable[[List[str]], None]] = None) -> dict:
+        """
+        Run a transcription job on the audio at job_uri and write the formatted transcripts next to it.
+
+        With preprocess_audio the job runs on a silence-trimmed mono 16 kHz copy of the audio, and
+        the formatted transcripts are mapped back to the original timeline. The raw Transcribe
+        output keeps the times of the trimmed copy.
+
+        With long_audio the recording is transcribed in parallel chunks, see submit_chunks. The
+        lines of the text transcript whose chunks are done are then passed to progress, if given,
+        and appended to a ``.partial`` resource next to the transcripts as they arrive.
+
+        Jobs go through the job registry: a retry in the same agent execution re-attaches to the
+        job submitted for the same audio and settings (a completed one only with reuse_completed),
+        and submissions wait while the registry is at its concurrent job limit.
+
+        :return: The transcript_uri of the raw Transcribe output, the transcript_files written
+            (transcript_file being the first), the result message of the writes and the
+            time_map of cut silences (as a dict, or None).
+        """
+        job_name, processed_data_filename = self.output_names(path, file_name)
+
+        logger.info(f"transcribe: job_name: {job_name}, job_uri: {job_uri}")
+
+        registry = get_job_registry()
+        source = self.source_fingerprint(job_uri)
+        fingerprint = cache_key(job_uri, source, self.language_code, self.transcription_settings(),
+                                *self.audio_options(preprocess_audio, long_audio))
+        inputs = {"job_uri": job_uri, "path": path, "preprocess_audio": preprocess_audio, "long_audio": long_audio}
+        execution = execution_key(self.agent_id, self.agent_execution_id)
+        record = registry.find("transcription", execution, fingerprint, reuse_completed)
+        if record is None or record.job_id is None:
+            if long_audio:
+                # Split first, so the registry reserves a slot for every chunk job before any starts
+                plan = self.split_audio(job_uri, preprocess_audio)
+                submit, slots = (lambda: self.submit_chunks(plan, path, job_name)), len(plan.chunks)
+            else:
+                audio_seconds = (source.get("ContentLength") or 0) / self.audio_bytes_per_second
+                submit, slots = (lambda: self.submit_job(job_uri, path, job_name, preprocess_audio, audio_seconds)), 1
+            record, _ = registry.submit("transcription", execution, fingerprint, inputs, submit, reuse_completed,
+                                        timeout=self.job_slot_timeout, slots=slots)
+
+        if long_audio:
+            if progress is not None:
+                def on_lines(lines: List[str]):
+                    write_file_lines(self.resource_manager, processed_data_filename + ".partial", lines, append=True)
+                    progress(lines)
+            else:
+                on_lines = None
+            transcript_uri, raw_data, time_map = self.collect_chunks(registry, record, path, on_lines)
+        else:
+            transcript_uri, raw_data, time_map = self.collect_job(registry, record)
+
+        transcript_files, results = self.write_transcripts(raw_data, processed_data_filename, output_formats, time_map)
+        return {"transcript_uri": transcript_uri,
+                "transcript_file": transcript_files[0],
+                "transcript_files": transcript_files,
+                "result": "\n".join(results),
+                "time_map": time_map.to_dict() if time_map is not None else None}
+
+    def start_job(self, job_name: str, media_uri: str, path: str):
+        """
+        Start a transcription job writing its output under path.
+        """
+        with span("job_submit", service="transcribe"):
+            get_aws_client('transcribe', self.region_name).start_transcription_job(
                 TranscriptionJobName = job_name,
-                Media = {'MediaFileUri': job_uri},
+                Media = {'MediaFileUri': media_uri},
                 OutputBucketName = self.s3_bucket_name,
                 OutputKey = path,
-                LanguageCode = 'en-US', 
-                Settings = {"ShowSpeakerLabels": True, "MaxSpeakerLabels": 3}    
+                LanguageCode = self.language_code, 
+                Settings = self.transcription_settings()
             )
 
-            while True:
-                status = transcribe.get_transcription_job(TranscriptionJobName = job_name)
-                if status['TranscriptionJob']['TranscriptionJobStatus'] in ['COMPLETED', 'FAILED']:
-                    break
-                time.sleep(5)
+    def wait_job(self, job_name: str, expected_seconds: float) -> Future:
+        """
+        :return: Future resolved with the final get_transcription_job response.
+        """
+        return get_job_waiter().wait_transcription_job(get_aws_client('transcribe', self.region_name), job_name,
+                                                       max(expected_seconds, 0.0), self.job_timeout)
+
+    def submit_job(self, job_uri: str, path: str, job_name: str, preprocess_audio: bool = False,
+                   audio_seconds: float = 0.0):
+        """
+        Preprocess the audio if asked and start a single transcription job on it.
 
-            raw_data = self.get_data(status)
-            processed_data = self.process_to_text(raw_data)
+        :param audio_seconds: Estimated length of the audio, for expected_job_seconds.
+        :return: The job name and what collect_job needs to finish it, for the job registry.
+        """
+        media_uri, time_map = job_uri, None
+        if preprocess_audio:
+            from audio_preprocessing import preprocess_s3_audio
+            bucket, key = split_s3_uri(job_uri)
+            preprocessed = preprocess_s3_audio(get_aws_client('s3', self.region_name), bucket, key,
+                                               min_silence_seconds=self.min_silence_seconds)
+            media_uri, time_map = preprocessed.uri, preprocessed.time_map
+            audio_seconds = preprocessed.processed_seconds
 
-            processed_data_filename = transcribe_valid_characters(self.job_name_prefix + "_" + unique_string + "_" + "transcript" + "_" + file_name)
-            processed_data_filename = self.resource_manager.write_file(path + ("/" if not processed_data_filename.startswith("/") and not path.endswith("/") else "") + processed_data_filename, processed_data)
+        self.start_job(job_name, media_uri, path)
+        return job_name, {"media_uri": media_uri, "time_map": time_map.to_dict() if time_map is not None else None,
+                          "expected_seconds": self.expected_job_seconds(audio_seconds)}
 
-            return processed_data_filename
-        except:
-            logger.error(f"Error occured. URI: {job_uri}, Path: {path}, file_name: {file_name}\n\n{traceback.format_exc()}")
-            return f"Error occured. URI: {job_uri} Path: {path}, file_name: {file_name} \n\n{traceback.format_exc()}"
+    def collect_job(self, registry: JobRegistry, record: JobRecord):
+        """
+        Wait for a job of submit_job, unless it already completed, and record its result.
+
+        :return: The URI of the raw Transcribe output, its JSON (see get_data) and the TimeMap of cut silences (or None).
+        """
+        time_map = self.load_time_map(record.output.get("time_map"))
+
+        if record.status == COMPLETED:
+            return record.output["transcript_uri"], self.get_transcript(record.output["transcript_uri"]), time_map
+
+        try:
+            expected_seconds = record.output.get("expected_seconds", self.min_expected_job_seconds)
+            status = self.wait_job(record.job_id, expected_seconds - record.age).result()
+        except BaseException:
+            # The job may still be running, keep it for a retry without holding its slot
+            registry.release(record)
+            raise
+        job = status['TranscriptionJob']
+        if record.output.get("media_uri"):
+            # The preprocessed audio is not needed any more once the job ended
+            self.delete_derived_audio([record.output["media_uri"]])
+        if job['TranscriptionJobStatus'].upper() != COMPLETED:
+            registry.finish(record, FAILED)
+            raise DiarizationError(f"Transcription job {record.job_id} failed: {job.get('FailureReason')}")
+        registry.finish(record, COMPLETED, {"transcript_uri": job['Transcript']['TranscriptFileUri']})
+        return job['Transcript']['TranscriptFileUri'], self.get_data(status), time_map
+
+    def split_audio(self, job_uri: str, preprocess_audio: bool = False) -> "LongAudioPlan":
+        """
+        Split a long recording into overlapping chunks cut at quiet points, uploaded to the
+        derived audio folder next to it.
+        """
+        from long_audio import split_s3_audio
+
+        bucket, key = split_s3_uri(job_uri)
+        return split_s3_audio(get_aws_client('s3', self.region_name), bucket, key, self.long_audio_chunk_seconds,
+                              self.long_audio_overlap_seconds, trim_silence=preprocess_audio,
+                              min_silence_seconds=self.min_silence_seconds)
+
+    def submit_chunks(self, plan: "LongAudioPlan", path: str, job_name: str):
+        """
+        Start a transcription job on every chunk of split_audio at once.
+
+        :return: job_name, which names the merged output, and the chunk plan and jobs, for the job registry.
+        """
+        chunk_jobs = [transcribe_valid_characters(f"{job_name}_part{index:03d}") for index in range(len(plan.chunks))]
+        for chunk_job, chunk in zip(chunk_jobs, plan.chunks):
+            self.start_job(chunk_job, chunk.uri, path)
+        return job_name, {"plan": plan.to_dict(), "chunk_jobs": chunk_jobs}
+
+    def collect_chunks(self, registry: JobRegistry, record: JobRecord, path: str,
+                       progress: Optional[Callable[[List[str]], None]] = None):
+        """
+        Wait for the chunk jobs of submit_chunks and merge their outputs into one (see
+        long_audio.TranscriptMerger), unless that was already done.
+
+        Chunks are merged in order as they complete. After each one, the text transcript lines of
+        the segments no later chunk can change are passed to progress, the header with the first.
+
+        The merged output is uploaded where a single job would have written its output, and
+        registered as a resource in its place.
+
+        :return: The merged output's URI, its JSON and the TimeMap of cut silences (or None).
+        """
+        from long_audio import LongAudioPlan, TranscriptMerger
+
+        plan = LongAudioPlan.from_dict(record.output["plan"])
+        if record.status == COMPLETED:
+            data = self.get_transcript(record.output["transcript_uri"])
+            if progress is not None:
+                data = data.read() if hasattr(data, "read") else data
+                progress(list(self.process_to_lines(data, time_map=plan.time_map)))
+            return record.output["transcript_uri"], data, plan.time_map
+
+        jobs = [self.wait_job(chunk_job, self.expected_job_seconds(chunk.end - chunk.start) - record.age)
+                for chunk_job, chunk in zip(record.output["chunk_jobs"], plan.chunks)]
+        merger = TranscriptMerger(plan)
+        index = {}
+        lines = list(header_lines(record.job_id))
+        failed = False
+        try:
+            for future in jobs:
+                job = future.result()['TranscriptionJob']
+                if job['TranscriptionJobStatus'].upper() != COMPLETED:
+                    failed = True
+                    raise DiarizationError(f"Transcription job {job['TranscriptionJobName']} failed: {job.get('FailureReason')}")
+                data = fetch_s3_object(job['Transcript']['TranscriptFileUri'], self.region_name)
+                with span("transcript_parse"):
+                    transcript = json.load(data) if hasattr(data, "read") else json.loads(data)
+                with span("transcript_merge"):
+                    merger.add(transcript)
+                # Chunk jobs that finished stop taking a slot, even if an earlier one is still running
+                registry.update(record, slots=sum(not other.done() for other in jobs))
+                if progress is not None:
+                    lines.extend(self.render_settled(merger, index, plan.time_map))
+                    if lines:
+                        progress(lines)
+                        lines = []
+        except BaseException:
+            # The other chunk jobs keep running on AWS, so their slots stay taken until they end
+            futures_wait(jobs)
+            if failed:
+                self.delete_derived_audio([chunk.uri for chunk in plan.chunks])
+                registry.finish(record, FAILED)
+            else:
+                registry.release(record)
+            raise
+
+        merged = json.dumps(merger.result(record.job_id)).encode("utf-8")
+        merged_key = path + ("/" if not path.endswith("/") else "") + record.job_id + ".json"
+        with span("s3_upload", service="s3"):
+            get_aws_client('s3', self.region_name).put_object(Bucket=self.s3_bucket_name, Key=merged_key, Body=merged,
+                                                               ContentType="application/json")
+        transcript_uri = f"https://s3.{self.region_name}.amazonaws.com/{self.s3_bucket_name}/{merged_key}"
+        logger.info(f"collect_chunks: merged {len(plan.chunks)} chunks into {transcript_uri}")
+        registry.finish(record, COMPLETED, {"transcript_uri": transcript_uri})
+        self.delete_derived_audio([chunk.uri for chunk in plan.chunks])
+
+        add_file_to_resources(self.toolkit_config.session, handle_s3_path(transcript_uri), self.agent_id, self.agent_execution_id)
+        return transcript_uri, merged, plan.time_map
+
+    def delete_derived_audio(self, uris: List[str]):
+        """
+        Delete the preprocessed or chunk audio made for jobs that have ended. Anything outside
+        the derived audio folder, such as the source itself, is left alone.
+        """
+        uris = [uri for uri in uris if is_derived_key(split_s3_uri(uri)[1])]
+        if uris:
+            delete_s3_objects(get_aws_client('s3', self.region_name), uris)
+
+    def render_settled(self, merger: "TranscriptMerger", index: dict, time_map: Optional["TimeMap"] = None,
+                       threshold_for_grey: float = 0.96) -> List[str]:
+        """
+        Format the segments of merger that became final since the last call, as lines of the
+        text transcript (see TranscriptMerger.take_settled).
+
+        :param index: Word index of the items merged so far (see transcript_formatter.index_items),
+            updated in place.
+        """
+        items, segments = merger.take_settled()
+        index.update(index_items(items))
+        return [render_segment(segment, index, threshold_for_grey, self.time_stamp(time_map)) for segment in segments]
+
+    def diarize_progressive(self, target_file: str, bypass_cache: bool = False, output_format: str = "text",
+                            preprocess_audio: bool = False) -> Iterator[str]:
+        """
+        Diarize in long audio mode and yield the lines of the text transcript as soon as the
+        chunks they come from are transcribed, instead of only once the whole recording is.
+
+        diarize runs in a background thread. The lines also go to the ``.partial`` resource,
+        and the transcripts are written as usual at the end.
+
+        :return: Iterator over the lines, header first. Its return value is the result of diarize.
+        :raises DiarizationError: Like diarize, after the lines produced before the failure.
+        """
+        batches = queue.Queue()
+
+        def run():
+            try:
+                batches.put(("done", self.diarize(target_file, bypass_cache, output_format, preprocess_audio,
+                                                  True, lambda lines: batches.put(("lines", lines)))))
+            except BaseException as err:
+                batches.put(("error", err))
+
+        threading.Thread(target=run, name="diarize-progressive", daemon=True).start()
+        while True:
+            kind, value = batches.get()
+            if kind == "lines":
+                yield from value
+            elif kind == "error":
+                raise value
+            else:
+                return value
+
+    def write_transcripts(self, raw_data, processed_data_filename: str, output_formats: List[str],
+                          time_map: Optional["TimeMap"] = None):
+        """
+        Format the Transcribe JSON in every output format and write each as a resource.
+
+        :return: The transcript files written and the result message of each write.
+        """
+        try:
+            if list(output_formats) == ["text"]:
+                # Parsing and formatting are interleaved when streaming, so they share one span
+                lines = timed_iter("transcript_format", self.process_to_lines(raw_data, time_map=time_map), format="text")
+                return [processed_data_filename], [write_file_lines(self.resource_manager, processed_data_filename, lines)]
+            # Parse once into the columnar model and render every format from it
+            with span("transcript_parse"):
+                model = self.process_to_model(raw_data, time_map)
+        finally:
+            if hasattr(raw_data, "close"):
+                raw_data.close()
+
+        transcript_files = [processed_data_filename + FILE_EXTENSIONS[output_format] for output_format in output_formats]
+        results = [write_file_lines(self.resource_manager, transcript_file,
+                                    timed_iter("transcript_format", model.render(output_format, time_stamp=self.convert_time_stamp), format=output_format))
+                   for transcript_file, output_format in zip(transcript_files, output_formats)]
+        return transcript_files, results
+
+    def transcribe_for_cache(self, job_uri: str, path: str, file_name: str, output_formats: List[str],
+                             preprocess_audio: bool = False, long_audio: bool = False,
+                             progress: Optional[Callable[[List[str]], None]] = None):
+        value = self.transcribe(job_uri, path, file_name, output_formats, preprocess_audio, long_audio, progress=progress)
+        return value, get_object_size(value["transcript_uri"], self.region_name) or 0
         
     def get_data(self, data):
-        try:
-            transcript_url = data['TranscriptionJob']['Transcript']['TranscriptFileUri']
-            file_path = handle_s3_path(transcript_url)
-            logger.error(f"get_data - transcript_url: {transcript_url}, file_path: {file_path}")
-            resource = add_file_to_resources(self.toolkit_config.session, file_path, self.agent_id, self.agent_execution_id)
-            file_content = get_file_content(self.toolkit_config.session, resource.name, self.agent_id, self.agent_execution_id)
-        except:
-            logger.error(f"Error occured. file_path: {file_path}, transcript_url: {transcript_url}")
+        """
+        Register the raw transcribe output of a get_transcription_job response as a resource
+        and fetch it straight from S3.
+
+        :return: The JSON as bytes, or as a binary stream for large transcripts.
+        """
+        return self.get_transcript(data['TranscriptionJob']['Transcript']['TranscriptFileUri'])
 
+    def get_transcript(self, transcript_url: str):
+        """
+        Register the raw transcribe output at transcript_url as a resource and fetch it, see get_data.
+        """
+        file_path = handle_s3_path(transcript_url)
+        logger.info(f"get_transcript - transcript_url: {transcript_url}, file_path: {file_path}")
+        add_file_to_resources(self.toolkit_config.session, file_path, self.agent_id, self.agent_execution_id)
+        return fetch_s3_object(transcript_url, self.region_name)
 
     def convert_time_stamp(self, timestamp: str) -> str:
         """
         Function to help convert timestamps from s to H:M:S
         """
-        delta = datetime.timedelta(seconds=float(timestamp))
-        seconds = delta - datetime.timedelta(microseconds=delta.microseconds)
-        return str(seconds)
+        return convert_time_stamp(timestamp)
+
+    def process_to_lines(self, data, threshold_for_grey: float = 0.96, time_map: Optional["TimeMap"] = None) -> Iterator[str]:
+        """
+        Streaming version of process_to_text. Parses the transcribe JSON incrementally
+        and yields the formatted transcript line by line, so the caller can write it out
+        without holding the whole document or the whole text in memory.
+
+        :param data: JSON data as a string, bytes or binary file-like object
+        :param threshold_for_grey: Confidence level below which transcriptions are uncertain.
+        :param time_map: Maps the times of preprocessed audio back to the original recording.
+        :return: Iterator over the lines of the formatted transcription
+        """
+        return iter_transcript_json_lines(data, threshold_for_grey, self.time_stamp(time_map))
+
+    def time_stamp(self, time_map: Optional["TimeMap"] = None) -> Callable[[str], str]:
+        """
+        Timestamp formatter of the text transcript, mapping preprocessed times back to the original recording.
+        """
+        if time_map is None:
+            return self.convert_time_stamp
+        return lambda timestamp: self.convert_time_stamp(time_map(float(timestamp)))
+
+    @staticmethod
+    def load_time_map(data: Optional[dict]) -> Optional["TimeMap"]:
+        if not data:
+            return None
+        from audio_preprocessing import TimeMap
+        return TimeMap.from_dict(data)
+
+    def process_to_model(self, data, time_map: Optional["TimeMap"] = None) -> "ColumnarTranscript":
+        """
+        Parse transcribe JSON (string, bytes or binary file-like object) into the columnar
+        transcript model, which renders text, SRT, WebVTT and JSON lines.
+        """
+        # numpy is only needed for the subtitle and JSON lines formats
+        from transcript_model import ColumnarTranscript
+        model = ColumnarTranscript.from_json(data)
+        if time_map is not None:
+            model.remap_times(time_map)
+        return model
 
     def process_to_text(self, data: str, threshold_for_grey: float = 0.96) -> str:
         """
@@ -110,101 +616,11 @@ class AWSDiarizationTool(BaseTool):
         It applies formatting to highlight low-confidence areas.
         It also ensures punctuations and words are kept together without unwanted space.
 
+        Items are indexed once by (start_time, end_time), so formatting is linear in the
+        size of the transcript.
+
         :param data: JSON data as a string 
         :param threshold_for_grey: Confidence level below which transcriptions are uncertain.
         :return: Transcription formatted as a text string
         """
-        
-        # Parse json from string format
-        data = json.loads(data)
-
-        # Open a stringIO object to write the transcription into
-        with io.StringIO() as file:
-            
-            # Begin writing with job details and time of transcription
-            title = f"Transcription of {data['jobName']}"
-            file.write(f"{title}\n\n")
-            file.write("Transcription using AWS Transcribe automatic speech recognition and"
-                    " the 'tscribe' python package.\n")
-            file.write(datetime.datetime.now().strftime("Document produced on %A %d %B %Y at %X.\n\n"))
-
-            # Initialize boolean to track low confidence word sequences
-            low_confidence_open = False
-
-            # Check if there are speaker labels in the data
-            if "speaker_labels" in data["results"].keys():
-                
-                # For each speaker segment in the transcription labels
-                for segment in data["results"]["speaker_labels"]["segments"]:
-                    
-                    # If there are segment items (words)
-                    if len(segment["items"]) > 0:
-                        
-                        # Write the speaker name and start time
-                        file.write(f"{self.convert_time_stamp(segment['start_time'])} "
-                            f"{segment['speaker_label']}:")
-
-                        # For each word spoken by speaker
-                        for word in segment["items"]:
-                            
-                            # Filter for pronunciation words
-                            pronunciations = list(
-                                filter(
-                                    lambda x: x["type"] == "pronunciation",
-                                    data["results"]["items"],
-                                )
-                            )
-                            
-                            # Find the exact pronunciation item for current word
-                            word_result = list(
-                                filter(
-                                    lambda x: x["start_time"] == word["start_time"]
-                                    and x["end_time"] == word["end_time"],
-                                    pronunciations,
-                                )
-                            )
-                            
-                            # Get the alternative with highest confidence from word
-                            result = sorted(
-                                word_result[-1]["alternatives"], key=lambda x: x["confidence"]
-                            )[-1]
-
-                            # If the confidence level is lower than threshold, start a low-confidence sequence
-                            if float(result["confidence"]) < threshold_for_grey and not low_confidence_open:
-                                file.write(" [")
-                                low_confidence_open = True
-
-                            # Get the next item, check if it's punctuation to avoid space before it
-                            word_to_write = result['content'] + " "
-                            next_item = {}  
-                            try:
-                                word_result_index = data["results"]["items"].index(word_result[0])
-                                next_item = data["results"]["items"][word_result_index + 1]
-                                if next_item["type"] == "punctuation":
-                                    if next_item["alternatives"][0]["content"] in [".", "?", "!"]:
-                                        word_to_write = word_to_write.rstrip() + next_item["alternatives"][0]["content"] + "  " 
-                                    elif next_item["alternatives"][0]["content"] in [",", ";"]:
-                                        word_to_write = word_to_write.rstrip() + next_item["alternatives"][0]["content"] + " " 
-                                    else:
-                                        word_to_write += next_item["alternatives"][0]["content"]
-                            except IndexError:
-                                pass
-
-                            # If the word confidence is above threshold, finish a low-confidence sequence
-                            if float(result["confidence"]) >= threshold_for_grey and low_confidence_open:
-                                file.write(word_to_write.rstrip())  # Remove trailing space
-                                file.write("] ")  
-                                low_confidence_open = False
-                            else:
-                                file.write(word_to_write)
-
-                        # If there is an unclosed low-confidence sequence at the end of speaker segment, close it
-                        if low_confidence_open:
-                            file.write("] ")  
-                            low_confidence_open = False 
-
-                        # Add a new line after each speaker segment
-                        file.write("\n")  
-
-            # Get the resulting transcription string from the StringIO object
-            return file.getvalue()
\ No newline at end of file
+        return "".join(self.process_to_lines(data, threshold_for_grey))
\ No newline at end of file
@@ -1,14 +1,34 @@
 
+# Only light imports at module level: the toolkit is imported just to list its tools.
+# The SuperAGI models and helpers, unstructured and botocore are imported by the
+# functions that use them, on the first tool execution.
 from superagi.lib.logger import logger
-from superagi.helper.resource_helper import ResourceHelper
-from superagi.models.agent import Agent
-from superagi.models.agent_execution import AgentExecution
-from typing import Optional
+from typing import Iterable, Optional
+from io import BytesIO
+from contextlib import closing
 import os
-from unstructured.partition.auto import partition
-from superagi.helper.s3_helper import S3Helper
+from superagi.config.config import get_config
+from aws_clients import get_client, DEFAULT_MAX_POOL_CONNECTIONS
+from tracing import configure, count, span
+import threading
 import traceback
 import re
+import weakref
+
+_s3_helper = None
+_s3_helper_lock = threading.Lock()
+_session_locks = weakref.WeakKeyDictionary()
+_session_locks_lock = threading.Lock()
+_execution_contexts = weakref.WeakKeyDictionary()
+_tracing_configured = False
+
+# Objects up to this size are read into memory in one go, bigger ones are streamed
+STREAM_THRESHOLD = 16 << 20
+
+# Folder, next to the source audio, of the audio the tools derive from it for Transcribe
+DERIVED_FOLDER = "_derived"
+# Derived audio written next to the source by earlier versions
+_LEGACY_DERIVED_PATTERN = re.compile(r"\.(preprocessed|chunk\d{3})\.flac$")
 
 
 def handle_s3_path(filepath):
@@ -38,12 +58,13 @@ def ensure_path(filepath, account_for_s3: bool = True):    # pattern to match an
         filepath = ""
 
     try:
+        from superagi.helper.resource_helper import ResourceHelper
         root_path = ResourceHelper().get_root_output_dir() if not account_for_s3 else "resources" + ResourceHelper().get_root_output_dir()
 
         absolute_root = os.path.abspath(root_path)
         absolute_file = os.path.basename(filepath)
 
-        logger.info(f"ensure_path. absolute_root: {absolute_root}, absolute_file: {absolute_file}, root_path: {root_path}\n\n{traceback.format_exc()}")
+        logger.info(f"ensure_path. absolute_root: {absolute_root}, absolute_file: {absolute_file}, root_path: {root_path}")
         
         if absolute_file.startswith(absolute_root):
             return filepath
@@ -67,6 +88,159 @@ def transcribe_valid_characters(targetValue: str):
     logger.info(f"transcribe_valid_characters: cleaned:{cleaned}")
     return cleaned
 
+def session_lock(session):
+    """
+    Lock serializing the use of a DB session by tools running files in parallel threads,
+    since SQLAlchemy sessions are not thread-safe.
+    """
+    with _session_locks_lock:
+        lock = _session_locks.get(session)
+        if lock is None:
+            lock = _session_locks[session] = threading.RLock()
+    return lock
+
+def get_execution_context(session, agent_id: int, agent_execution_id: int):
+    """
+    Get the Agent and AgentExecution of a tool call, querying the DB only once per session and execution.
+    """
+    from superagi.models.agent import Agent
+    from superagi.models.agent_execution import AgentExecution
+
+    with session_lock(session):
+        contexts = _execution_contexts.setdefault(session, {})
+        context = contexts.get((agent_id, agent_execution_id))
+        if context is None:
+            context = contexts[(agent_id, agent_execution_id)] = (
+                Agent.get_agent_from_id(session, agent_id),
+                AgentExecution.get_agent_execution_from_id(session, agent_execution_id))
+        return context
+
+def fetch_s3_object(uri: str, region_name: str, stream_threshold: int = STREAM_THRESHOLD):
+    """
+    Read an S3 object straight into memory, without going through local files.
+
+    Args:
+        uri : s3:// or https:// URI of the object.
+        region_name : Region of the S3 client.
+        stream_threshold : Objects larger than this are returned as a stream.
+
+    Returns:
+        The content as bytes, or for large objects the binary file-like body to read incrementally.
+    """
+    bucket, key = split_s3_uri(uri)
+    s3_client = get_aws_client('s3', region_name)
+    with span("s3_fetch", service="s3") as fetch_span:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        logger.info(f"fetch_s3_object: s3://{bucket}/{key}, {response['ContentLength']} bytes")
+        count("bytes_downloaded", response["ContentLength"], service="s3")
+        if response["ContentLength"] > stream_threshold:
+            fetch_span.set(streamed=True)
+            return response["Body"]
+        with closing(response["Body"]) as body:
+            return body.read()
+
+def get_state_path(file_name: str) -> str:
+    """
+    Path of a file the tools keep for themselves (caches, registries) under the resources root.
+    """
+    from superagi.helper.resource_helper import ResourceHelper
+    directory = os.path.join(ResourceHelper.get_root_output_dir(), ".text_speech")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, file_name)
+
+def split_s3_uri(uri: str):
+    """
+    Split an s3:// or https:// S3 URI into (bucket, key).
+    """
+    parts = uri.split("/")
+    if uri.lower().startswith("s3"):
+        return parts[2], "/".join(parts[3:])
+    return parts[3], "/".join(parts[4:])
+
+def derived_key(key: str, suffix: str) -> str:
+    """
+    Key of audio derived from the object at key, in the DERIVED_FOLDER next to it:
+    ``calls/a.mp3`` with suffix ``.preprocessed.flac`` gives ``calls/_derived/a.preprocessed.flac``.
+    """
+    directory, file_name = os.path.split(key)
+    return "/".join(filter(None, (directory, DERIVED_FOLDER, os.path.splitext(file_name)[0] + suffix)))
+
+def is_derived_key(key: str) -> bool:
+    """
+    Whether key is audio the tools derived from a source file rather than a source file.
+    """
+    return DERIVED_FOLDER in key.split("/")[:-1] or bool(_LEGACY_DERIVED_PATTERN.search(key))
+
+def delete_s3_objects(s3_client, uris: Iterable[str]):
+    """
+    Delete S3 objects, e.g. derived audio once its transcription finished. Failures are
+    logged, not raised.
+    """
+    keys_by_bucket = {}
+    for uri in uris:
+        bucket, key = split_s3_uri(uri)
+        keys_by_bucket.setdefault(bucket, []).append(key)
+    for bucket, keys in keys_by_bucket.items():
+        # delete_objects takes at most 1000 keys
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            try:
+                with span("s3_delete", service="s3"):
+                    response = s3_client.delete_objects(
+                        Bucket=bucket, Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True})
+                for error in response.get("Errors", []):
+                    logger.warning(f"delete_s3_objects: s3://{bucket}/{error.get('Key')}: {error.get('Message')}")
+            except Exception as err:
+                logger.warning(f"delete_s3_objects: could not delete {len(batch)} objects from {bucket}: {err}")
+
+def get_object_size(uri: str, region_name: str) -> Optional[int]:
+    """
+    Size in bytes of the S3 object at uri, or None if it does not exist.
+    """
+    from botocore.exceptions import ClientError
+    bucket, key = split_s3_uri(uri)
+    try:
+        return get_aws_client('s3', region_name).head_object(Bucket=bucket, Key=key)["ContentLength"]
+    except ClientError as err:
+        if err.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+def get_aws_client(service_name: str, region_name: str):
+    """
+    Get the shared client for an AWS service, using the credentials from the SuperAGI config.
+
+    The pool size can be set with the AWS_MAX_POOL_CONNECTIONS config key.
+    """
+    with span("client_setup", service=service_name):
+        return get_client(service_name, region_name=region_name,
+                          aws_access_key_id=get_config("AWS_ACCESS_KEY_ID"),
+                          aws_secret_access_key=get_config("AWS_SECRET_ACCESS_KEY"),
+                          max_pool_connections=int(get_config("AWS_MAX_POOL_CONNECTIONS", DEFAULT_MAX_POOL_CONNECTIONS)))
+
+def configure_tracing():
+    """
+    Enable tracing from the SuperAGI config: when the TEXT_SPEECH_TRACE_FILE key is set, spans and
+    counters are appended to that file as JSON lines. The key is read once, and a sink set with
+    ``tracing.set_sink`` takes precedence.
+    """
+    global _tracing_configured
+    if not _tracing_configured:
+        _tracing_configured = True
+        configure(get_config("TEXT_SPEECH_TRACE_FILE"))
+
+def get_s3_helper():
+    """
+    Get the S3Helper shared by all reads instead of building a new one (and its client) each time.
+    """
+    global _s3_helper
+    if _s3_helper is None:
+        with _s3_helper_lock:
+            if _s3_helper is None:
+                from superagi.helper.s3_helper import S3Helper
+                _s3_helper = S3Helper()
+    return _s3_helper
+
 def get_file_content(session, file_name: str, agent_id: int, agent_execution_id: int):
     """
     Read the content of a file.
@@ -82,10 +256,9 @@ def get_file_content(session, file_name: str, agent_id: int, agent_execution_id:
     
     logger.info(f"get_file_content: file_name:{file_name}")
     try:
-        final_path = ResourceHelper.get_agent_read_resource_path(file_name, agent=Agent.get_agent_from_id(
-            session=session, agent_id=agent_id), agent_execution=AgentExecution
-                                                                .get_agent_execution_from_id(session=session,
-                                                                                            agent_execution_id=agent_execution_id))
+        from superagi.helper.resource_helper import ResourceHelper
+        agent, agent_execution = get_execution_context(session, agent_id, agent_execution_id)
+        final_path = ResourceHelper.get_agent_read_resource_path(file_name, agent=agent, agent_execution=agent_execution)
 
         temporary_file_path = None
         
@@ -94,11 +267,11 @@ def get_file_content(session, file_name: str, agent_id: int, agent_execution_id:
         file_extension = file_name.split('.')[-1].lower() if '.' in file_name else ''
         
         if file_extension in ("txt", "json"):
-            return S3Helper().read_from_s3(final_path)
+            return get_s3_helper().read_from_s3(final_path)
         else:
             temporary_file_path = final_path
             with open(temporary_file_path, "wb") as f:
-                contents = S3Helper().read_binary_from_s3(final_path)
+                contents = get_s3_helper().read_binary_from_s3(final_path)
                 f.write(contents)
 
         if final_path is None or not os.path.exists(final_path) and temporary_file_path is None:
@@ -111,6 +284,8 @@ def get_file_content(session, file_name: str, agent_id: int, agent_execution_id:
 
         logger.info(f"get_file_content: final_path:{final_path}")
 
+        # unstructured pulls in large document and NLP dependencies, only load it for documents that need it
+        from unstructured.partition.auto import partition
         elements = partition(final_path)
         content = "\n\n".join([str(el) for el in elements])
 
@@ -123,8 +298,102 @@ def get_file_content(session, file_name: str, agent_id: int, agent_execution_id:
         return {traceback.format_exc()}
 
 def add_file_to_resources(session, file_path, agent_id: int, agent_execution_id: int):
+    from superagi.helper.resource_helper import ResourceHelper
     file_name = os.path.basename(file_path)
     logger.info(f"add_file_to_resource: file_name: {file_name}  file_path:{file_path}")
-    agent = Agent.get_agent_from_id(session, agent_id)
-    agent_execution = AgentExecution.get_agent_execution_from_id(session, agent_execution_id)
-    return ResourceHelper.make_written_file_resource(file_name, agent, agent_execution, session)
\ No newline at end of file
+    with span("resource_register"):
+        agent, agent_execution = get_execution_context(session, agent_id, agent_execution_id)
+        with session_lock(session):
+            return ResourceHelper.make_written_file_resource(file_name, agent, agent_execution, session)
+
+def write_file_lines(resource_manager, file_name: str, lines: Iterable[str], buffer_size: int = 1 << 20,
+                     append: bool = False):
+    """
+    Write lines to a resource file as they are produced.
+
+    Works like ``FileManager.write_file`` but takes an iterable of lines instead of the whole
+    content, so memory stays bounded by ``buffer_size`` however long the output is.
+
+    Args:
+        resource_manager : The FileManager of the agent.
+        file_name : The name of the file to write.
+        lines : The lines to write, typically a generator.
+        buffer_size : Number of characters buffered before each write to disk.
+        append : Add the lines to the end of the file instead of replacing it. The whole file
+            is uploaded again, S3 objects cannot be appended to.
+
+    Returns:
+        The same status message as ``FileManager.write_file``.
+
+    The ``resource_write`` span includes the time spent producing the lines.
+    """
+    from superagi.helper.resource_helper import ResourceHelper
+    session = resource_manager.session
+    if resource_manager.agent_id is not None:
+        agent, agent_execution = get_execution_context(session, resource_manager.agent_id, resource_manager.agent_execution_id)
+        final_path = ResourceHelper.get_agent_write_resource_path(file_name, agent, agent_execution)
+    else:
+        final_path = ResourceHelper.get_resource_path(file_name)
+
+    initial_size = os.path.getsize(final_path) if append and os.path.exists(final_path) else 0
+    with span("resource_write"):
+        with open(final_path, mode="a" if append else "w", buffering=buffer_size) as file:
+            file.writelines(lines)
+        count("bytes_written", os.path.getsize(final_path) - initial_size)
+
+        with session_lock(session):
+            resource_manager.write_to_s3(file_name, final_path)
+    logger.info(f"{file_name} - File written successfully")
+    return f"{file_name} - File written successfully"
+
+def upload_stream_to_s3(s3_client, bucket: str, key: str, chunks: Iterable[bytes], part_size: int = 8 << 20,
+                        content_type: str = "application/octet-stream") -> int:
+    """
+    Upload a stream of byte chunks to S3 as a multipart upload, in order.
+
+    Only one part (at least 5 MiB, as S3 requires for every part but the last) is buffered
+    at a time. The upload is aborted if the stream or any part fails.
+
+    Args:
+        s3_client : A boto3 S3 client.
+        bucket : Destination bucket.
+        key : Destination key.
+        chunks : The content, in order.
+        part_size : Bytes buffered per uploaded part.
+        content_type : Content type stored with the object.
+
+    Returns:
+        The number of bytes uploaded.
+    """
+    part_size = max(part_size, 5 << 20)
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)["UploadId"]
+    parts = []
+    total = 0
+    buffer = BytesIO()
+
+    def upload_part():
+        with span("s3_upload", service="s3"):
+            response = s3_client.upload_part(Bucket=bucket, Key=key, UploadId=upload_id,
+                                             PartNumber=len(parts) + 1, Body=buffer.getvalue())
+        count("bytes_uploaded", buffer.tell(), service="s3")
+        parts.append({"ETag": response["ETag"], "PartNumber": len(parts) + 1})
+        buffer.seek(0)
+        buffer.truncate()
+
+    try:
+        for chunk in chunks:
+            buffer.write(chunk)
+            total += len(chunk)
+            if buffer.tell() >= part_size:
+                upload_part()
+        if buffer.tell() > 0 or not parts:
+            upload_part()
+        s3_client.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id,
+                                            MultipartUpload={"Parts": parts})
+    except:
+        logger.error(f"Error occured. Aborting multipart upload of s3://{bucket}/{key}\n\n{traceback.format_exc()}")
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+    logger.info(f"upload_stream_to_s3: uploaded {total} bytes to s3://{bucket}/{key} in {len(parts)} parts")
+    return total
\ No newline at end of file
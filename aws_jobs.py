@@ -0,0 +1,275 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from superagi.lib.logger import logger
+from tracing import count, record, span
+
+
+class JobKind:
+    """
+    How to check the status of one kind of AWS asynchronous job.
+
+    :param name: Name used in logs.
+    :param get_status: ``(client, job_id) -> record`` for a single job.
+    :param status_of: Extracts the status string from a record.
+    :param list_statuses: ``(client, job_ids) -> {job_id: record_or_None}`` for several jobs in one
+        call. A None record means the job is finished but its full record still has to be fetched
+        with ``get_status``. Jobs missing from the result are checked individually.
+    :param terminal_statuses: Upper case statuses after which the job no longer changes.
+    """
+
+    def __init__(self, name: str, get_status: Callable, status_of: Callable[[dict], str],
+                 list_statuses: Optional[Callable], terminal_statuses=("COMPLETED", "FAILED")):
+        self.name = name
+        self.get_status = get_status
+        self.status_of = status_of
+        self.list_statuses = list_statuses
+        self.terminal_statuses = terminal_statuses
+
+    def is_terminal(self, record: dict) -> bool:
+        return self.status_of(record).upper() in self.terminal_statuses
+
+
+def _list_transcription_jobs(client, job_names):
+    prefix = os.path.commonprefix(list(job_names))
+    kwargs = {"MaxResults": 100}
+    if prefix:
+        kwargs["JobNameContains"] = prefix
+    response = client.list_transcription_jobs(**kwargs)
+    wanted = set(job_names)
+    statuses = {}
+    for summary in response.get("TranscriptionJobSummaries", []):
+        job_name = summary["TranscriptionJobName"]
+        if job_name not in wanted:
+            continue
+        if summary["TranscriptionJobStatus"].upper() in ("COMPLETED", "FAILED"):
+            # The summary has no transcript location, fetch the full job once
+            statuses[job_name] = None
+        else:
+            statuses[job_name] = {"TranscriptionJob": summary}
+    return statuses
+
+
+def _list_synthesis_tasks(client, task_ids):
+    response = client.list_speech_synthesis_tasks(MaxResults=100)
+    wanted = set(task_ids)
+    return {task["TaskId"]: {"SynthesisTask": task}
+            for task in response.get("SynthesisTasks", []) if task["TaskId"] in wanted}
+
+
+TRANSCRIPTION_JOB = JobKind(
+    "transcription",
+    lambda client, job_name: client.get_transcription_job(TranscriptionJobName=job_name),
+    lambda record: record["TranscriptionJob"]["TranscriptionJobStatus"],
+    _list_transcription_jobs)
+
+SYNTHESIS_TASK = JobKind(
+    "speech synthesis",
+    lambda client, task_id: client.get_speech_synthesis_task(TaskId=task_id),
+    lambda record: record["SynthesisTask"]["TaskStatus"],
+    _list_synthesis_tasks)
+
+
+class _Job:
+    def __init__(self, kind: JobKind, client, job_id: str, expected_duration: float, timeout: Optional[float]):
+        self.kind = kind
+        self.client = client
+        self.job_id = job_id
+        self.expected_duration = expected_duration
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.overdue_polls = 0
+        self.errors = 0
+        self.polls = 0
+        self.future = Future()
+
+
+class JobWaiter:
+    """
+    Waits on many AWS asynchronous jobs from a single background thread.
+
+    Each job is checked on its own adaptive schedule: while the job is younger than its
+    expected duration the poller checks at half the remaining expected time, after that it
+    backs off exponentially from ``min_interval`` up to ``max_interval``. Every delay is
+    jittered by +/-20% so jobs submitted together do not poll in lockstep. When several
+    jobs of the same kind on the same client are due together, their statuses are fetched
+    with a single list call.
+
+    Waiting returns a ``concurrent.futures.Future`` resolved with the final
+    ``get_transcription_job`` / ``get_speech_synthesis_task`` response, so callers can block
+    on ``future.result()`` or await ``asyncio.wrap_future(future)``.
+
+    :param min_interval: Shortest delay between two checks of the same job, in seconds.
+    :param max_interval: Longest delay between two checks of the same job, in seconds.
+    :param batch_threshold: Minimum number of due jobs to use a list call instead of one get per job.
+    :param max_errors: Consecutive failed checks after which a job's future fails.
+    :param coalesce_window: Jobs due within this many seconds of a check are checked with it,
+        so their statuses can be fetched in the same batch.
+    """
+
+    def __init__(self, min_interval: float = 0.25, max_interval: float = 15.0, batch_threshold: int = 2,
+                 max_errors: int = 5, coalesce_window: float = 0.25):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.batch_threshold = batch_threshold
+        self.max_errors = max_errors
+        self.coalesce_window = coalesce_window
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def wait_transcription_job(self, client, job_name: str, expected_duration: float = 60.0,
+                               timeout: Optional[float] = None) -> Future:
+        return self.wait(TRANSCRIPTION_JOB, client, job_name, expected_duration, timeout)
+
+    def wait_synthesis_task(self, client, task_id: str, expected_duration: float = 5.0,
+                            timeout: Optional[float] = None) -> Future:
+        return self.wait(SYNTHESIS_TASK, client, task_id, expected_duration, timeout)
+
+    def wait(self, kind: JobKind, client, job_id: str, expected_duration: float,
+             timeout: Optional[float] = None) -> Future:
+        """
+        Start tracking a job.
+
+        :param kind: TRANSCRIPTION_JOB, SYNTHESIS_TASK or another JobKind.
+        :param client: The boto3 client the job was submitted with.
+        :param job_id: Transcription job name or synthesis task id.
+        :param expected_duration: Rough time the job needs, in seconds. Drives the poll schedule.
+        :param timeout: Seconds after which the future fails with TimeoutError, None to wait forever.
+        :return: Future resolved with the job's final status record.
+        """
+        job = _Job(kind, client, job_id, max(expected_duration, 0.0), timeout)
+        self._schedule(job, self._first_delay(job))
+        return job.future
+
+    def _first_delay(self, job: _Job) -> float:
+        return self._jitter(min(max(job.expected_duration / 2, self.min_interval), self.max_interval))
+
+    def _next_delay(self, job: _Job) -> float:
+        remaining = job.expected_duration - (time.monotonic() - job.started)
+        if remaining > 0:
+            delay = remaining / 2
+        else:
+            delay = self.min_interval * (1.5 ** job.overdue_polls)
+            job.overdue_polls += 1
+        return self._jitter(min(max(delay, self.min_interval), self.max_interval))
+
+    @staticmethod
+    def _jitter(delay: float) -> float:
+        return delay * random.uniform(0.8, 1.2)
+
+    def _schedule(self, job: _Job, delay: float):
+        due = time.monotonic() + delay
+        if job.timeout is not None:
+            due = min(due, job.started + job.timeout)
+        with self._condition:
+            heapq.heappush(self._heap, (due, next(self._sequence), job))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="aws-job-waiter", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._heap)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                due = self._heap[0][0]
+                now = time.monotonic()
+                if due > now:
+                    self._condition.wait(due - now)
+                    continue
+                ready = []
+                while self._heap and self._heap[0][0] <= now + self.coalesce_window:
+                    ready.append(heapq.heappop(self._heap)[2])
+            try:
+                self._check(ready)
+            except Exception as err:
+                logger.error(f"JobWaiter: status check failed: {err}")
+                for job in ready:
+                    if not job.future.done():
+                        job.future.set_exception(err)
+
+    def _check(self, jobs: List[_Job]):
+        groups: Dict[tuple, List[_Job]] = {}
+        for job in jobs:
+            if job.future.cancelled():
+                continue
+            groups.setdefault((job.kind.name, id(job.client)), []).append(job)
+
+        for group in groups.values():
+            records = {}
+            kind, client = group[0].kind, group[0].client
+            if kind.list_statuses is not None and len(group) >= self.batch_threshold:
+                try:
+                    with span("job_poll", kind=kind.name, batched=True, jobs=len(group)):
+                        records = kind.list_statuses(client, [job.job_id for job in group])
+                except Exception as err:
+                    logger.warning(f"JobWaiter: batched {kind.name} status check failed, checking jobs one by one: {err}")
+            for job in group:
+                self._check_job(job, records.get(job.job_id), job.job_id in records)
+
+    def _check_job(self, job: _Job, record: Optional[dict], listed: bool):
+        job.polls += 1
+        count("job_polls", kind=job.kind.name)
+        try:
+            if not listed or record is None:
+                with span("job_poll", kind=job.kind.name, batched=False):
+                    record = job.kind.get_status(job.client, job.job_id)
+            job.errors = 0
+        except Exception as err:
+            job.errors += 1
+            if job.errors >= self.max_errors:
+                self._record_wait(job, "ERROR")
+                job.future.set_exception(err)
+                return
+            logger.warning(f"JobWaiter: {job.kind.name} {job.job_id} status check failed ({job.errors}): {err}")
+            record = None
+
+        if record is not None and job.kind.is_terminal(record):
+            logger.info(f"JobWaiter: {job.kind.name} {job.job_id} finished with status "
+                        f"{job.kind.status_of(record)} after {job.polls} checks")
+            self._record_wait(job, job.kind.status_of(record).upper())
+            job.future.set_result(record)
+            return
+
+        if job.timeout is not None and time.monotonic() - job.started >= job.timeout:
+            status = job.kind.status_of(record) if record is not None else "UNKNOWN"
+            self._record_wait(job, "TIMEOUT")
+            job.future.set_exception(TimeoutError(
+                f"{job.kind.name} {job.job_id} still {status} after {job.timeout} seconds"))
+            return
+
+        self._schedule(job, self._next_delay(job))
+
+    @staticmethod
+    def _record_wait(job: _Job, status: str):
+        record("job_wait", time.monotonic() - job.started, kind=job.kind.name, status=status,
+               job_id=job.job_id, polls=job.polls)
+
+
+_waiter = None
+_waiter_lock = threading.Lock()
+
+
+def get_job_waiter() -> JobWaiter:
+    """
+    Return the process-wide JobWaiter shared by all tools.
+    """
+    global _waiter
+    if _waiter is None:
+        with _waiter_lock:
+            if _waiter is None:
+                _waiter = JobWaiter()
+    return _waiter
@@ -1,13 +1,34 @@
-import time
-import boto3
 import traceback
 import random
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from typing import Type, Optional
 from pydantic import BaseModel, Field
 from superagi.tools.base_tool import BaseTool
-from superagi.config.config import get_config
 from superagi.lib.logger import logger
-from aws_helpers import add_file_to_resources
+from aws_helpers import add_file_to_resources, configure_tracing, get_aws_client, get_object_size, get_state_path, split_s3_uri, upload_stream_to_s3
+from aws_jobs import get_job_waiter
+from job_registry import execution_key, get_job_registry
+from result_cache import ResultCache, cache_key, get_shared_cache
+from speech_chunking import DEFAULT_MAX_CHARACTERS, split_ssml, split_text
+from tracing import count, span
+
+SYNTHESIS_CACHE_FILE = "synthesis_cache.sqlite"
+SYNTHESIS_CACHE_MAX_ENTRIES = 10000
+SYNTHESIS_CACHE_MAX_BYTES = 5 << 30
+SYNTHESIS_CACHE_MAX_AGE = 30 * 24 * 3600
+
+
+
+def get_synthesis_cache() -> ResultCache:
+    """
+    The process-wide synthesis cache. Its index lives under the resources root, so every
+    worker sharing that directory shares cached audio.
+    """
+    return get_shared_cache(get_state_path(SYNTHESIS_CACHE_FILE), max_entries=SYNTHESIS_CACHE_MAX_ENTRIES,
+                            max_bytes=SYNTHESIS_CACHE_MAX_BYTES, max_age=SYNTHESIS_CACHE_MAX_AGE)
 
 class AWSTextToSpeechSchema(BaseModel):
     text: str = Field(
@@ -38,6 +59,14 @@ class AWSTextToSpeechSchema(BaseModel):
         False,
         description="Does the text contain SSML codes?"
     )
+    long_form: Optional[bool] = Field(
+        False,
+        description="Split long text (e.g. a whole document) into chunks synthesized in parallel"
+    )
+    bypass_cache: Optional[bool] = Field(
+        False,
+        description="Always synthesize, even if the same text was already synthesized with the same voice"
+    )
 
 class AWSTextToSpeechTool(BaseTool):
     name = "AWS Text To Speech Tool"
@@ -50,70 +79,284 @@ class AWSTextToSpeechTool(BaseTool):
     s3_bucket_name = "neutralaiz-superagi-demo"
     job_name_prefix = "AWSTextToSpeechJob"
     region_name = 'us-east-1'
+    task_timeout: Optional[float] = 120
+    # Longest wait for a free slot when the job registry is at its concurrent job limit
+    job_slot_timeout: Optional[float] = 900.0
+    # Longer text is always synthesized in long-form mode, Polly tasks accept up to 100,000 characters
+    max_task_characters: int = 100000
+    # Shorter text is synthesized synchronously, skipping the task and its status checks
+    max_sync_characters: int = DEFAULT_MAX_CHARACTERS
+    max_chunk_characters: int = DEFAULT_MAX_CHARACTERS
+    max_parallel_chunks: int = 4
 
     voices = {
         "Male": {"Adult": ["Joey", "Matthew"], "Child": ["Justin", "Kevin"]},
         "Female": {"Adult": ["Joanna", "Kendra","Kimberly","Salli"], "Child": ["Ivy", "Ruth"]}
     }
+
+    def expected_task_seconds(self, text: str) -> float:
+        """
+        Rough duration of a synthesis task, used to schedule status checks: a couple of
+        seconds of scheduling plus about a second per thousand characters.
+        """
+        return 2.0 + len(text) / 1000
     
-    def _execute(self, text: str, path: str, fileprefix: str, gender: Optional[str] = None, age: Optional[str] = None, voice: Optional[str] = None, ssml: Optional[bool] = False):
+    def choose_voice(self, gender: Optional[str] = None, age: Optional[str] = None, voice: Optional[str] = None) -> str:
+        if voice is None:
+            if gender and age:
+                assert gender in self.voices and age in self.voices[gender]
+                voice = random.choice(self.voices[gender][age])
+            else:
+                gender = random.choice(list(self.voices.keys()))
+                age = random.choice(list(self.voices[gender].keys()))
+                voice = random.choice(self.voices[gender][age])
+        return voice
+
+    @staticmethod
+    def voice_request(gender: Optional[str] = None, age: Optional[str] = None, voice: Optional[str] = None) -> str:
+        """
+        The requested voice, or the gender and age a random voice is picked from, for keys.
+        """
+        return voice or f"random:{gender}:{age}"
+
+    def _execute(self, text: str, path: str, fileprefix: str, gender: Optional[str] = None, age: Optional[str] = None, voice: Optional[str] = None, ssml: Optional[bool] = False, long_form: Optional[bool] = False, bypass_cache: Optional[bool] = False):
+        configure_tracing()
         try:
-            aws_access_key_id = get_config("AWS_ACCESS_KEY_ID")
-            aws_secret_access_key = get_config("AWS_SECRET_ACCESS_KEY")
-            
-            polly_client = boto3.Session(
-                aws_access_key_id=aws_access_key_id,                  
-                aws_secret_access_key=aws_secret_access_key,
-                region_name=self.region_name
-            ).client('polly')
-            
-            if voice is None:
-                if gender and age:
-                    assert gender in self.voices and age in self.voices[gender]
-                    voice = random.choice(self.voices[gender][age])
+            with span("synthesize", service="polly") as synthesize_span:
+                polly_client = get_aws_client('polly', self.region_name)
+
+                if bypass_cache:
+                    task_status = self.synthesize(polly_client, text, path, fileprefix, self.choose_voice(gender, age, voice), ssml, long_form,
+                                                  self.voice_request(gender, age, voice), reuse_completed=False)
                 else:
-                    gender = random.choice(list(self.voices.keys()))
-                    age = random.choice(list(self.voices[gender].keys()))
-                    voice = random.choice(self.voices[gender][age])
+                    task_status = self.cached_synthesize(polly_client, text, path, fileprefix, gender, age, voice, ssml, long_form)
+                synthesize_span.set(cached=task_status['SynthesisTask'].get('Cached', False))
+
+                # Extract file name from the S3 URL
+                audio_file_url = task_status['SynthesisTask']["OutputUri"]
+
+                # Pass this session to the Helper method
+                add_file_to_resources(self.toolkit_config.session, audio_file_url, self.agent_id, self.agent_execution_id)
+            logger.info(f"Text to Speech conversion completed! {audio_file_url}")
+
+            return task_status
+        except:
+            logger.error(f"Error occured.\n\n{traceback.format_exc()}")
+            return {traceback.format_exc()}
+
+    def cached_synthesize(self, polly_client, text: str, path: str, fileprefix: str, gender: Optional[str], age: Optional[str], voice: Optional[str], ssml: bool, long_form: bool) -> dict:
+        """
+        Synthesize through the synthesis cache.
+
+        The key covers the whitespace-normalized text, the requested voice (or the gender and
+        age a random voice is picked from), engine, output format and SSML flag. A hit skips
+        Polly and copies the existing S3 object to a new file under path and fileprefix, and
+        identical requests running at the same time share one synthesis.
+        """
+        cache = get_synthesis_cache()
+        key = cache_key(" ".join(text.split()), self.voice_request(gender, age, voice), "neural", "mp3", bool(ssml))
+        synthesized = {}
+
+        def compute():
+            task_status = self.synthesize(polly_client, text, path, fileprefix, self.choose_voice(gender, age, voice), ssml, long_form,
+                                          self.voice_request(gender, age, voice))
+            synthesized['task_status'] = task_status
+            output_uri = task_status['SynthesisTask']['OutputUri']
+            value = {"OutputUri": output_uri, "VoiceId": task_status['SynthesisTask']['VoiceId']}
+            return value, get_object_size(output_uri, self.region_name) or 0
+
+        value, hit = cache.get_or_compute(
+            key, compute, validate=lambda cached: get_object_size(cached["OutputUri"], self.region_name) is not None)
+        logger.info(f"cached_synthesize: {'hit' if hit else 'miss'}, stats: {cache.stats()}")
 
-            response = polly_client.start_speech_synthesis_task(
-                #TaskId=filename,
-                OutputS3KeyPrefix=path.strip('/') + "/" + fileprefix,
+        if 'task_status' in synthesized:
+            return synthesized['task_status']
+        return self.copy_cached(value, path, fileprefix, ssml, len(text))
+
+    def copy_cached(self, value: dict, path: str, fileprefix: str, ssml: bool, request_characters: int) -> dict:
+        """
+        Server-side copy of cached audio to where this request asked for it, shaped like
+        get_speech_synthesis_task's response.
+        """
+        bucket, key = split_s3_uri(value["OutputUri"])
+        output_key = self.output_key(path, fileprefix)
+        with span("s3_copy", service="s3"):
+            get_aws_client('s3', self.region_name).copy_object(
+                Bucket=self.s3_bucket_name, Key=output_key, CopySource={"Bucket": bucket, "Key": key})
+        return self.completed_task(output_key, value["VoiceId"], ssml, request_characters, Cached=True)
+
+    def synthesize(self, polly_client, text: str, path: str, fileprefix: str, voice: str, ssml: bool, long_form: bool,
+                   voice_request: Optional[str] = None, reuse_completed: bool = True) -> dict:
+        """
+        Synthesize the text to S3 with Polly, raising if the synthesis did not complete.
+
+        :param voice_request: See voice_request, identifies the request in the job registry when
+            the voice was picked at random. Defaults to voice.
+        :param reuse_completed: Let a retry re-attach to a completed task, see synthesize_task.
+        """
+        if long_form or len(text) > self.max_task_characters:
+            task_status = self.synthesize_long_form(polly_client, text, path, fileprefix, voice, ssml)
+        elif len(text) <= self.max_sync_characters:
+            task_status = self.synthesize_sync(polly_client, text, path, fileprefix, voice, ssml)
+        else:
+            task_status = self.synthesize_task(polly_client, text, path, fileprefix, voice, ssml, voice_request, reuse_completed)
+
+        if task_status['SynthesisTask']['TaskStatus'].upper() != 'COMPLETED':
+            raise Exception(f"Task failed with status: {task_status['SynthesisTask']['TaskStatus']}")
+        return task_status
+
+    def synthesize_task(self, polly_client, text: str, path: str, fileprefix: str, voice: str, ssml: bool,
+                        voice_request: Optional[str] = None, reuse_completed: bool = True) -> dict:
+        """
+        Synthesize the text with a single asynchronous Polly task writing straight to S3.
+
+        The task goes through the job registry: a retry in the same agent execution re-attaches
+        to the task submitted for the same text, voice and destination (a completed one only with
+        reuse_completed), and submissions wait while the registry is at its concurrent job limit.
+
+        Returns the final get_speech_synthesis_task response.
+        """
+        registry = get_job_registry()
+        fingerprint = cache_key(" ".join(text.split()), voice_request or voice, "neural", "mp3", bool(ssml),
+                                path.strip('/'), fileprefix)
+
+        def submit():
+            with span("job_submit", service="polly"):
+                response = polly_client.start_speech_synthesis_task(
+                    #TaskId=filename,
+                    OutputS3KeyPrefix=path.strip('/') + "/" + fileprefix,
+                    VoiceId=voice,
+                    OutputS3BucketName=self.s3_bucket_name,
+                    OutputFormat='mp3', 
+                    Text=text,
+                    Engine='neural',
+                    TextType='ssml' if ssml else 'text'
+                )
+            count("characters_synthesized", len(text), service="polly")
+            return response['SynthesisTask']['TaskId'], {"voice": voice}
+
+        record, attached = registry.submit(
+            "speech synthesis", execution_key(self.agent_id, self.agent_execution_id), fingerprint,
+            {"path": path, "fileprefix": fileprefix, "voice": voice, "characters": len(text)}, submit, reuse_completed,
+            timeout=self.job_slot_timeout)
+        taskId = record.job_id
+
+        try:
+            task_status = get_job_waiter().wait_synthesis_task(
+                polly_client, taskId, max(self.expected_task_seconds(text) - record.age, 0.0), self.task_timeout).result()
+        except TimeoutError:
+            logger.warning(f"synthesize_task: task {taskId} timed out after {self.task_timeout} seconds")
+            # The task may still finish, keep it for a retry without holding its slot
+            registry.release(record)
+            return polly_client.get_speech_synthesis_task(TaskId = taskId)
+        except BaseException:
+            registry.release(record)
+            raise
+
+        registry.finish(record, task_status['SynthesisTask']['TaskStatus'], {"OutputUri": task_status['SynthesisTask'].get('OutputUri')})
+        return task_status
+
+    def synthesize_sync(self, polly_client, text: str, path: str, fileprefix: str, voice: str, ssml: bool) -> dict:
+        """
+        Synthesize short text with a single synthesize_speech call, streaming the audio to S3
+        as it arrives instead of waiting for a task.
+
+        Returns a response shaped like get_speech_synthesis_task's.
+        """
+        key = self.output_key(path, fileprefix)
+        with span("speech_chunk", service="polly"):
+            response = polly_client.synthesize_speech(
                 VoiceId=voice,
-                OutputS3BucketName=self.s3_bucket_name,
-                OutputFormat='mp3', 
+                OutputFormat='mp3',
                 Text=text,
                 Engine='neural',
                 TextType='ssml' if ssml else 'text'
             )
+            count("characters_synthesized", response.get('RequestCharacters', 0), service="polly")
+            with closing(response['AudioStream']) as stream, span("s3_upload", service="s3"):
+                # Multipart only when the audio is large, without reading it all into memory
+                get_aws_client('s3', self.region_name).upload_fileobj(
+                    stream, self.s3_bucket_name, key, ExtraArgs={"ContentType": "audio/mpeg"},
+                    Callback=lambda sent: count("bytes_uploaded", sent, service="s3"))
 
-            taskId = response['SynthesisTask']['TaskId']
-            task_status = polly_client.get_speech_synthesis_task(TaskId = taskId)
+        logger.info(f"synthesize_sync: {len(text)} characters, voice: {voice}, key: {key}")
+        return self.completed_task(key, voice, ssml, response.get('RequestCharacters', 0))
 
-            start_time = time.time()  # get the current time
+    def synthesize_long_form(self, polly_client, text: str, path: str, fileprefix: str, voice: str, ssml: bool) -> dict:
+        """
+        Synthesize long text as chunks in parallel and stream the joined MP3 to S3.
 
-            while task_status['SynthesisTask']['TaskStatus'].upper() in ['INPROGRESS', 'SCHEDULED']:
-                if time.time() - start_time > 120:  # if more than 30 seconds have passed
-                    print("Operation timed out.")
-                    break
-                print("Text to Speech conversion in progress...")
-                time.sleep(5)
-                task_status = polly_client.get_speech_synthesis_task(TaskId = taskId)
+        The text is split at paragraph, sentence or <break> boundaries into chunks small enough
+        for synthesize_speech (SSML stays well-formed in every chunk). Up to max_parallel_chunks
+        chunks are synthesized at once with the same voice, and their MP3 frames are concatenated
+        in order into a single multipart upload.
 
-            if task_status['SynthesisTask']['TaskStatus'].upper() == 'COMPLETED':
-                print("Text to Speech conversion completed!")
-                
-                # Extract file name from the S3 URL
-                audio_file_url = task_status['SynthesisTask']["OutputUri"]
-                
-                # Pass this session to the Helper method
-                add_file_to_resources(self.toolkit_config.session, audio_file_url, self.agent_id, self.agent_execution_id)
-                print("Text to Speech conversion completed!")
+        Returns a response shaped like get_speech_synthesis_task's.
+        """
+        chunks = split_ssml(text, self.max_chunk_characters) if ssml else split_text(text, self.max_chunk_characters)
+        key = self.output_key(path, fileprefix)
+        request_characters = []
 
-            else:
-                raise Exception(f"Task failed with status: {task_status['SynthesisTask']['TaskStatus']}")
+        def synthesize_chunk(chunk: str) -> bytes:
+            with span("speech_chunk", service="polly"):
+                response = polly_client.synthesize_speech(
+                    VoiceId=voice,
+                    OutputFormat='mp3',
+                    Text=chunk,
+                    Engine='neural',
+                    TextType='ssml' if ssml else 'text'
+                )
+                request_characters.append(response.get('RequestCharacters', 0))
+                count("characters_synthesized", response.get('RequestCharacters', 0), service="polly")
+                with closing(response['AudioStream']) as stream:
+                    return stream.read()
 
-            return task_status
-        except:
-            logger.error(f"Error occured.\n\n{traceback.format_exc()}")
-            return {traceback.format_exc()}
\ No newline at end of file
+        logger.info(f"synthesize_long_form: {len(chunks)} chunks, voice: {voice}, key: {key}")
+        with ThreadPoolExecutor(max_workers=self.max_parallel_chunks) as executor:
+            audio = ordered_results(executor, synthesize_chunk, chunks, 2 * self.max_parallel_chunks)
+            upload_stream_to_s3(get_aws_client('s3', self.region_name), self.s3_bucket_name, key, audio,
+                                content_type="audio/mpeg")
+
+        return self.completed_task(key, voice, ssml, sum(request_characters), Chunks=len(chunks))
+
+    @staticmethod
+    def output_key(path: str, fileprefix: str) -> str:
+        """
+        Key of a new audio file, named like the output of a Polly task.
+        """
+        return path.strip('/') + "/" + fileprefix + "." + str(uuid.uuid4()) + ".mp3"
+
+    def completed_task(self, key: str, voice: str, ssml: bool, request_characters: int, **details) -> dict:
+        """
+        Response shaped like get_speech_synthesis_task's for audio written to S3 without a task.
+        """
+        return {
+            "SynthesisTask": {
+                "TaskStatus": "completed",
+                "OutputUri": f"https://s3.{self.region_name}.amazonaws.com/{self.s3_bucket_name}/{key}",
+                "VoiceId": voice,
+                "Engine": "neural",
+                "OutputFormat": "mp3",
+                "TextType": "ssml" if ssml else "text",
+                "RequestCharacters": request_characters,
+                **details,
+            }
+        }
+
+
+def ordered_results(executor, function, items, window: int):
+    """
+    Map function over items on the executor, yielding results in input order with at most
+    window calls submitted ahead of the consumer.
+    """
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+Micro-benchmark of per-call AWS client setup.
+
+Compares what each tool invocation used to do (build a new boto3 client or
+session + client) with fetching the pooled client from aws_clients. No requests
+are sent, so it runs without network access or real credentials.
+
+Usage: python benchmarks/bench_aws_clients.py [--calls 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boto3  # noqa: E402
+
+import aws_clients  # noqa: E402
+
+REGION = "us-east-1"
+CREDENTIALS = {"aws_access_key_id": "AKIDEXAMPLE", "aws_secret_access_key": "secret"}
+
+
+def per_call(function, calls: int):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label: str, timings):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{label:<34} mean {statistics.mean(timings) * 1e3:9.3f} ms"
+          f"   p50 {statistics.median(timings) * 1e3:9.3f} ms   p99 {p99 * 1e3:9.3f} ms")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    print("before (new client per call)")
+    report("boto3.client('transcribe')", per_call(
+        lambda: boto3.client("transcribe", region_name=REGION, **CREDENTIALS), args.calls))
+    report("boto3.Session().client('polly')", per_call(
+        lambda: boto3.Session(region_name=REGION, **CREDENTIALS).client("polly"), args.calls))
+    report("boto3.client('s3')", per_call(
+        lambda: boto3.client("s3", region_name=REGION, **CREDENTIALS), args.calls))
+
+    print("after (pooled client)")
+    for service in ("transcribe", "polly", "s3"):
+        aws_clients.clear_clients()
+        start = time.perf_counter()
+        aws_clients.get_client(service, REGION, **CREDENTIALS)
+        print(f"  first {service} client: {(time.perf_counter() - start) * 1e3:.3f} ms")
+        report(f"get_client('{service}')", per_call(
+            lambda: aws_clients.get_client(service, REGION, **CREDENTIALS), args.calls))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Import-time benchmark of the toolkit.
+
+Runs each phase in a fresh interpreter and reports wall time and resident memory:
+
+  discovery        import text_speech_toolkit and read every tool's name, description
+                   and argument schema, which is all a tool registry needs
+  first execution  discovery, then load everything the first ``_execute`` call loads
+                   (boto3 clients, numpy transcript model, SuperAGI models and helpers,
+                   unstructured)
+
+Discovery should not load any of the heavy modules; ``--check`` fails if it does.
+No AWS requests are sent.
+
+Usage: python benchmarks/bench_import_time.py [--repeats 5] [--check]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that only the execution path needs
+HEAVY_MODULES = ("boto3", "botocore", "numpy", "unstructured", "superagi.models.agent",
+                 "superagi.helper.resource_helper", "superagi.helper.s3_helper")
+
+CHILD = r"""
+import json, resource, sys, time
+sys.path.insert(0, ROOT)
+start = time.perf_counter()
+
+from text_speech_toolkit import LLMDirectToolkit
+tools = LLMDirectToolkit().get_tools()
+metadata = [(tool.name, tool.description, tool.args_schema.schema()) for tool in tools]
+steps = {"discovery": time.perf_counter() - start}
+
+if PHASE == "first_execution":
+    def step(label, function):
+        step_start = time.perf_counter()
+        function()
+        steps[label] = time.perf_counter() - step_start
+
+    import aws_clients
+    step("boto3 clients", lambda: [aws_clients.get_client(service, "us-east-1", "AKIDEXAMPLE", "secret")
+                                   for service in ("transcribe", "polly", "s3")])
+    step("transcript model", lambda: __import__("transcript_model"))
+    step("superagi models", lambda: (__import__("superagi.models.agent"),
+                                     __import__("superagi.models.agent_execution")))
+    step("superagi helpers", lambda: (__import__("superagi.helper.resource_helper"),
+                                      __import__("superagi.helper.s3_helper")))
+    step("unstructured", lambda: __import__("unstructured.partition.auto"))
+
+with open("/proc/self/statm") as statm:
+    rss_kb = int(statm.read().split()[1]) * resource.getpagesize() // 1024
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "steps": steps,
+    "rss_kb": rss_kb,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy_modules": sorted(name for name in HEAVY_MODULES if name in sys.modules),
+}))
+"""
+
+
+def run_phase(phase: str) -> dict:
+    code = f"ROOT = {ROOT!r}\nPHASE = {phase!r}\nHEAVY_MODULES = {HEAVY_MODULES!r}\n" + CHILD
+    process = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if process.returncode != 0:
+        raise SystemExit(f"{phase} failed:\n{process.stderr}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="Fail if discovery loads a heavy module")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for phase in ("discovery", "first_execution"):
+        runs = [run_phase(phase) for _ in range(args.repeats)]
+        results[phase] = runs
+        print(f"{phase:<16} time p50 {statistics.median(run['seconds'] for run in runs) * 1e3:9.1f} ms"
+              f"   rss {statistics.median(run['rss_kb'] for run in runs) / 1024:7.1f} MiB"
+              f"   max rss {statistics.median(run['max_rss_kb'] for run in runs) / 1024:7.1f} MiB")
+        for label in runs[0]["steps"]:
+            print(f"  {label:<20} {statistics.median(run['steps'][label] for run in runs) * 1e3:9.1f} ms")
+        print(f"  heavy modules loaded: {', '.join(runs[0]['heavy_modules']) or 'none'}")
+
+    loaded = results["discovery"][0]["heavy_modules"]
+    if args.check and loaded:
+        print(f"FAIL: discovery imported {', '.join(loaded)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
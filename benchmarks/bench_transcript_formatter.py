@@ -0,0 +1,145 @@
+"""
+Regression benchmark for transcript formatting.
+
+Checks that the indexed formatter, both from a parsed dict and streamed from the
+JSON text, produces the same output as the original quadratic implementation on
+small inputs, then times it on synthetic transcripts
+from 1k to 500k items and fails if the time per item grows with the input size.
+The slope is measured from the first size of at least --reference-items, since the
+best-of-N time of a 1k input is a fraction of a millisecond and too noisy to divide by.
+Sizes below the reference are timed with proportionally more repeats.
+
+Usage: python benchmarks/bench_transcript_formatter.py [--sizes 1000 10000 ...] [--max-slope 3.0]
+                                                       [--reference-items 10000]
+"""
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_transcripts import make_transcript  # noqa: E402
+from transcript_formatter import convert_time_stamp, format_transcript, iter_transcript_json_lines  # noqa: E402
+
+PRODUCED_AT = datetime.datetime(2023, 7, 1, 12, 0, 0)
+
+
+def legacy_process_to_text(data: dict, threshold_for_grey: float = 0.96) -> str:
+    """
+    The pre-index implementation of ``AWSDiarizationTool.process_to_text``, kept as the reference output.
+    """
+    with io.StringIO() as file:
+        file.write(f"Transcription of {data['jobName']}\n\n")
+        file.write("Transcription using AWS Transcribe automatic speech recognition and"
+                   " the 'tscribe' python package.\n")
+        file.write(PRODUCED_AT.strftime("Document produced on %A %d %B %Y at %X.\n\n"))
+        low_confidence_open = False
+        if "speaker_labels" in data["results"].keys():
+            for segment in data["results"]["speaker_labels"]["segments"]:
+                if len(segment["items"]) > 0:
+                    file.write(f"{convert_time_stamp(segment['start_time'])} {segment['speaker_label']}:")
+                    for word in segment["items"]:
+                        pronunciations = [x for x in data["results"]["items"] if x["type"] == "pronunciation"]
+                        word_result = [x for x in pronunciations
+                                       if x["start_time"] == word["start_time"] and x["end_time"] == word["end_time"]]
+                        result = sorted(word_result[-1]["alternatives"], key=lambda x: x["confidence"])[-1]
+                        if float(result["confidence"]) < threshold_for_grey and not low_confidence_open:
+                            file.write(" [")
+                            low_confidence_open = True
+                        word_to_write = result['content'] + " "
+                        try:
+                            word_result_index = data["results"]["items"].index(word_result[0])
+                            next_item = data["results"]["items"][word_result_index + 1]
+                            if next_item["type"] == "punctuation":
+                                content = next_item["alternatives"][0]["content"]
+                                if content in [".", "?", "!"]:
+                                    word_to_write = word_to_write.rstrip() + content + "  "
+                                elif content in [",", ";"]:
+                                    word_to_write = word_to_write.rstrip() + content + " "
+                                else:
+                                    word_to_write += content
+                        except IndexError:
+                            pass
+                        if float(result["confidence"]) >= threshold_for_grey and low_confidence_open:
+                            file.write(word_to_write.rstrip())
+                            file.write("] ")
+                            low_confidence_open = False
+                        else:
+                            file.write(word_to_write)
+                    if low_confidence_open:
+                        file.write("] ")
+                        low_confidence_open = False
+                    file.write("\n")
+        return file.getvalue()
+
+
+def check_equivalence(sizes=(0, 1, 50, 1000), seeds=range(5)):
+    for size in sizes:
+        for seed in seeds:
+            data = make_transcript(size, seed=seed, punctuation_rate=0.4, low_confidence_rate=0.4)
+            expected = legacy_process_to_text(data)
+            actual = format_transcript(data, produced_at=PRODUCED_AT)
+            if expected != actual:
+                raise AssertionError(f"Formatter output differs from reference (size={size}, seed={seed})")
+            streamed = "".join(iter_transcript_json_lines(json.dumps(data), produced_at=PRODUCED_AT))
+            if expected != streamed:
+                raise AssertionError(f"Streaming formatter output differs from reference (size={size}, seed={seed})")
+
+
+def time_format(data: dict, repeat: int) -> float:
+    best = float("inf")
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            format_transcript(data, produced_at=PRODUCED_AT)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 500000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-slope", type=float, default=3.0,
+                        help="Largest allowed ratio of per-item time between the biggest and the reference input. "
+                             "Cache effects alone stay well under it; a quadratic scan is hundreds of times over.")
+    parser.add_argument("--reference-items", type=int, default=10000,
+                        help="The slope is measured from the first size with at least this many items.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args(argv)
+
+    check_equivalence()
+
+    results = []
+    for size in args.sizes:
+        data = make_transcript(size)
+        seconds = time_format(data, args.repeat * max(1, args.reference_items // max(size, 1)))
+        results.append({"items": size, "seconds": seconds, "us_per_item": seconds / size * 1e6})
+
+    reference = next((result for result in results if result["items"] >= args.reference_items), results[0])
+    slope = results[-1]["us_per_item"] / reference["us_per_item"]
+    if args.json:
+        print(json.dumps({"results": results, "slope": slope}, indent=2))
+    else:
+        print(f"{'items':>10} {'seconds':>10} {'us/item':>10}")
+        for result in results:
+            print(f"{result['items']:>10} {result['seconds']:>10.4f} {result['us_per_item']:>10.3f}")
+        print(f"per-item slope {reference['items']} -> {results[-1]['items']}: {slope:.2f}x")
+
+    if slope > args.max_slope:
+        print(f"FAIL: per-item time grew {slope:.2f}x (limit {args.max_slope}x), formatting is not linear")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,444 @@
+"""
+Local stand-ins for Transcribe, Polly and S3, and for the SuperAGI objects the tools use,
+so the real tool code paths can be benchmarked without AWS or a running SuperAGI. When
+the superagi package is not installed, install_superagi_stand_ins provides the modules
+the tools import.
+
+The fakes implement only the calls the tools make. Every call can be given a fixed
+latency, and jobs complete ``job_latency`` seconds after they are started.
+"""
+import importlib.util
+import io
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from types import ModuleType, SimpleNamespace
+from typing import Any, Callable, Optional, Type
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+REGION = "us-east-1"
+
+
+def install_superagi_stand_ins() -> bool:
+    """
+    Register minimal ``superagi.*`` modules in sys.modules if the superagi package cannot be
+    imported, so the tool modules import without SuperAGI installed. offline_environment
+    patches them like the real ones.
+
+    :return: True if the stand-ins were installed.
+    """
+    if "superagi.tools.base_tool" in sys.modules:
+        return False
+    try:
+        if importlib.util.find_spec("superagi.tools.base_tool") is not None:
+            return False
+    except ImportError:
+        # find_spec imports the parent packages, so a missing superagi raises here
+        pass
+    from pydantic import BaseModel
+
+    class BaseToolkitConfiguration:
+        session = None
+
+    class BaseTool(BaseModel):
+        name: str = None
+        description: str = None
+        args_schema: Type[BaseModel] = None
+        toolkit_config: Any = BaseToolkitConfiguration()
+
+        class Config:
+            arbitrary_types_allowed = True
+
+    class BaseToolkit(BaseModel):
+        name: str = None
+        description: str = None
+
+    class Agent:
+        @staticmethod
+        def get_agent_from_id(session, agent_id):
+            return SimpleNamespace(id=agent_id)
+
+    class AgentExecution:
+        @staticmethod
+        def get_agent_execution_from_id(session, agent_execution_id):
+            return SimpleNamespace(id=agent_execution_id)
+
+    members = {
+        "superagi.config.config": {"get_config": lambda key, default=None: default},
+        "superagi.lib.logger": {"logger": logging.getLogger("superagi")},
+        "superagi.tools.base_tool": {"BaseTool": BaseTool, "BaseToolkit": BaseToolkit,
+                                     "BaseToolkitConfiguration": BaseToolkitConfiguration},
+        "superagi.resource_manager.file_manager": {"FileManager": type("FileManager", (), {})},
+        "superagi.helper.resource_helper": {"ResourceHelper": type("ResourceHelper", (), {})},
+        "superagi.helper.s3_helper": {"S3Helper": type("S3Helper", (), {})},
+        "superagi.models.agent": {"Agent": Agent},
+        "superagi.models.agent_execution": {"AgentExecution": AgentExecution},
+    }
+    for name, attributes in members.items():
+        parts = name.split(".")
+        for depth in range(1, len(parts) + 1):
+            package = ".".join(parts[:depth])
+            if package not in sys.modules:
+                sys.modules[package] = ModuleType(package)
+                if depth > 1:
+                    setattr(sys.modules[".".join(parts[:depth - 1])], parts[depth - 1], sys.modules[package])
+        for attribute, value in attributes.items():
+            setattr(sys.modules[name], attribute, value)
+    return True
+
+
+install_superagi_stand_ins()
+
+
+def client_error(code: str, operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+class _FakeService:
+    def __init__(self, call_latency: float = 0.0):
+        self.call_latency = call_latency
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _call(self, operation: str):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.call_latency:
+            time.sleep(self.call_latency)
+
+    def call_count(self, *operations: str) -> int:
+        with self._lock:
+            return sum(count for operation, count in self.calls.items() if not operations or operation in operations)
+
+
+class FakeS3(_FakeService):
+    """
+    In-memory S3 bucket store.
+    """
+
+    def __init__(self, call_latency: float = 0.0):
+        super().__init__(call_latency)
+        self.objects = {}
+        self._uploads = {}
+
+    def put(self, bucket: str, key: str, body: bytes):
+        with self._lock:
+            self.objects[(bucket, key)] = bytes(body)
+
+    def _get(self, bucket: str, key: str, operation: str) -> bytes:
+        with self._lock:
+            body = self.objects.get((bucket, key))
+        if body is None:
+            raise client_error("404" if operation == "HeadObject" else "NoSuchKey", operation)
+        return body
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._call("head_object")
+        body = self._get(Bucket, Key, "HeadObject")
+        return {"ContentLength": len(body), "ETag": f'"{hash(body) & 0xffffffff:08x}"'}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._call("get_object")
+        body = self._get(Bucket, Key, "GetObject")
+        return {"ContentLength": len(body), "Body": io.BytesIO(body)}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._call("put_object")
+        self.put(Bucket, Key, Body.read() if hasattr(Body, "read") else Body)
+        return {"ETag": '"0"'}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self._call("upload_fileobj")
+        self.put(Bucket, Key, Fileobj.read())
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        self._call("copy_object")
+        self.put(Bucket, Key, self._get(CopySource["Bucket"], CopySource["Key"], "CopyObject"))
+        return {"CopyObjectResult": {"ETag": '"0"'}}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._call("create_multipart_upload")
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._call("upload_part")
+        with self._lock:
+            self._uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self._call("complete_multipart_upload")
+        with self._lock:
+            parts = self._uploads.pop(UploadId)
+        self.put(Bucket, Key, b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"]))
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._call("abort_multipart_upload")
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self._call("delete_objects")
+        with self._lock:
+            for item in Delete["Objects"]:
+                self.objects.pop((Bucket, item["Key"]), None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", Delimiter=None, **kwargs):
+        self._call("list_objects_v2")
+        with self._lock:
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        if Delimiter:
+            keys = [key for key in keys if Delimiter not in key[len(Prefix):]]
+        return {"Contents": [{"Key": key} for key in keys]}
+
+    def get_paginator(self, operation: str):
+        return SimpleNamespace(paginate=lambda **kwargs: iter([getattr(self, operation)(**kwargs)]))
+
+
+class _Jobs:
+    """
+    Jobs that complete ``latency`` seconds after they start, running ``on_complete`` once.
+    """
+
+    def __init__(self, latency: Callable[[], float]):
+        self.latency = latency
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def start(self, job_id: str, record: dict, on_complete: Callable[[dict], None]):
+        with self.lock:
+            self.jobs[job_id] = {"record": record, "ready": time.monotonic() + self.latency(),
+                                 "on_complete": on_complete, "completed_at": None}
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["completed_at"] is None and time.monotonic() >= job["ready"]:
+                job["on_complete"](job["record"])
+                job["completed_at"] = job["ready"]
+            return job
+
+    def ids(self):
+        with self.lock:
+            return list(self.jobs)
+
+
+def _latency(value) -> Callable[[], float]:
+    return value if callable(value) else (lambda: value)
+
+
+class FakeTranscribe(_FakeService):
+    """
+    Transcription jobs that write ``transcript_factory(job_name)`` (a JSON string) to the
+    fake S3 when they complete.
+
+    :param job_latency: Seconds a job takes, or a callable returning them.
+    """
+
+    def __init__(self, s3: FakeS3, transcript_factory: Callable[[str], str], job_latency=1.0,
+                 call_latency: float = 0.0):
+        super().__init__(call_latency)
+        self.s3 = s3
+        self.transcript_factory = transcript_factory
+        self.jobs = _Jobs(_latency(job_latency))
+
+    def start_transcription_job(self, TranscriptionJobName, Media, OutputBucketName, OutputKey="", **kwargs):
+        self._call("start_transcription_job")
+        key = (OutputKey.rstrip("/") + "/" if OutputKey else "") + TranscriptionJobName + ".json"
+        record = {"TranscriptionJobName": TranscriptionJobName, "TranscriptionJobStatus": "IN_PROGRESS",
+                  "Media": Media, "Transcript": {
+                      "TranscriptFileUri": f"https://s3.{REGION}.amazonaws.com/{OutputBucketName}/{key}"}}
+
+        def complete(record):
+            self.s3.put(OutputBucketName, key, self.transcript_factory(TranscriptionJobName).encode("utf-8"))
+            record["TranscriptionJobStatus"] = "COMPLETED"
+
+        self.jobs.start(TranscriptionJobName, record, complete)
+        return {"TranscriptionJob": dict(record)}
+
+    def get_transcription_job(self, TranscriptionJobName):
+        self._call("get_transcription_job")
+        job = self.jobs.get(TranscriptionJobName)
+        if job is None:
+            raise client_error("BadRequestException", "GetTranscriptionJob")
+        return {"TranscriptionJob": dict(job["record"])}
+
+    def list_transcription_jobs(self, JobNameContains="", MaxResults=100, **kwargs):
+        self._call("list_transcription_jobs")
+        summaries = []
+        for job_name in self.jobs.ids():
+            if JobNameContains in job_name:
+                record = self.jobs.get(job_name)["record"]
+                summaries.append({"TranscriptionJobName": job_name,
+                                  "TranscriptionJobStatus": record["TranscriptionJobStatus"]})
+        return {"TranscriptionJobSummaries": summaries[-MaxResults:]}
+
+
+class FakePolly(_FakeService):
+    """
+    Polly with synchronous synthesis and asynchronous tasks writing to the fake S3.
+
+    Audio is ``bytes_per_character`` zero bytes per input character.
+    """
+
+    def __init__(self, s3: FakeS3, task_latency=1.0, call_latency: float = 0.0, bytes_per_character: int = 100,
+                 characters_per_second: Optional[float] = None):
+        super().__init__(call_latency)
+        self.s3 = s3
+        self.bytes_per_character = bytes_per_character
+        self.characters_per_second = characters_per_second
+        self.tasks = _Jobs(_latency(task_latency))
+        self._task_ids = itertools.count()
+
+    def synthesize_speech(self, Text, **kwargs):
+        self._call("synthesize_speech")
+        if self.characters_per_second:
+            time.sleep(len(Text) / self.characters_per_second)
+        return {"AudioStream": io.BytesIO(b"\0" * (len(Text) * self.bytes_per_character)),
+                "ContentType": "audio/mpeg", "RequestCharacters": len(Text)}
+
+    def start_speech_synthesis_task(self, Text, OutputS3BucketName, OutputS3KeyPrefix="", VoiceId=None, **kwargs):
+        self._call("start_speech_synthesis_task")
+        task_id = f"task-{next(self._task_ids):08d}"
+        key = f"{OutputS3KeyPrefix}.{task_id}.mp3"
+        record = {"TaskId": task_id, "TaskStatus": "inProgress", "VoiceId": VoiceId,
+                  "OutputUri": f"https://s3.{REGION}.amazonaws.com/{OutputS3BucketName}/{key}",
+                  "RequestCharacters": len(Text)}
+
+        def complete(record):
+            self.s3.put(OutputS3BucketName, key, b"\0" * (len(Text) * self.bytes_per_character))
+            record["TaskStatus"] = "completed"
+
+        self.tasks.start(task_id, record, complete)
+        return {"SynthesisTask": dict(record)}
+
+    def get_speech_synthesis_task(self, TaskId):
+        self._call("get_speech_synthesis_task")
+        return {"SynthesisTask": dict(self.tasks.get(TaskId)["record"])}
+
+    def list_speech_synthesis_tasks(self, MaxResults=100, **kwargs):
+        self._call("list_speech_synthesis_tasks")
+        return {"SynthesisTasks": [dict(self.tasks.get(task_id)["record"]) for task_id in self.tasks.ids()[-MaxResults:]]}
+
+
+class FakeFileManager:
+    """
+    Stands in for SuperAGI's FileManager: ``write_to_s3`` uploads the local file to the fake S3.
+    """
+
+    def __init__(self, s3: FakeS3, bucket: str, session, agent_id: int = 1, agent_execution_id: int = 1):
+        self.s3 = s3
+        self.bucket = bucket
+        self.session = session
+        self.agent_id = agent_id
+        self.agent_execution_id = agent_execution_id
+
+    def write_to_s3(self, file_name: str, final_path: str):
+        with open(final_path, "rb") as file:
+            self.s3.put(self.bucket, "resources/" + os.path.basename(final_path), file.read())
+
+
+class FakeSession:
+    """
+    Stands in for the SQLAlchemy session handed to the tools.
+    """
+
+
+class OfflineAWS:
+    """
+    One fake S3, Transcribe and Polly sharing the same object store.
+    """
+
+    def __init__(self, transcript_factory: Callable[[str], str], job_latency=1.0, task_latency=1.0,
+                 call_latency: float = 0.0, polly_characters_per_second: Optional[float] = None):
+        self.s3 = FakeS3(call_latency)
+        self.transcribe = FakeTranscribe(self.s3, transcript_factory, job_latency, call_latency)
+        self.polly = FakePolly(self.s3, task_latency, call_latency, characters_per_second=polly_characters_per_second)
+
+    def get_client(self, service_name: str, *args, **kwargs):
+        return {"s3": self.s3, "transcribe": self.transcribe, "polly": self.polly}[service_name]
+
+
+@contextmanager
+def offline_environment(aws: OfflineAWS, root_dir: str):
+    """
+    Route the tools' AWS clients to ``aws`` and the SuperAGI resource helpers and models to
+    local stand-ins writing under ``root_dir``.
+    """
+    import aws_helpers
+    from superagi.helper.resource_helper import ResourceHelper
+    from superagi.models.agent import Agent
+    from superagi.models.agent_execution import AgentExecution
+
+    root_dir = root_dir.rstrip("/") + "/"
+    os.makedirs(root_dir, exist_ok=True)
+
+    def resource_path(file_name, *args, **kwargs):
+        return os.path.join(root_dir, os.path.basename(file_name))
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(aws_helpers, "get_client", aws.get_client))
+        stack.enter_context(mock.patch.object(aws_helpers, "get_config", lambda key, default=None: default))
+        for name, function in (("get_root_output_dir", lambda *args: root_dir),
+                               ("get_resource_path", resource_path),
+                               ("get_agent_write_resource_path", resource_path),
+                               ("get_agent_read_resource_path", resource_path),
+                               ("make_written_file_resource", lambda *args, **kwargs: None)):
+            stack.enter_context(mock.patch.object(ResourceHelper, name, staticmethod(function), create=True))
+        stack.enter_context(mock.patch.object(
+            Agent, "get_agent_from_id", staticmethod(lambda session, agent_id: SimpleNamespace(id=agent_id))))
+        stack.enter_context(mock.patch.object(
+            AgentExecution, "get_agent_execution_from_id",
+            staticmethod(lambda session, agent_execution_id: SimpleNamespace(id=agent_execution_id))))
+        yield aws
+
+
+def prepare_tool(tool, aws: OfflineAWS, session=None):
+    """
+    Give a tool the agent ids, session and file manager SuperAGI would set before ``_execute``.
+    """
+    session = session or FakeSession()
+    tool.agent_id = 1
+    tool.agent_execution_id = 1
+    tool.toolkit_config = SimpleNamespace(session=session)
+    if "resource_manager" in tool.__fields__:
+        tool.resource_manager = FakeFileManager(aws.s3, tool.s3_bucket_name, session)
+    return tool
+
+
+def put_audio(aws: OfflineAWS, job_uri: str, size: int = 1 << 20):
+    """
+    Store a placeholder audio object at an s3:// URI so the tools can fingerprint it.
+    """
+    bucket, key = job_uri[len("s3://"):].split("/", 1)
+    aws.s3.put(bucket, key, b"\0" * size)
+
+
+def transcript_json_factory(item_count: int, speaker_count: int = 3) -> Callable[[str], str]:
+    """
+    Transcripts of the same synthetic content, named after each job.
+    """
+    from synthetic_transcripts import make_transcript
+
+    template = make_transcript(item_count, speaker_count=speaker_count)
+
+    def factory(job_name: str) -> str:
+        return json.dumps(dict(template, jobName=job_name))
+
+    return factory
@@ -0,0 +1,310 @@
+"""
+Offline benchmark suite for the diarization and text to speech tools.
+
+Runs the real tool code against the local stand-ins in offline_aws.py (no AWS, no
+running SuperAGI, and stand-ins for the superagi package if it is not installed):
+
+  format    transcript formatting (text and SRT) on synthetic transcripts
+  polling   many concurrent fake Transcribe jobs tracked by a JobWaiter
+  diarize   AWSDiarizationTool._execute end to end
+  tts       AWSTextToSpeechTool._execute end to end, for short text (synchronously and as a
+            task) and long-form text
+
+Each scenario reports throughput, p50/p99 latency and peak traced memory, and the
+end-to-end scenarios add a per-stage breakdown from the tracing spans. Results are
+compared with the baseline file: a latency or memory metric more than ``--tolerance``
+above its baseline, or a throughput below it, fails the run. ``--save-baseline``
+records the current results instead. Without a baseline file the run passes, unless
+``--require-baseline`` is given, e.g. in CI.
+
+Usage: python benchmarks/run_benchmarks.py [--scenarios format polling diarize tts]
+                                           [--baseline benchmarks/baseline.json] [--save-baseline]
+                                           [--require-baseline] [--tolerance 0.3] [--quick]
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+import tracing  # noqa: E402
+from offline_aws import OfflineAWS, offline_environment, prepare_tool, put_audio, transcript_json_factory  # noqa: E402
+from synthetic_transcripts import make_transcript_json  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCHMARKS, "baseline.json")
+SCENARIOS = ("format", "polling", "diarize", "tts")
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(timings, units: float = 1.0) -> dict:
+    """
+    p50/p99 of per-run timings and the resulting throughput in units per second.
+    """
+    p50 = statistics.median(timings)
+    return {"p50_seconds": p50, "p99_seconds": percentile(timings, 0.99), "throughput_per_second": units / p50}
+
+
+def time_runs(function, repeats: int):
+    timings = []
+    function()
+    gc.collect()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def peak_memory(function) -> int:
+    """
+    Peak bytes allocated by Python while running function once, measured in a separate run
+    because tracing allocations slows everything down.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def stage_breakdown(sink: tracing.MemorySink) -> dict:
+    stages = {}
+    for name, _, duration, _ in sink.spans:
+        stages.setdefault(name, []).append(duration)
+    return {name: {"count": len(durations), "p50_seconds": statistics.median(durations)}
+            for name, durations in sorted(stages.items())}
+
+
+def bench_format(args) -> dict:
+    from aws_diarization import AWSDiarizationTool
+
+    tool = AWSDiarizationTool()
+    results = {}
+    for size in args.format_sizes:
+        data = make_transcript_json(size).encode("utf-8")
+
+        def text():
+            io.StringIO().writelines(tool.process_to_lines(data))
+
+        def srt():
+            io.StringIO().writelines(tool.process_to_model(data).render("srt", time_stamp=tool.convert_time_stamp))
+
+        for label, function in (("text", text), ("srt", srt)):
+            result = summarize(time_runs(function, args.repeats), units=size)
+            result["peak_bytes"] = peak_memory(function)
+            results[f"format.{label}.{size}"] = result
+    return results
+
+
+def bench_polling(args) -> dict:
+    from aws_jobs import JobWaiter
+
+    rng = random.Random(0)
+    low, high = args.poll_latency
+    aws = OfflineAWS(lambda job_name: "{}", job_latency=lambda: rng.uniform(low, high))
+    waiter = JobWaiter()
+    lateness = []
+    lock = threading.Lock()
+
+    def track(job_name: str):
+        def done(_):
+            job = aws.transcribe.jobs.get(job_name)
+            with lock:
+                lateness.append(time.monotonic() - job["ready"])
+        return done
+
+    start = time.perf_counter()
+    futures = []
+    for index in range(args.poll_jobs):
+        job_name = f"BenchJob_{index:05d}"
+        aws.transcribe.start_transcription_job(TranscriptionJobName=job_name, Media={}, OutputBucketName="bench")
+        future = waiter.wait_transcription_job(aws.transcribe, job_name, expected_duration=(low + high) / 2)
+        future.add_done_callback(track(job_name))
+        futures.append(future)
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+
+    calls = aws.transcribe.call_count("get_transcription_job", "list_transcription_jobs")
+    return {"polling": {
+        "p50_seconds": statistics.median(lateness),
+        "p99_seconds": percentile(lateness, 0.99),
+        "throughput_per_second": args.poll_jobs / elapsed,
+        "calls_per_job": calls / args.poll_jobs,
+    }}
+
+
+def run_tool(args, aws: OfflineAWS, make_tool, execute, runs: int) -> dict:
+    """
+    Time ``execute(tool)`` with a prepared tool inside the offline environment.
+    """
+    sink = tracing.MemorySink()
+    with tempfile.TemporaryDirectory() as root_dir, offline_environment(aws, root_dir):
+        tool = prepare_tool(make_tool(), aws)
+
+        tracing.set_sink(sink)
+        try:
+            # The first, untimed run warms up the lazy imports and the shared clients
+            result = summarize(time_runs(lambda: execute(tool), runs))
+        finally:
+            tracing.set_sink(None)
+        result["peak_bytes"] = peak_memory(lambda: execute(tool))
+    result["stages"] = stage_breakdown(sink)
+    return result
+
+
+def check_result(result):
+    text = result if isinstance(result, str) else json.dumps(result, default=str)
+    if "Error occured" in text or "Traceback" in text:
+        raise RuntimeError(f"Tool call failed:\n{text}")
+
+
+def bench_diarize(args) -> dict:
+    from aws_diarization import AWSDiarizationTool
+    from aws_helpers import ensure_path
+
+    aws = OfflineAWS(transcript_json_factory(args.diarize_items), job_latency=args.job_latency)
+    target_file = "bench/meeting.mp3"
+
+    def make_tool():
+        tool = AWSDiarizationTool()
+        tool.min_expected_job_seconds = args.job_latency
+        tool.job_seconds_per_audio_second = 0.0
+        put_audio(aws, tool.job_uri(ensure_path(os.path.dirname(target_file), True), os.path.basename(target_file)))
+        return tool
+
+    def execute(tool):
+        check_result(tool._execute(target_file, bypass_cache=True))
+
+    return {f"diarize.{args.diarize_items}": run_tool(args, aws, make_tool, execute, args.runs)}
+
+
+def bench_tts(args) -> dict:
+    from aws_text_to_speech import AWSTextToSpeechTool
+
+    aws = OfflineAWS(lambda job_name: "{}", task_latency=args.task_latency,
+                     polly_characters_per_second=args.polly_characters_per_second)
+    sentence = "The quarterly numbers look good, but we should review churn before Friday. "
+    short_text = sentence * 4
+    long_text = (sentence * 20 + "\n\n") * max(1, args.long_form_characters // (len(sentence) * 20))
+
+    def execute(text, long_form):
+        def run(tool):
+            check_result(tool._execute(text, "bench", "speech", voice="Joanna", long_form=long_form, bypass_cache=True))
+        return run
+
+    def task_tool():
+        tool = AWSTextToSpeechTool()
+        tool.max_sync_characters = 0
+        return tool
+
+    results = {"tts.short": run_tool(args, aws, AWSTextToSpeechTool, execute(short_text, False), args.runs),
+               "tts.short_task": run_tool(args, aws, task_tool, execute(short_text, False), args.runs)}
+    results[f"tts.long_form.{len(long_text)}"] = run_tool(args, aws, AWSTextToSpeechTool, execute(long_text, True), args.runs)
+    return results
+
+
+BENCHES = {"format": bench_format, "polling": bench_polling, "diarize": bench_diarize, "tts": bench_tts}
+
+# Metric name suffix -> True if a larger value is better
+DIRECTIONS = {"_seconds": False, "_bytes": False, "calls_per_job": False, "_per_second": True}
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    failures = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            previous = baseline.get(name, {}).get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(previous, (int, float)) or not previous:
+                continue
+            higher_is_better = next((better for suffix, better in DIRECTIONS.items() if metric.endswith(suffix)), None)
+            if higher_is_better is None:
+                continue
+            if higher_is_better and value < previous / (1 + tolerance) or \
+                    not higher_is_better and value > previous * (1 + tolerance):
+                failures.append(f"{name} {metric}: {value:.6g} vs baseline {previous:.6g}")
+    return failures
+
+
+def report(results: dict):
+    for name, metrics in results.items():
+        line = [f"{name:<28}"]
+        if "throughput_per_second" in metrics:
+            line.append(f"{metrics['throughput_per_second']:12.1f}/s")
+        line.append(f"p50 {metrics['p50_seconds'] * 1e3:9.2f} ms   p99 {metrics['p99_seconds'] * 1e3:9.2f} ms")
+        if "peak_bytes" in metrics:
+            line.append(f"peak {metrics['peak_bytes'] / (1 << 20):8.2f} MiB")
+        if "calls_per_job" in metrics:
+            line.append(f"{metrics['calls_per_job']:.2f} calls/job")
+        print("   ".join(line))
+        for stage, stats in metrics.get("stages", {}).items():
+            print(f"    {stage:<22} x{stats['count']:<5} p50 {stats['p50_seconds'] * 1e3:9.3f} ms")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--require-baseline", action="store_true", help="Fail when there is no baseline to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="Allowed relative slowdown before a metric counts as a regression")
+    parser.add_argument("--quick", action="store_true", help="Smaller inputs and fewer runs, for a smoke test")
+    parser.add_argument("--repeats", type=int, default=20, help="Runs per formatting size")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per end-to-end scenario")
+    parser.add_argument("--format-sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--poll-jobs", type=int, default=200)
+    parser.add_argument("--poll-latency", type=float, nargs=2, default=[0.5, 3.0], metavar=("MIN", "MAX"))
+    parser.add_argument("--diarize-items", type=int, default=20000)
+    parser.add_argument("--job-latency", type=float, default=0.5)
+    parser.add_argument("--task-latency", type=float, default=1.0)
+    parser.add_argument("--long-form-characters", type=int, default=50000)
+    parser.add_argument("--polly-characters-per-second", type=float, default=20000.0)
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.repeats = args.runs = 3
+        args.format_sizes = [1000, 10000]
+        args.poll_jobs = 50
+        args.diarize_items = 2000
+        args.long_form_characters = 10000
+
+    results = {}
+    for scenario in args.scenarios:
+        results.update(BENCHES[scenario](args))
+    report(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to record one")
+        return 1 if args.require_baseline else 0
+    with open(args.baseline) as file:
+        failures = compare(results, json.load(file), args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
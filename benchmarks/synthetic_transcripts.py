@@ -0,0 +1,80 @@
+"""
+Generators for synthetic AWS Transcribe output used by the benchmarks.
+"""
+import json
+import random
+from typing import Optional
+
+WORDS = ("the", "quarterly", "numbers", "look", "good", "but", "we", "should", "review",
+         "churn", "before", "Friday", "okay", "thanks", "everyone", "let's", "move", "on")
+PUNCTUATION = (".", ",", "?", "!", ";")
+
+
+def make_transcript(item_count: int, speaker_count: int = 3, seed: Optional[int] = 0,
+                    job_name: str = "AWSDiarizationJob_synthetic", low_confidence_rate: float = 0.1,
+                    punctuation_rate: float = 0.15, words_per_segment: int = 12) -> dict:
+    """
+    Build a Transcribe output with speaker labels and roughly ``item_count`` items.
+
+    :param item_count: Number of entries in ``results.items`` (words and punctuation).
+    :param speaker_count: Number of distinct ``spk_N`` labels to rotate through.
+    :param seed: Random seed, so repeated runs produce the same transcript.
+    :param job_name: Value of the top-level ``jobName``.
+    :param low_confidence_rate: Fraction of words below the default 0.96 threshold.
+    :param punctuation_rate: Probability that a word is followed by punctuation.
+    :param words_per_segment: Average number of words per speaker segment.
+    :return: The transcript as a dictionary.
+    """
+    rng = random.Random(seed)
+    items = []
+    segments = []
+    segment = None
+    clock = 0.0
+    speaker = 0
+
+    while len(items) < item_count:
+        if segment is None or len(segment["items"]) >= rng.randint(1, 2 * words_per_segment):
+            if segment is not None:
+                segments.append(segment)
+                speaker = (speaker + rng.randint(1, max(1, speaker_count - 1))) % speaker_count
+            segment = {"start_time": f"{clock:.3f}", "end_time": f"{clock:.3f}",
+                       "speaker_label": f"spk_{speaker}", "items": []}
+
+        start = clock
+        end = start + rng.uniform(0.1, 0.6)
+        clock = end + rng.uniform(0.0, 0.3)
+        start_time, end_time = f"{start:.3f}", f"{end:.3f}"
+
+        confidence = rng.uniform(0.5, 0.95) if rng.random() < low_confidence_rate else rng.uniform(0.96, 1.0)
+        alternatives = [{"confidence": f"{confidence:.4f}", "content": rng.choice(WORDS)}]
+        items.append({"start_time": start_time, "end_time": end_time,
+                      "alternatives": alternatives, "type": "pronunciation"})
+        segment["items"].append({"start_time": start_time, "end_time": end_time,
+                                 "speaker_label": segment["speaker_label"]})
+        segment["end_time"] = end_time
+
+        if len(items) < item_count and rng.random() < punctuation_rate:
+            items.append({"alternatives": [{"confidence": "0.0", "content": rng.choice(PUNCTUATION)}],
+                          "type": "punctuation"})
+
+    if segment is not None and segment["items"]:
+        segments.append(segment)
+
+    transcript = " ".join(item["alternatives"][0]["content"] for item in items)
+    return {
+        "jobName": job_name,
+        "accountId": "000000000000",
+        "results": {
+            "transcripts": [{"transcript": transcript}],
+            "speaker_labels": {"speakers": speaker_count, "segments": segments},
+            "items": items,
+        },
+        "status": "COMPLETED",
+    }
+
+
+def make_transcript_json(item_count: int, **kwargs) -> str:
+    """
+    Same as :func:`make_transcript`, serialized to a JSON string.
+    """
+    return json.dumps(make_transcript(item_count, **kwargs))
@@ -0,0 +1,279 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Callable, List, Optional, Tuple
+
+from superagi.config.config import get_config
+from superagi.lib.logger import logger
+from aws_helpers import get_state_path
+
+JOB_REGISTRY_FILE = "jobs.sqlite"
+
+SUBMITTING = "SUBMITTING"
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+
+
+def execution_key(agent_id, agent_execution_id) -> Optional[str]:
+    """
+    Key of the agent execution jobs are recorded under, None outside of an agent execution.
+    """
+    if agent_execution_id is None:
+        return None
+    return f"{agent_id}:{agent_execution_id}"
+
+
+class JobRecord:
+    """
+    A job in the registry.
+
+    :param job_id: Transcription job name or synthesis task id, None while it is being submitted.
+    :param inputs: What the job was submitted with, for operators.
+    :param output: Whatever the tool needs to pick the job up again, e.g. its output location.
+    :param slots: Concurrent job slots the entry takes, one per AWS job.
+    """
+
+    def __init__(self, row_id: int, kind: str, execution: Optional[str], fingerprint: str, job_id: Optional[str],
+                 status: str, inputs: dict, output: dict, slots: int, created: float, updated: float):
+        self.row_id = row_id
+        self.kind = kind
+        self.execution = execution
+        self.fingerprint = fingerprint
+        self.job_id = job_id
+        self.status = status
+        self.inputs = inputs
+        self.output = output
+        self.slots = slots
+        self.created = created
+        self.updated = updated
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created
+
+    @classmethod
+    def from_row(cls, row) -> "JobRecord":
+        row_id, kind, execution, fingerprint, job_id, status, inputs, output, slots, created, updated = row
+        return cls(row_id, kind, execution, fingerprint, job_id, status, json.loads(inputs), json.loads(output),
+                   slots, created, updated)
+
+
+_COLUMNS = "id, kind, execution, fingerprint, job_id, status, inputs, output, slots, created, updated"
+
+
+class JobRegistry:
+    """
+    Persistent record of the AWS jobs the tools submit, shared by every worker using the same
+    SQLite file.
+
+    Jobs are recorded per agent execution with a fingerprint of their inputs, so a retried tool
+    call re-attaches to the job an earlier attempt submitted, still running or completed,
+    instead of submitting a duplicate. The registry also caps the jobs in flight across all
+    workers: a submission waits until a slot is free.
+
+    :param path: SQLite file of the registry.
+    :param max_active_jobs: Slots shared by every worker, None for no limit.
+    :param stale_after: Seconds after which an unfinished job no longer takes a slot and is not
+        re-attached to, e.g. because its worker died before recording the result.
+    :param submit_timeout: Seconds after which a job still being submitted is considered abandoned.
+    :param max_age: Seconds after which finished jobs are removed.
+    :param poll_interval: Seconds between checks for a free slot.
+    """
+
+    def __init__(self, path: str, max_active_jobs: Optional[int] = None, stale_after: float = 6 * 3600,
+                 submit_timeout: float = 900, max_age: float = 7 * 24 * 3600, poll_interval: float = 1.0):
+        self.path = path
+        self.max_active_jobs = max_active_jobs
+        self.stale_after = stale_after
+        self.submit_timeout = submit_timeout
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                               "kind TEXT NOT NULL, execution TEXT, fingerprint TEXT NOT NULL, job_id TEXT, "
+                               "status TEXT NOT NULL, inputs TEXT NOT NULL, output TEXT NOT NULL, "
+                               "slots INTEGER NOT NULL, created REAL NOT NULL, updated REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_lookup ON jobs (execution, kind, fingerprint)")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def _connect(self):
+        # Transactions are started explicitly, BEGIN IMMEDIATE serializes slot reservations across workers
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _active(self, now: float) -> Tuple[str, tuple]:
+        """
+        SQL condition, and its parameters, matching unfinished jobs that are not abandoned.
+        """
+        return ("((status = ? AND updated >= ?) OR (status = ? AND updated >= ?))",
+                (IN_PROGRESS, now - self.stale_after, SUBMITTING, now - self.submit_timeout))
+
+    def _find(self, connection, kind: str, execution: str, fingerprint: str, reuse_completed: bool,
+              now: float) -> Optional[JobRecord]:
+        condition, parameters = self._active(now)
+        if reuse_completed:
+            condition, parameters = f"(status = ? OR {condition})", (COMPLETED,) + parameters
+        row = connection.execute(
+            f"SELECT {_COLUMNS} FROM jobs WHERE execution = ? AND kind = ? AND fingerprint = ? AND {condition} "
+            f"ORDER BY id DESC LIMIT 1", (execution, kind, fingerprint) + parameters).fetchone()
+        return JobRecord.from_row(row) if row is not None else None
+
+    def _active_slots(self, connection, now: float) -> int:
+        condition, parameters = self._active(now)
+        return connection.execute(f"SELECT COALESCE(SUM(slots), 0) FROM jobs WHERE {condition}", parameters).fetchone()[0]
+
+    def find(self, kind: str, execution: Optional[str], fingerprint: str, reuse_completed: bool = True) -> Optional[JobRecord]:
+        """
+        The latest job of this execution with these inputs that is running or completed, or None.
+        """
+        if execution is None:
+            return None
+        with closing(self._connect()) as connection:
+            return self._find(connection, kind, execution, fingerprint, reuse_completed, time.time())
+
+    def submit(self, kind: str, execution: Optional[str], fingerprint: str, inputs: dict,
+               submit: Callable[[], Tuple[str, dict]], reuse_completed: bool = True,
+               timeout: Optional[float] = None, slots: int = 1) -> Tuple[JobRecord, bool]:
+        """
+        Re-attach to this execution's job with the same inputs, or submit a new one once a slot is free.
+
+        If another worker is submitting the same job, wait for it and attach to its job.
+
+        :param kind: Kind of job, e.g. "transcription".
+        :param execution: See execution_key. None never re-attaches.
+        :param fingerprint: Identifies the job's inputs, see result_cache.cache_key.
+        :param submit: Submits the job and returns ``(job_id, output)``. Exceptions free the slot.
+        :param reuse_completed: Also re-attach to completed jobs, not only to running ones.
+        :param timeout: Seconds to wait for a slot before raising TimeoutError, None to wait forever.
+        :param slots: Number of AWS jobs submit starts. They are reserved together before submit is
+            called. A request for more slots than max_active_jobs is admitted when no other job is active.
+        :return: ``(record, attached)`` where attached is False if submit was called.
+        """
+        started = time.monotonic()
+        waited = False
+        while True:
+            now = time.time()
+            with closing(self._connect()) as connection:
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    existing = None
+                    if execution is not None:
+                        existing = self._find(connection, kind, execution, fingerprint, reuse_completed, now)
+                    if existing is not None and existing.job_id is not None:
+                        connection.execute("COMMIT")
+                        logger.info(f"JobRegistry: re-attaching to {kind} {existing.job_id} ({existing.status})")
+                        return existing, True
+                    row_id = None
+                    if existing is None and self._admits(self._active_slots(connection, now), slots):
+                        self._prune(connection, now)
+                        row_id = connection.execute(
+                            "INSERT INTO jobs (kind, execution, fingerprint, job_id, status, inputs, output, slots, "
+                            "created, updated) VALUES (?, ?, ?, NULL, ?, ?, '{}', ?, ?, ?)",
+                            (kind, execution, fingerprint, SUBMITTING, json.dumps(inputs), slots, now, now)).lastrowid
+                    connection.execute("COMMIT")
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+            if row_id is not None:
+                break
+            if timeout is not None and time.monotonic() - started >= timeout:
+                raise TimeoutError(f"No free job slot for {kind} after {timeout} seconds")
+            if not waited:
+                logger.info(f"JobRegistry: waiting for a free slot for {kind} "
+                            f"({'same job being submitted' if existing is not None else 'at capacity'})")
+                waited = True
+            time.sleep(self.poll_interval)
+
+        try:
+            job_id, output = submit()
+        except BaseException:
+            with closing(self._connect()) as connection:
+                connection.execute("DELETE FROM jobs WHERE id = ?", (row_id,))
+            raise
+
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute("UPDATE jobs SET job_id = ?, status = ?, output = ?, updated = ? WHERE id = ?",
+                               (job_id, IN_PROGRESS, json.dumps(output), now, row_id))
+        return JobRecord(row_id, kind, execution, fingerprint, job_id, IN_PROGRESS, inputs, output, slots,
+                         now, now), False
+
+    def _admits(self, active: int, slots: int) -> bool:
+        if self.max_active_jobs is None:
+            return True
+        return active + slots <= self.max_active_jobs or (active == 0 and slots > self.max_active_jobs)
+
+    def update(self, record: JobRecord, status: Optional[str] = None, output: Optional[dict] = None,
+               slots: Optional[int] = None):
+        """
+        Record progress of a job. output is merged into what was recorded so far.
+        """
+        if status is not None:
+            record.status = status
+        if output is not None:
+            record.output = dict(record.output, **output)
+        if slots is not None:
+            record.slots = slots
+        record.updated = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute("UPDATE jobs SET status = ?, output = ?, slots = ?, updated = ? WHERE id = ?",
+                               (record.status, json.dumps(record.output), record.slots, record.updated, record.row_id))
+
+    def release(self, record: JobRecord):
+        """
+        Stop counting a job whose outcome is unknown against the cap, e.g. after waiting for it
+        timed out. It stays in progress, so a retry can still re-attach to it.
+        """
+        self.update(record, slots=0)
+
+    def finish(self, record: JobRecord, status: str, output: Optional[dict] = None):
+        """
+        Record the final status of a job, COMPLETED or FAILED, freeing its slots.
+        """
+        self.update(record, COMPLETED if status.upper() == COMPLETED else FAILED, output)
+
+    def active_slots(self) -> int:
+        with closing(self._connect()) as connection:
+            return self._active_slots(connection, time.time())
+
+    def jobs(self, execution: Optional[str] = None, limit: int = 100) -> List[JobRecord]:
+        """
+        The latest jobs, of one execution or of all of them, for operators.
+        """
+        with closing(self._connect()) as connection:
+            if execution is None:
+                rows = connection.execute(f"SELECT {_COLUMNS} FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+            else:
+                rows = connection.execute(f"SELECT {_COLUMNS} FROM jobs WHERE execution = ? ORDER BY id DESC LIMIT ?",
+                                          (execution, limit))
+            return [JobRecord.from_row(row) for row in rows.fetchall()]
+
+    def _prune(self, connection, now: float):
+        connection.execute("DELETE FROM jobs WHERE updated < ? AND status IN (?, ?)", (now - self.max_age, COMPLETED, FAILED))
+        connection.execute("DELETE FROM jobs WHERE updated < ?", (now - max(self.max_age, self.stale_after),))
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_job_registry() -> JobRegistry:
+    """
+    The process-wide job registry under the resources root. The AWS_MAX_CONCURRENT_JOBS setting
+    caps the jobs in flight across every worker sharing it.
+    """
+    path = get_state_path(JOB_REGISTRY_FILE)
+    registry = _registries.get(path)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.get(path)
+            if registry is None:
+                max_active_jobs = get_config("AWS_MAX_CONCURRENT_JOBS", None)
+                registry = _registries[path] = JobRegistry(
+                    path, max_active_jobs=int(max_active_jobs) if max_active_jobs else None)
+    return registry
@@ -0,0 +1,331 @@
+import bisect
+import math
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from audio_preprocessing import (FRAME_SECONDS, SAMPLE_RATE, AudioPreprocessingError, TimeMap, decode_audio,
+                                 detect_speech, encode_flac, frame_energies, trim)
+from aws_helpers import derived_key
+from superagi.lib.logger import logger
+from tracing import count, span
+
+# Words of two chunks closer than this in time are taken as the same word when matching speakers
+MATCH_TOLERANCE_SECONDS = 0.25
+
+
+class AudioChunk:
+    def __init__(self, uri: str, start: float, end: float):
+        self.uri = uri
+        self.start = start
+        self.end = end
+
+
+class LongAudioPlan:
+    """
+    Overlapping chunks of a recording, transcribed separately and merged back.
+
+    :param chunks: The uploaded chunks, in order. Chunk ``i`` covers ``start``-``end`` seconds of the (possibly trimmed) audio.
+    :param boundaries: Cut points between consecutive chunks, in the middle of their overlap.
+    :param time_map: Maps the trimmed audio back to the original when silences were cut, else None.
+    """
+
+    def __init__(self, chunks: List[AudioChunk], boundaries: List[float], time_map: Optional[TimeMap]):
+        self.chunks = chunks
+        self.boundaries = boundaries
+        self.time_map = time_map
+
+    def to_dict(self) -> dict:
+        return {"chunks": [{"uri": chunk.uri, "start": chunk.start, "end": chunk.end} for chunk in self.chunks],
+                "boundaries": self.boundaries,
+                "time_map": self.time_map.to_dict() if self.time_map is not None else None}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LongAudioPlan":
+        return cls([AudioChunk(chunk["uri"], chunk["start"], chunk["end"]) for chunk in data["chunks"]],
+                   data["boundaries"], TimeMap.from_dict(data["time_map"]) if data["time_map"] else None)
+
+
+def plan_chunks(energies: np.ndarray, duration: float, chunk_seconds: float, overlap_seconds: float,
+                frame_seconds: float = FRAME_SECONDS, search_seconds: Optional[float] = None) -> Tuple[List[Tuple[float, float]], List[float]]:
+    """
+    Choose where to cut a recording into chunks of about ``chunk_seconds``.
+
+    Each cut goes at the quietest half second within ``search_seconds`` (a tenth of the chunk
+    by default) of its target, and chunks extend ``overlap_seconds / 2`` past the cuts on both sides.
+
+    :return: ``(start, end)`` of every chunk and the cut points between them.
+    """
+    if duration <= chunk_seconds * 1.25 or len(energies) == 0:
+        return [(0.0, duration)], []
+
+    search_seconds = chunk_seconds / 10 if search_seconds is None else search_seconds
+    window = max(1, int(round(0.5 / frame_seconds)))
+    smoothed = np.convolve(energies, np.ones(window) / window, mode="same")
+
+    cuts = [0.0]
+    while duration - cuts[-1] > chunk_seconds * 1.25:
+        target = cuts[-1] + chunk_seconds
+        low = max(int((target - search_seconds) / frame_seconds), int((cuts[-1] + overlap_seconds) / frame_seconds) + 1)
+        high = min(int((target + search_seconds) / frame_seconds), len(smoothed))
+        if high > low:
+            # Ties, e.g. a flat stretch, go to the frame closest to the target
+            distance = np.abs(np.arange(low, high) - target / frame_seconds)
+            frame = low + int(np.argmin(smoothed[low:high] + 1e-6 * distance))
+        else:
+            frame = int(target / frame_seconds)
+        cuts.append((frame + 0.5) * frame_seconds)
+    cuts.append(duration)
+
+    half = overlap_seconds / 2
+    chunks = [(max(0.0, start - half), min(duration, end + half)) for start, end in zip(cuts[:-1], cuts[1:])]
+    return chunks, cuts[1:-1]
+
+
+def split_s3_audio(s3_client, bucket: str, key: str, chunk_seconds: float = 900.0, overlap_seconds: float = 20.0,
+                   trim_silence: bool = False, max_workers: int = 4, **vad_options) -> LongAudioPlan:
+    """
+    Decode the audio at s3://bucket/key, optionally cut its silences, and upload it as
+    overlapping mono 16 kHz FLAC chunks to the derived audio folder next to the original
+    (``_derived/<name>.chunkNNN.flac``, see aws_helpers.derived_key). The caller deletes them
+    once they are transcribed.
+
+    :param vad_options: Passed to detect_speech when trim_silence is set.
+    """
+    url = s3_client.generate_presigned_url("get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=3600)
+    with span("audio_decode"):
+        samples = decode_audio(url)
+    if len(samples) == 0:
+        raise AudioPreprocessingError(f"s3://{bucket}/{key} has no audio")
+
+    time_map = None
+    if trim_silence:
+        with span("audio_vad"):
+            regions = detect_speech(samples, **vad_options)
+            samples = trim(samples, regions)
+        time_map = TimeMap.from_regions(regions)
+
+    duration = len(samples) / SAMPLE_RATE
+    bounds, boundaries = plan_chunks(frame_energies(samples, int(SAMPLE_RATE * FRAME_SECONDS)), duration,
+                                     chunk_seconds, overlap_seconds)
+
+    def upload(index: int) -> AudioChunk:
+        start, end = bounds[index]
+        chunk_key = derived_key(key, f".chunk{index:03d}.flac")
+        with span("audio_encode"):
+            flac = encode_flac(samples[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)])
+        with span("s3_upload", service="s3"):
+            s3_client.put_object(Bucket=bucket, Key=chunk_key, Body=flac, ContentType="audio/flac")
+        count("bytes_uploaded", len(flac), service="s3")
+        return AudioChunk(f"s3://{bucket}/{chunk_key}", start, end)
+
+    # ffmpeg runs in a subprocess, so the chunks encode in parallel
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        chunks = list(executor.map(upload, range(len(bounds))))
+
+    logger.info(f"split_s3_audio: s3://{bucket}/{key}, {duration:.1f} seconds in {len(chunks)} chunks, cuts at {boundaries}")
+    return LongAudioPlan(chunks, boundaries, time_map)
+
+
+def _format_time(seconds: float) -> str:
+    return f"{seconds:.3f}"
+
+
+class _Word:
+    __slots__ = ("item", "start", "speaker")
+
+    def __init__(self, item: dict, start: float, speaker: Optional[str]):
+        self.item = item
+        self.start = start
+        self.speaker = speaker
+
+
+def _speakers(transcript: dict) -> Dict[Tuple[str, str], str]:
+    speakers = {}
+    for segment in transcript["results"].get("speaker_labels", {}).get("segments", []):
+        for item in segment["items"]:
+            speakers[(item["start_time"], item["end_time"])] = item.get("speaker_label", segment["speaker_label"])
+    return speakers
+
+
+def _chunk_words(transcript: dict, offset: float) -> List[_Word]:
+    """
+    Pronunciations of a chunk transcript with their start shifted by offset and their speaker.
+    """
+    speakers = _speakers(transcript)
+    return [_Word(item, float(item["start_time"]) + offset, speakers.get((item["start_time"], item["end_time"])))
+            for item in transcript["results"]["items"] if "start_time" in item]
+
+
+def _content(item: dict) -> str:
+    return max(item["alternatives"], key=lambda alternative: float(alternative["confidence"]))["content"]
+
+
+def match_speakers(previous: List[_Word], current: List[_Word], overlap_start: float, overlap_end: float,
+                   known: List[str]) -> Dict[str, str]:
+    """
+    Map the speaker labels of a chunk to the labels used so far.
+
+    Words both chunks heard in their overlap vote for a pairing of labels, and pairings are
+    taken greedily from the most votes. Labels left over are given the known labels no
+    pairing claimed, in order of first appearance, and new labels once those run out.
+
+    :param previous: Words of the previous chunk, already relabeled.
+    :param current: Words of this chunk, with its own labels.
+    :param known: Every label used so far, in order of first appearance.
+    """
+    candidates = sorted((word for word in previous if overlap_start - MATCH_TOLERANCE_SECONDS <= word.start
+                         <= overlap_end + MATCH_TOLERANCE_SECONDS and word.speaker), key=lambda word: word.start)
+    starts = [word.start for word in candidates]
+    votes = Counter()
+    for word in current:
+        if not overlap_start <= word.start <= overlap_end or not word.speaker:
+            continue
+        content = _content(word.item).lower()
+        index = bisect.bisect_left(starts, word.start - MATCH_TOLERANCE_SECONDS)
+        while index < len(candidates) and candidates[index].start <= word.start + MATCH_TOLERANCE_SECONDS:
+            if _content(candidates[index].item).lower() == content:
+                votes[(word.speaker, candidates[index].speaker)] += 1
+                break
+            index += 1
+
+    mapping = {}
+    for (label, known_label), _ in votes.most_common():
+        if label not in mapping and known_label not in mapping.values():
+            mapping[label] = known_label
+
+    free = [label for label in known if label not in mapping.values()]
+    next_label = 0
+    for word in current:
+        if word.speaker and word.speaker not in mapping:
+            if free:
+                mapping[word.speaker] = free.pop(0)
+            else:
+                while f"spk_{next_label}" in known or f"spk_{next_label}" in mapping.values():
+                    next_label += 1
+                mapping[word.speaker] = f"spk_{next_label}"
+    return mapping
+
+
+class TranscriptMerger:
+    """
+    Merges the Transcribe outputs of the chunks of a LongAudioPlan one at a time, in order.
+
+    Times are shifted by each chunk's start. In each overlap, words starting before the cut
+    come from the earlier chunk and the rest from the later one, and punctuation follows
+    the word before it. Speaker labels are made consistent across chunks with
+    match_speakers, and segments of the same speaker meeting at a cut are joined.
+
+    Every segment but the last is final as soon as its chunk is added, see take_settled.
+    """
+
+    def __init__(self, plan: LongAudioPlan):
+        self.plan = plan
+        self.items = []
+        self.segments = []
+        self.known = []
+        self.added = 0
+        self._previous_words = []
+        self._settled_items = 0
+        self._settled_segments = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.added == len(self.plan.chunks)
+
+    def add(self, transcript: dict):
+        """
+        Merge the Transcribe output of the next chunk.
+        """
+        index, chunk = self.added, self.plan.chunks[self.added]
+        lower = self.plan.boundaries[index - 1] if index > 0 else -math.inf
+        upper = self.plan.boundaries[index] if index < len(self.plan.boundaries) else math.inf
+
+        def shifted(time: str) -> str:
+            return _format_time(float(time) + chunk.start)
+
+        def kept(time: str) -> bool:
+            return lower <= float(time) + chunk.start < upper
+
+        words = _chunk_words(transcript, chunk.start)
+        if index == 0:
+            mapping = {word.speaker: word.speaker for word in words if word.speaker}
+        else:
+            mapping = match_speakers(self._previous_words, words, chunk.start, self.plan.chunks[index - 1].end, self.known)
+        for word in words:
+            word.speaker = mapping.get(word.speaker, word.speaker)
+            if word.speaker and word.speaker not in self.known:
+                self.known.append(word.speaker)
+        self._previous_words = words
+
+        keep = index == 0
+        for item in transcript["results"]["items"]:
+            if "start_time" in item:
+                keep = kept(item["start_time"])
+                if keep:
+                    self.items.append(dict(item, start_time=shifted(item["start_time"]), end_time=shifted(item["end_time"])))
+            elif keep:
+                self.items.append(item)
+
+        joined = index == 0
+        for segment in transcript["results"].get("speaker_labels", {}).get("segments", []):
+            speaker = mapping.get(segment["speaker_label"], segment["speaker_label"])
+            segment_items = [{"start_time": shifted(item["start_time"]), "end_time": shifted(item["end_time"]),
+                              "speaker_label": speaker} for item in segment["items"] if kept(item["start_time"])]
+            if not segment_items:
+                continue
+            if not joined and self.segments and self.segments[-1]["speaker_label"] == speaker:
+                self.segments[-1]["items"].extend(segment_items)
+                self.segments[-1]["end_time"] = segment_items[-1]["end_time"]
+            else:
+                self.segments.append({"start_time": segment_items[0]["start_time"], "end_time": segment_items[-1]["end_time"],
+                                      "speaker_label": speaker, "items": segment_items})
+            joined = True
+        self.added += 1
+
+    def take_settled(self) -> Tuple[List[dict], List[dict]]:
+        """
+        Items and segments merged since the last call that no later chunk can change.
+
+        The last segment can still be extended by the next chunk, so it is only settled once
+        every chunk was added. Items are returned as they are merged, as the words of
+        settled segments may come from any earlier call.
+        """
+        settled = len(self.segments) if self.finished else max(len(self.segments) - 1, self._settled_segments)
+        items, segments = self.items[self._settled_items:], self.segments[self._settled_segments:settled]
+        self._settled_items, self._settled_segments = len(self.items), settled
+        return items, segments
+
+    def result(self, job_name: str) -> dict:
+        """
+        The merged Transcribe output, in the shape the formatter expects.
+        """
+        text = []
+        for item in self.items:
+            if item.get("type") == "punctuation" and text:
+                text[-1] += _content(item)
+            else:
+                text.append(_content(item))
+
+        return {
+            "jobName": job_name,
+            "results": {
+                "transcripts": [{"transcript": " ".join(text)}],
+                "speaker_labels": {"speakers": len(self.known), "segments": self.segments},
+                "items": self.items,
+            },
+            "status": "COMPLETED",
+        }
+
+
+def merge_transcripts(transcripts: List[dict], plan: LongAudioPlan, job_name: str) -> dict:
+    """
+    Merge the Transcribe outputs of the chunks of a LongAudioPlan into one Transcribe output,
+    see TranscriptMerger.
+    """
+    merger = TranscriptMerger(plan)
+    for transcript in transcripts:
+        merger.add(transcript)
+    return merger.result(job_name)
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import closing
+from typing import Callable, Optional, Tuple
+
+
+def cache_key(*parts) -> str:
+    """
+    Stable hash of JSON-serializable key parts.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of small JSON results, typically pointers to S3 objects.
+
+    The first tier is an in-process LRU. The second is a SQLite index on local disk shared
+    by every worker using the same path. Entries expire after ``max_age`` seconds, and the
+    index keeps at most ``max_entries`` entries and ``max_bytes`` total size, evicting the
+    least recently used first. Concurrent ``get_or_compute`` calls for the same key
+    run the computation once and share its result.
+
+    :param path: SQLite file of the persistent tier, None for memory only.
+    :param max_memory_entries: Size of the in-process LRU.
+    :param max_entries: Number of entries kept in the persistent index.
+    :param max_bytes: Total ``size`` of entries kept in the persistent index, None for no limit.
+    :param max_age: Seconds after which an entry is no longer used, None to keep entries forever.
+    """
+
+    def __init__(self, path: Optional[str], max_memory_entries: int = 256, max_entries: int = 10000,
+                 max_bytes: Optional[int] = None, max_age: Optional[float] = 30 * 24 * 3600):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with closing(self._connect()) as connection, connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                                   "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+                connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.max_age is not None and now - created > self.max_age
+
+    def _lookup(self, key: str, validate: Optional[Callable[[dict], bool]]) -> Tuple[Optional[dict], Optional[str]]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    return value, "memory"
+                del self._memory[key]
+
+        if self.path is None:
+            return None, None
+
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or self._expired(row[1], now):
+                return None, None
+            connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        value, created = json.loads(row[0]), row[1]
+
+        if validate is not None and not validate(value):
+            self.delete(key)
+            return None, None
+        with self._lock:
+            self._remember(key, value, created)
+        return value, "persistent"
+
+    def _count(self, tier: Optional[str]):
+        with self._lock:
+            if tier == "memory":
+                self.memory_hits += 1
+            elif tier == "persistent":
+                self.persistent_hits += 1
+            elif tier == "coalesced":
+                self.coalesced += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str, validate: Optional[Callable[[dict], bool]] = None) -> Optional[dict]:
+        """
+        Look a key up in memory, then in the persistent index.
+
+        :param validate: Called on persistent hits, e.g. to check the S3 object still exists.
+            Entries it rejects are removed.
+        :return: The cached value, or None on a miss.
+        """
+        value, tier = self._lookup(key, validate)
+        self._count(tier)
+        return value
+
+    def put(self, key: str, value: dict, size: int = 0):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if self.path is not None:
+            with closing(self._connect()) as connection, connection:
+                connection.execute("INSERT OR REPLACE INTO entries (key, value, size, created, accessed) "
+                                   "VALUES (?, ?, ?, ?, ?)", (key, json.dumps(value), size, now, now))
+                self._evict(connection, now)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.path is not None:
+            with closing(self._connect()) as connection, connection:
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def get_or_compute(self, key: str, compute: Callable[[], Tuple[dict, int]],
+                       validate: Optional[Callable[[dict], bool]] = None) -> Tuple[dict, bool]:
+        """
+        Return the cached value for key, computing and storing it on a miss.
+
+        If another thread is already computing the same key, wait for its result instead.
+
+        :param compute: Returns ``(value, size)``. Exceptions are not cached.
+        :return: ``(value, hit)`` where hit is False only for the caller that ran compute.
+        """
+        value, tier = self._lookup(key, validate)
+        if value is not None:
+            self._count(tier)
+            return value, True
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+
+        self._count(None if owner else "coalesced")
+        if not owner:
+            return future.result(), True
+
+        try:
+            value, size = compute()
+            self.put(key, value, size)
+            future.set_result(value)
+            return value, False
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _remember(self, key: str, value: dict, created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, connection, now: float):
+        if self.max_age is not None:
+            connection.execute("DELETE FROM entries WHERE created < ?", (now - self.max_age,))
+        connection.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed DESC "
+                           "LIMIT -1 OFFSET ?)", (self.max_entries,))
+        if self.max_bytes is not None:
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                rows = connection.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall()
+                evicted = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((key,))
+                    total -= size
+                connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.persistent_hits + self.coalesced
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+            }
+
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def get_shared_cache(path: str, **kwargs) -> ResultCache:
+    """
+    Return the process-wide ResultCache stored at path, creating it with kwargs on first use.
+    """
+    cache = _shared_caches.get(path)
+    if cache is None:
+        with _shared_caches_lock:
+            cache = _shared_caches.get(path)
+            if cache is None:
+                cache = _shared_caches[path] = ResultCache(path, **kwargs)
+    return cache
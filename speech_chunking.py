@@ -0,0 +1,170 @@
+import re
+from typing import List, Tuple
+
+# Polly's synchronous limit is 3000 billed characters and 6000 characters including SSML tags
+DEFAULT_MAX_CHARACTERS = 3000
+
+# Cut priorities, a higher value is a more natural place to split
+WORD = 1
+SENTENCE = 2
+PARAGRAPH = 3
+
+TAG_PATTERN = re.compile(r"<!--.*?-->|<[^>]*>", re.DOTALL)
+TAG_NAME_PATTERN = re.compile(r"<\s*/?\s*([^\s/>]+)")
+WORD_PATTERN = re.compile(r"\S+\s*|\s+")
+SENTENCE_END_PATTERN = re.compile(r"[.!?;:][\"')\]]*\s*$")
+# Longest XML entity a hard cut must not split, e.g. &#x1F600;
+MAX_ENTITY_LENGTH = 10
+
+# Elements that read as a unit and must not be split
+ATOMIC_TAGS = {"say-as", "sub", "phoneme", "w"}
+PARAGRAPH_TAGS = {"p", "speak"}
+SENTENCE_TAGS = {"s"}
+
+
+class _Piece:
+    __slots__ = ("text", "kind", "name", "priority")
+
+    def __init__(self, text: str, kind: str = "text", name: str = None, priority: int = 0):
+        self.text = text
+        self.kind = kind
+        self.name = name
+        self.priority = priority
+
+
+def _text_pieces(text: str, paragraphs: bool) -> List[_Piece]:
+    pieces = []
+    for match in WORD_PATTERN.finditer(text):
+        word = match.group(0)
+        if paragraphs and word.count("\n") >= 2:
+            priority = PARAGRAPH
+        elif SENTENCE_END_PATTERN.search(word) and word[-1:].isspace():
+            priority = SENTENCE
+        elif word[-1:].isspace():
+            priority = WORD
+        else:
+            priority = 0
+        pieces.append(_Piece(word, priority=priority))
+    return pieces
+
+
+def _ssml_pieces(ssml: str) -> List[_Piece]:
+    pieces = []
+    position = 0
+    for match in TAG_PATTERN.finditer(ssml):
+        if match.start() > position:
+            pieces.extend(_text_pieces(ssml[position:match.start()], paragraphs=False))
+        tag = match.group(0)
+        position = match.end()
+        if tag.startswith("<!--") or tag.startswith("<?") or tag.startswith("<!"):
+            if not tag.startswith("<?"):
+                pieces.append(_Piece(tag, kind="other"))
+            continue
+        name = TAG_NAME_PATTERN.match(tag).group(1)
+        if tag.startswith("</"):
+            priority = PARAGRAPH if name in PARAGRAPH_TAGS else SENTENCE if name in SENTENCE_TAGS else 0
+            pieces.append(_Piece(tag, kind="close", name=name, priority=priority))
+        elif tag.endswith("/>"):
+            pieces.append(_Piece(tag, kind="empty", name=name, priority=PARAGRAPH if name == "break" else 0))
+        else:
+            pieces.append(_Piece(tag, kind="open", name=name))
+    if position < len(ssml):
+        pieces.extend(_text_pieces(ssml[position:], paragraphs=False))
+    return pieces
+
+
+def _stacks(pieces: List[_Piece]) -> List[Tuple[_Piece, ...]]:
+    """
+    Open elements after each piece, outermost first.
+    """
+    stacks = []
+    stack: Tuple[_Piece, ...] = ()
+    for piece in pieces:
+        if piece.kind == "open":
+            stack = stack + (piece,)
+        elif piece.kind == "close":
+            for depth in range(len(stack) - 1, -1, -1):
+                if stack[depth].name == piece.name:
+                    stack = stack[:depth]
+                    break
+        stacks.append(stack)
+    return stacks
+
+
+def _closing(stack: Tuple[_Piece, ...]) -> str:
+    return "".join(f"</{piece.name}>" for piece in reversed(stack))
+
+
+def _split(pieces: List[_Piece], max_characters: int) -> List[str]:
+    pieces = list(pieces)
+    stacks = _stacks(pieces)
+    chunks = []
+    start = 0
+    while start < len(pieces):
+        opening_stack = stacks[start - 1] if start > 0 else ()
+        opening = "".join(piece.text for piece in opening_stack)
+        length = len(opening)
+        candidates = []
+        end = start
+        while end < len(pieces):
+            piece = pieces[end]
+            if end > start and length + len(piece.text) + len(_closing(stacks[end])) > max_characters:
+                break
+            length += len(piece.text)
+            stack = stacks[end]
+            if piece.priority and not any(open_piece.name in ATOMIC_TAGS for open_piece in stack):
+                candidates.append((piece.priority, length, end))
+            end += 1
+
+        if end == start + 1 and pieces[start].kind == "text" and length + len(_closing(stacks[start])) > max_characters:
+            # A run without whitespace longer than a chunk, cut it at the limit
+            piece = pieces[start]
+            size = max(max_characters - len(opening) - len(_closing(stacks[start])), 1)
+            # Cut before an entity the limit falls into, so &amp; does not become &a + mp;
+            entity = piece.text.rfind("&", max(size - MAX_ENTITY_LENGTH + 1, 0), size)
+            if entity > 0 and ";" not in piece.text[entity:size]:
+                size = entity
+            if size < len(piece.text):
+                pieces[start:start + 1] = [_Piece(piece.text[:size]), _Piece(piece.text[size:], priority=piece.priority)]
+                stacks.insert(start, stacks[start])
+                end = start + 1
+
+        if end == len(pieces):
+            cut = end - 1
+        else:
+            # Prefer the most natural cut in the second half of the chunk, then anywhere
+            late = [candidate for candidate in candidates if candidate[1] >= max_characters / 2]
+            best = max(late or candidates, default=None)
+            cut = best[2] if best is not None else end - 1
+
+        body = "".join(piece.text for piece in pieces[start:cut + 1])
+        chunk = opening + body + _closing(stacks[cut])
+        if TAG_PATTERN.sub("", body).strip():
+            chunks.append(chunk)
+        start = cut + 1
+    return chunks
+
+
+def split_text(text: str, max_characters: int = DEFAULT_MAX_CHARACTERS) -> List[str]:
+    """
+    Split plain text into chunks of at most ``max_characters``, cutting at paragraph
+    breaks, then sentence ends, then whitespace, and inside a word only if it is longer
+    than a chunk.
+
+    Joining the chunks gives back the original text apart from dropped whitespace-only chunks.
+    """
+    return _split(_text_pieces(text, paragraphs=True), max_characters)
+
+
+def split_ssml(ssml: str, max_characters: int = DEFAULT_MAX_CHARACTERS) -> List[str]:
+    """
+    Split an SSML document into well-formed SSML documents of at most ``max_characters``.
+
+    Cuts go after ``</p>``, ``<break/>``, ``</s>`` or a sentence end, and fall back to
+    whitespace, then to a hard cut of text without whitespace. Elements open at a cut are
+    closed at the end of the chunk and reopened, with their original attributes, at the
+    start of the next one, so ``<speak>`` and prosody or voice settings carry over.
+    ``say-as``, ``sub``, ``phoneme`` and ``w`` elements are never split, apart from such a
+    hard cut.
+    """
+    return _split(_ssml_pieces(ssml.strip()), max_characters)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# The tool modules import superagi, use the offline stand-ins when it is not installed
+from offline_aws import install_superagi_stand_ins  # noqa: E402
+
+install_superagi_stand_ins()
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from audio_preprocessing import SAMPLE_RATE, TimeMap, detect_speech, trim
+
+
+def _tone(seconds: float, amplitude: float = 0.3) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * 32767 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+
+
+def _silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.int16)
+
+
+def test_detect_speech_drops_long_silences_with_padding():
+    samples = np.concatenate((_tone(1.0), _silence(5.0), _tone(1.0)))
+    regions = detect_speech(samples, min_silence_seconds=2.0, padding_seconds=0.3)
+    assert len(regions) == 2
+    (first_start, first_end), (second_start, second_end) = regions
+    assert first_start == 0.0
+    assert first_end == pytest.approx(1.3, abs=0.05)
+    assert second_start == pytest.approx(5.7, abs=0.05)
+    assert second_end == pytest.approx(7.0, abs=0.05)
+
+
+def test_detect_speech_keeps_short_pauses():
+    samples = np.concatenate((_tone(1.0), _silence(1.0), _tone(1.0)))
+    assert detect_speech(samples, min_silence_seconds=2.0) == [(0.0, 3.0)]
+
+
+def test_detect_speech_keeps_everything_without_voiced_frames():
+    assert detect_speech(_silence(3.0)) == [(0.0, 3.0)]
+    assert detect_speech(np.zeros(0, dtype=np.int16)) == [(0.0, 0.0)]
+
+
+def test_time_map_maps_trimmed_times_back():
+    time_map = TimeMap.from_regions([(1.0, 2.0), (5.0, 7.0)])
+    assert time_map(0.0) == 1.0
+    assert time_map(0.5) == 1.5
+    assert time_map(1.5) == 5.5
+    assert time_map(2.9) == pytest.approx(6.9)
+    np.testing.assert_allclose(time_map(np.array([0.25, 1.0, 2.0])), [1.25, 5.0, 6.0])
+
+
+def test_time_map_identity_and_serialization():
+    assert TimeMap.from_regions([])(12.5) == 12.5
+    assert TimeMap.identity()(3.0) == 3.0
+    time_map = TimeMap.from_regions([(0.5, 1.0), (3.0, 4.0)])
+    restored = TimeMap.from_dict(time_map.to_dict())
+    np.testing.assert_array_equal(restored.processed_starts, time_map.processed_starts)
+    np.testing.assert_array_equal(restored.original_starts, time_map.original_starts)
+
+
+def test_time_map_matches_trimmed_audio():
+    samples = np.concatenate((_tone(1.0), _silence(5.0), _tone(1.0)))
+    regions = detect_speech(samples)
+    trimmed = trim(samples, regions)
+    time_map = TimeMap.from_regions(regions)
+    assert len(trimmed) / SAMPLE_RATE == pytest.approx(sum(end - start for start, end in regions), abs=1e-3)
+    # The start of the second tone in the trimmed audio maps to where it is in the original
+    second = int((regions[0][1] - regions[0][0]) * SAMPLE_RATE)
+    assert time_map(second / SAMPLE_RATE) == pytest.approx(regions[1][0], abs=1e-3)
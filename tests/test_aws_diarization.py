@@ -0,0 +1,154 @@
+import os
+from unittest import mock
+
+import pytest
+
+import long_audio
+from long_audio import AudioChunk, LongAudioPlan
+from offline_aws import OfflineAWS, offline_environment, prepare_tool, put_audio, transcript_json_factory
+
+
+@pytest.fixture
+def aws(tmp_path):
+    aws = OfflineAWS(transcript_json_factory(200), job_latency=0.05)
+    with offline_environment(aws, str(tmp_path)):
+        yield aws
+
+
+def make_tool(aws, agent_execution_id: int):
+    from aws_diarization import AWSDiarizationTool
+
+    tool = prepare_tool(AWSDiarizationTool(), aws)
+    tool.min_expected_job_seconds = 0.05
+    tool.job_seconds_per_audio_second = 0.0
+    tool.agent_execution_id = tool.resource_manager.agent_execution_id = agent_execution_id
+    return tool
+
+
+def test_cache_hit_from_another_execution_gets_its_own_files(aws, tmp_path):
+    from aws_helpers import ensure_path
+    from superagi.helper.resource_helper import ResourceHelper
+
+    first = make_tool(aws, 1)
+    put_audio(aws, first.job_uri(ensure_path("calls", True), "meeting.mp3"))
+    registered = []
+
+    def register(file_name, agent, agent_execution, session):
+        registered.append((agent_execution.id, file_name))
+
+    def split(s3_client, bucket, key, *args, **kwargs):
+        # One chunk covering the whole recording, decoding audio needs ffmpeg
+        return LongAudioPlan([AudioChunk(f"s3://{bucket}/{key}", 0.0, 1e9)], [], None)
+
+    with mock.patch.object(ResourceHelper, "make_written_file_resource", staticmethod(register)), \
+            mock.patch.object(long_audio, "split_s3_audio", split):
+        original = first.diarize("calls/meeting.mp3", output_format="text,srt", progress=lambda lines: None)
+        second = make_tool(aws, 2)
+        written = []
+        write_to_s3 = second.resource_manager.write_to_s3
+        second.resource_manager.write_to_s3 = lambda file_name, final_path: (written.append(file_name),
+                                                                            write_to_s3(file_name, final_path))
+        hit = second.diarize("calls/meeting.mp3", output_format="text,srt", progress=lambda lines: None)
+
+    assert aws.transcribe.call_count("start_transcription_job") == 1
+    assert hit["transcript_uri"] != original["transcript_uri"]
+    assert set(hit["transcript_files"]).isdisjoint(original["transcript_files"])
+    for transcript_file in hit["transcript_files"]:
+        assert os.path.basename(transcript_file) in hit["result"]
+    assert os.path.basename(original["transcript_file"]) not in hit["result"]
+
+    # The copied raw output and the transcripts are resources of the second execution
+    assert os.path.basename(hit["transcript_uri"]) in {file_name for execution, file_name in registered if execution == 2}
+    assert set(hit["transcript_files"]) | {hit["transcript_file"] + ".partial"} == set(written)
+
+    # Same content, and the .partial file is named after this request's transcript
+    def read(name):
+        return (tmp_path / os.path.basename(name)).read_text()
+
+    assert read(hit["transcript_files"][1]) == read(original["transcript_files"][1])
+    assert (tmp_path / (os.path.basename(hit["transcript_file"]) + ".partial")).exists()
+
+
+def test_status_checks_follow_the_length_of_the_audio(aws):
+    from aws_diarization import AWSDiarizationTool
+    from aws_helpers import ensure_path
+
+    tool = prepare_tool(AWSDiarizationTool(), aws)
+    # 20 seconds of audio at the assumed 128 kbit/s
+    put_audio(aws, tool.job_uri(ensure_path("calls", True), "short.mp3"), size=20 * 16000)
+    expected = []
+    wait_job = AWSDiarizationTool.wait_job
+
+    def record_wait(self, job_name, expected_seconds):
+        expected.append(expected_seconds)
+        return wait_job(self, job_name, 0.05)
+
+    with mock.patch.object(AWSDiarizationTool, "wait_job", record_wait):
+        tool.diarize("calls/short.mp3", bypass_cache=True)
+
+    assert tool.expected_job_seconds(20) == 16.0
+    assert expected[0] == pytest.approx(16.0, abs=0.5)
+
+    chunks = LongAudioPlan([AudioChunk("s3://bucket/a", 0.0, 100.0), AudioChunk("s3://bucket/b", 80.0, 120.0)], [90.0], None)
+    expected.clear()
+    with mock.patch.object(AWSDiarizationTool, "wait_job", record_wait), \
+            mock.patch.object(long_audio, "split_s3_audio", lambda *args, **kwargs: chunks):
+        tool.diarize("calls/short.mp3", bypass_cache=True, long_audio=True)
+    assert expected == pytest.approx([40.0, 22.0], abs=0.5)
+
+
+def test_preprocessed_audio_is_deleted_after_the_job(aws):
+    import audio_preprocessing
+    from audio_preprocessing import PreprocessedAudio, TimeMap
+    from aws_helpers import derived_key, ensure_path
+
+    tool = make_tool(aws, 1)
+    job_uri = tool.job_uri(ensure_path("calls", True), "meeting.mp3")
+    put_audio(aws, job_uri)
+    bucket, key = job_uri[len("s3://"):].split("/", 1)
+
+    def preprocess(s3_client, bucket, key, **kwargs):
+        # Stands in for decoding with ffmpeg
+        processed_key = derived_key(key, ".preprocessed.flac")
+        s3_client.put_object(Bucket=bucket, Key=processed_key, Body=b"flac")
+        return PreprocessedAudio(f"s3://{bucket}/{processed_key}", TimeMap.identity(), 60.0, 30.0, 1 << 20, 4)
+
+    with mock.patch.object(audio_preprocessing, "preprocess_s3_audio", preprocess):
+        tool.diarize("calls/meeting.mp3", preprocess_audio=True)
+
+    assert (bucket, derived_key(key, ".preprocessed.flac")) not in aws.s3.objects
+    assert (bucket, key) in aws.s3.objects
+
+
+def test_batch_glob_skips_derived_audio(aws):
+    from aws_batch_diarization import AWSBatchDiarizationTool
+    from aws_helpers import ensure_path
+
+    tool = prepare_tool(AWSBatchDiarizationTool(), aws)
+    prefix = ensure_path("calls", True)
+    for name in ("a.mp3", "b.mp3", "_derived/a.preprocessed.flac", "_derived/b.chunk000.flac", "a.chunk000.flac"):
+        put_audio(aws, tool.job_uri(prefix, name), size=1)
+    assert tool.expand_target_files(["calls/*"]) == ["calls/a.mp3", "calls/b.mp3"]
+
+
+def test_chunk_audio_is_deleted_after_the_merge(aws):
+    from aws_helpers import derived_key, ensure_path
+
+    tool = make_tool(aws, 1)
+    job_uri = tool.job_uri(ensure_path("calls", True), "meeting.mp3")
+    put_audio(aws, job_uri)
+    bucket, key = job_uri[len("s3://"):].split("/", 1)
+    chunk_keys = [derived_key(key, f".chunk{index:03d}.flac") for index in range(2)]
+
+    def split(s3_client, bucket, key, *args, **kwargs):
+        # Stands in for decoding with ffmpeg
+        for chunk_key in chunk_keys:
+            s3_client.put_object(Bucket=bucket, Key=chunk_key, Body=b"flac")
+        return LongAudioPlan([AudioChunk(f"s3://{bucket}/{chunk_keys[0]}", 0.0, 100.0),
+                              AudioChunk(f"s3://{bucket}/{chunk_keys[1]}", 80.0, 1e9)], [90.0], None)
+
+    with mock.patch.object(long_audio, "split_s3_audio", split):
+        tool.diarize("calls/meeting.mp3", long_audio=True)
+
+    assert not any((bucket, chunk_key) in aws.s3.objects for chunk_key in chunk_keys)
+    assert (bucket, key) in aws.s3.objects
@@ -0,0 +1,70 @@
+import pytest
+
+import aws_helpers
+import tracing
+from offline_aws import FakeFileManager, FakeS3, FakeSession, OfflineAWS, offline_environment
+from tracing import MemorySink, set_sink
+
+from aws_helpers import configure_tracing, delete_s3_objects, derived_key, is_derived_key, write_file_lines
+
+
+def test_derived_key_goes_to_the_derived_folder():
+    assert derived_key("resources/calls/a.mp3", ".preprocessed.flac") == "resources/calls/_derived/a.preprocessed.flac"
+    assert derived_key("a.b.wav", ".chunk000.flac") == "_derived/a.b.chunk000.flac"
+
+
+def test_is_derived_key():
+    assert is_derived_key("calls/_derived/a.preprocessed.flac")
+    assert is_derived_key("calls/a.chunk012.flac")
+    assert is_derived_key("calls/a.preprocessed.flac")
+    assert not is_derived_key("calls/a.flac")
+    assert not is_derived_key("calls/_derived.mp3")
+
+
+def test_delete_s3_objects_ignores_missing_objects():
+    s3 = FakeS3()
+    s3.put("bucket", "calls/_derived/a.flac", b"a")
+    s3.put("other", "b.flac", b"b")
+    s3.put("bucket", "calls/a.mp3", b"c")
+    delete_s3_objects(s3, ["s3://bucket/calls/_derived/a.flac", "https://s3.us-east-1.amazonaws.com/other/b.flac",
+                           "s3://bucket/missing.flac"])
+    assert list(s3.objects) == [("bucket", "calls/a.mp3")]
+
+
+@pytest.fixture
+def sink():
+    sink = MemorySink()
+    set_sink(sink)
+    yield sink
+    set_sink(None)
+
+
+def test_configure_tracing_reads_the_trace_file_key(tmp_path, monkeypatch):
+    trace_file = str(tmp_path / "trace.jsonl")
+    config = {"TEXT_SPEECH_TRACE_FILE": trace_file}
+    monkeypatch.setattr(aws_helpers, "get_config", lambda key, default=None: config.get(key, default))
+    monkeypatch.setattr(aws_helpers, "_tracing_configured", False)
+    try:
+        configure_tracing()
+        sink = tracing.get_sink()
+        assert isinstance(sink, tracing.JsonLinesSink)
+        assert sink.path == trace_file
+        sink.close()
+    finally:
+        set_sink(None)
+
+    # The key is only read once
+    configure_tracing()
+    assert tracing.get_sink() is None
+
+
+def test_write_file_lines_counts_only_the_bytes_it_writes(tmp_path, sink):
+    aws = OfflineAWS(lambda job_name: "{}")
+    with offline_environment(aws, str(tmp_path)):
+        resource_manager = FakeFileManager(aws.s3, "bucket", FakeSession())
+        write_file_lines(resource_manager, "notes.txt", ["a" * 100, "\n"])
+        write_file_lines(resource_manager, "notes.txt", ["b" * 20, "\n"], append=True)
+        write_file_lines(resource_manager, "fresh.txt", ["c" * 5], append=True)
+
+    assert (tmp_path / "notes.txt").read_text() == "a" * 100 + "\n" + "b" * 20 + "\n"
+    assert sink.counters["bytes_written"] == 101 + 21 + 5
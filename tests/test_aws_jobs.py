@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+import aws_jobs
+from aws_jobs import TRANSCRIPTION_JOB, JobWaiter, _Job
+
+
+class FakeTranscribe:
+    """
+    Transcription jobs that complete ``latency`` seconds after they are created. Listing returns
+    at most MaxResults jobs, the most recently created first, like the real API.
+    """
+
+    def __init__(self, latency: float = 0.2, failing: bool = False):
+        self.latency = latency
+        self.failing = failing
+        self.created = {}
+        self.calls = Counter()
+        self.gets = Counter()
+        self.lock = threading.Lock()
+
+    def create(self, job_name: str, latency: float = None):
+        self.created[job_name] = time.monotonic() + (self.latency if latency is None else latency)
+
+    def _status(self, job_name: str) -> str:
+        return "COMPLETED" if time.monotonic() >= self.created[job_name] else "IN_PROGRESS"
+
+    def get_transcription_job(self, TranscriptionJobName):
+        with self.lock:
+            self.calls["get"] += 1
+            self.gets[TranscriptionJobName] += 1
+        if self.failing:
+            raise ConnectionError("throttled")
+        return {"TranscriptionJob": {"TranscriptionJobName": TranscriptionJobName,
+                                     "TranscriptionJobStatus": self._status(TranscriptionJobName),
+                                     "Transcript": {"TranscriptFileUri": f"s3://bucket/{TranscriptionJobName}.json"}}}
+
+    def list_transcription_jobs(self, MaxResults=100, JobNameContains=""):
+        with self.lock:
+            self.calls["list"] += 1
+        names = [name for name in reversed(list(self.created)) if JobNameContains in name][:MaxResults]
+        return {"TranscriptionJobSummaries": [{"TranscriptionJobName": name, "TranscriptionJobStatus": self._status(name)}
+                                              for name in names]}
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(aws_jobs.random, "uniform", lambda low, high: 1.0)
+
+
+def test_first_check_at_half_the_expected_duration(no_jitter):
+    waiter = JobWaiter(min_interval=0.25, max_interval=15.0)
+    assert waiter._first_delay(_Job(TRANSCRIPTION_JOB, None, "job", 10.0, None)) == 5.0
+    assert waiter._first_delay(_Job(TRANSCRIPTION_JOB, None, "job", 0.1, None)) == 0.25
+    assert waiter._first_delay(_Job(TRANSCRIPTION_JOB, None, "job", 600.0, None)) == 15.0
+
+
+def test_overdue_jobs_back_off_exponentially(no_jitter):
+    waiter = JobWaiter(min_interval=0.25, max_interval=2.0)
+    job = _Job(TRANSCRIPTION_JOB, None, "job", 3.0, None)
+    assert waiter._next_delay(job) == pytest.approx(1.5, rel=0.01)
+
+    job.started -= 20
+    assert [waiter._next_delay(job) for _ in range(7)] == \
+        [0.25, 0.375, 0.5625, 0.84375, 1.265625, 1.8984375, 2.0]
+
+
+def test_delays_are_jittered():
+    waiter = JobWaiter()
+    delays = {waiter._first_delay(_Job(TRANSCRIPTION_JOB, None, "job", 10.0, None)) for _ in range(50)}
+    assert all(4.0 <= delay <= 6.0 for delay in delays)
+    assert len(delays) > 1
+
+
+def test_due_jobs_share_list_calls_and_unlisted_jobs_are_fetched():
+    client = FakeTranscribe(latency=0.3)
+    job_names = [f"job-{index:03d}" for index in range(150)]
+    for job_name in job_names:
+        client.create(job_name)
+    waiter = JobWaiter(min_interval=0.05, coalesce_window=0.5)
+
+    futures = [waiter.wait_transcription_job(client, job_name, expected_duration=0.1) for job_name in job_names]
+    results = [future.result(timeout=10) for future in futures]
+
+    assert [result["TranscriptionJob"]["TranscriptionJobName"] for result in results] == job_names
+    assert all(result["TranscriptionJob"]["TranscriptionJobStatus"] == "COMPLETED" for result in results)
+    assert client.calls["list"] >= 1
+    # The 100 newest jobs are listed, their full record is only fetched once they completed
+    assert all(client.gets[job_name] == 1 for job_name in job_names[50:])
+    # The older ones are not on the page, so they are also fetched while still in progress
+    assert all(client.gets[job_name] >= 2 for job_name in job_names[:50])
+
+
+def test_single_due_job_is_fetched_directly():
+    client = FakeTranscribe(latency=0.0)
+    client.create("job")
+    waiter = JobWaiter(min_interval=0.05)
+    assert waiter.wait_transcription_job(client, "job", expected_duration=0.1).result(timeout=5)
+    assert client.calls["list"] == 0 and client.calls["get"] == 1
+
+
+def test_timeout_fails_the_future():
+    client = FakeTranscribe(latency=60)
+    client.create("job")
+    waiter = JobWaiter(min_interval=0.05, max_interval=0.1)
+    started = time.monotonic()
+    future = waiter.wait_transcription_job(client, "job", expected_duration=10, timeout=0.3)
+    with pytest.raises(TimeoutError, match="still IN_PROGRESS"):
+        future.result(timeout=5)
+    # The check is moved up to the deadline instead of waiting for the expected duration
+    assert time.monotonic() - started < 2
+
+
+def test_repeated_errors_fail_the_future():
+    client = FakeTranscribe(failing=True)
+    client.create("job")
+    waiter = JobWaiter(min_interval=0.01, max_interval=0.02, max_errors=3)
+    with pytest.raises(ConnectionError):
+        waiter.wait_transcription_job(client, "job", expected_duration=0.0).result(timeout=5)
+    assert client.calls["get"] == 3
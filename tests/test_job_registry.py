@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+
+from job_registry import COMPLETED, FAILED, IN_PROGRESS, JobRegistry, execution_key
+
+EXECUTION = execution_key(1, 1)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return JobRegistry(str(tmp_path / "jobs.sqlite"), max_active_jobs=3, poll_interval=0.01)
+
+
+def submitter(job_id: str, calls: list = None):
+    def submit():
+        if calls is not None:
+            calls.append(job_id)
+        return job_id, {"job": job_id}
+    return submit
+
+
+def test_retry_reattaches_to_running_and_completed_jobs(registry):
+    calls = []
+    record, attached = registry.submit("transcription", EXECUTION, "f", {}, submitter("job-1", calls))
+    assert not attached and record.status == IN_PROGRESS
+
+    again, attached = registry.submit("transcription", EXECUTION, "f", {}, submitter("job-2", calls))
+    assert attached and again.job_id == "job-1" and again.output == {"job": "job-1"}
+
+    registry.finish(record, COMPLETED)
+    again, attached = registry.submit("transcription", EXECUTION, "f", {}, submitter("job-2", calls))
+    assert attached and again.status == COMPLETED
+    assert calls == ["job-1"]
+
+
+def test_no_reattach_across_executions_inputs_or_when_not_reusing(registry):
+    calls = []
+    record, _ = registry.submit("transcription", EXECUTION, "f", {}, submitter("job-1", calls))
+    registry.finish(record, COMPLETED)
+    for execution, fingerprint, job_id, reuse_completed in ((execution_key(1, 2), "f", "job-2", True),
+                                                            (EXECUTION, "g", "job-3", True),
+                                                            (EXECUTION, "f", "job-4", False),
+                                                            (None, "f", "job-5", True)):
+        record, attached = registry.submit("transcription", execution, fingerprint, {}, submitter(job_id, calls),
+                                           reuse_completed, timeout=1)
+        assert not attached
+        registry.finish(record, COMPLETED)
+    assert calls == ["job-1", "job-2", "job-3", "job-4", "job-5"]
+
+
+def test_failed_jobs_are_resubmitted(registry):
+    record, _ = registry.submit("transcription", EXECUTION, "f", {}, submitter("job-1"))
+    registry.finish(record, FAILED)
+    record, attached = registry.submit("transcription", EXECUTION, "f", {}, submitter("job-2"))
+    assert not attached and record.job_id == "job-2"
+
+
+def test_cap_counts_every_slot_of_a_submission(registry):
+    registry.submit("transcription", None, "a", {}, submitter("job-1"), slots=2)
+    assert registry.active_slots() == 2
+    with pytest.raises(TimeoutError):
+        registry.submit("transcription", None, "b", {}, submitter("job-2"), timeout=0.05, slots=2)
+    registry.submit("transcription", None, "c", {}, submitter("job-3"), timeout=0.05)
+    assert registry.active_slots() == 3
+
+
+def test_oversized_submission_runs_alone(registry):
+    first, _ = registry.submit("transcription", None, "a", {}, submitter("job-1"))
+    with pytest.raises(TimeoutError):
+        registry.submit("transcription", None, "b", {}, submitter("job-2"), timeout=0.05, slots=5)
+    registry.finish(first, COMPLETED)
+    record, _ = registry.submit("transcription", None, "b", {}, submitter("job-2"), timeout=0.05, slots=5)
+    assert registry.active_slots() == 5
+    registry.finish(record, COMPLETED)
+    assert registry.active_slots() == 0
+
+
+def test_waiting_submission_starts_when_a_slot_frees(registry):
+    record, _ = registry.submit("transcription", None, "a", {}, submitter("job-1"), slots=3)
+    threading.Timer(0.1, registry.finish, (record, COMPLETED)).start()
+    started = time.monotonic()
+    registry.submit("transcription", None, "b", {}, submitter("job-2"), timeout=5)
+    assert time.monotonic() - started >= 0.05
+
+
+def test_release_frees_slots_but_keeps_the_job(registry):
+    record, _ = registry.submit("transcription", EXECUTION, "f", {}, submitter("job-1"), slots=3)
+    registry.release(record)
+    assert registry.active_slots() == 0
+    again, attached = registry.submit("transcription", EXECUTION, "f", {}, submitter("job-2"), timeout=0.05)
+    assert attached and again.job_id == "job-1" and again.status == IN_PROGRESS
+
+
+def test_failed_submit_frees_its_slot(registry):
+    def fail():
+        raise RuntimeError("throttled")
+
+    with pytest.raises(RuntimeError):
+        registry.submit("transcription", EXECUTION, "f", {}, fail, slots=3)
+    assert registry.active_slots() == 0
+    assert registry.jobs(EXECUTION) == []
+
+
+def test_stale_jobs_free_their_slots_and_are_not_reattached(tmp_path):
+    registry = JobRegistry(str(tmp_path / "jobs.sqlite"), max_active_jobs=1, stale_after=0.1, poll_interval=0.01)
+    registry.submit("transcription", EXECUTION, "f", {}, submitter("job-1"))
+    assert registry.active_slots() == 1
+    time.sleep(0.2)
+    assert registry.active_slots() == 0
+    assert registry.find("transcription", EXECUTION, "f") is None
+    record, attached = registry.submit("transcription", EXECUTION, "f", {}, submitter("job-2"), timeout=0.05)
+    assert not attached and record.job_id == "job-2"
+
+
+def test_registry_is_shared_through_its_file(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    JobRegistry(path, max_active_jobs=1).submit("transcription", EXECUTION, "f", {}, submitter("job-1"))
+    other = JobRegistry(path, max_active_jobs=1, poll_interval=0.01)
+    assert other.find("transcription", EXECUTION, "f").job_id == "job-1"
+    with pytest.raises(TimeoutError):
+        other.submit("transcription", EXECUTION, "g", {}, submitter("job-2"), timeout=0.05)
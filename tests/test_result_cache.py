@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from result_cache import ResultCache, cache_key
+
+
+def test_cache_key_is_stable_and_order_sensitive():
+    assert cache_key("a", {"x": 1, "y": 2}) == cache_key("a", {"y": 2, "x": 1})
+    assert cache_key("a", "b") != cache_key("b", "a")
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(None, max_memory_entries=2)
+    cache.put("a", {"v": "a"})
+    cache.put("b", {"v": "b"})
+    assert cache.get("a") == {"v": "a"}
+    cache.put("c", {"v": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": "a"}
+    assert cache.get("c") == {"v": "c"}
+
+
+def test_persistent_tier_is_shared_and_evicts_by_count(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResultCache(path, max_entries=2)
+    for key in "abc":
+        cache.put(key, {"v": key})
+        time.sleep(0.01)
+
+    other = ResultCache(path, max_entries=2)
+    assert other.get("a") is None
+    assert other.get("b") == {"v": "b"}
+    assert other.get("c") == {"v": "c"}
+    assert other.stats()["persistent_hits"] == 2
+
+
+def test_persistent_tier_evicts_by_size(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResultCache(path, max_bytes=100)
+    cache.put("a", {"v": "a"}, size=60)
+    time.sleep(0.01)
+    cache.put("b", {"v": "b"}, size=60)
+
+    other = ResultCache(path)
+    assert other.get("a") is None
+    assert other.get("b") == {"v": "b"}
+
+
+def test_expired_and_invalid_entries_are_misses(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResultCache(path, max_age=0.05)
+    cache.put("a", {"v": "a"})
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+    cache = ResultCache(path)
+    cache.put("b", {"v": "b"})
+    other = ResultCache(path)
+    assert other.get("b", validate=lambda value: False) is None
+    assert ResultCache(path).get("b") is None
+
+
+def test_get_or_compute_coalesces_concurrent_calls(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {"v": 1}, 0
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 5
+    while cache.stats()["coalesced"] < 7 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [value for value, _ in results] == [{"v": 1}] * 8
+    assert sorted(hit for _, hit in results) == [False] + [True] * 7
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_get_or_compute_does_not_cache_errors():
+    cache = ResultCache(None)
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute("k", fail)
+    assert cache.get_or_compute("k", lambda: ({"v": 2}, 0)) == ({"v": 2}, False)
+    assert cache.get_or_compute("k", fail) == ({"v": 2}, True)
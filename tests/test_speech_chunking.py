@@ -0,0 +1,81 @@
+import re
+import xml.etree.ElementTree as ElementTree
+
+from speech_chunking import split_ssml, split_text
+
+
+def _text(ssml: str) -> str:
+    return " ".join(re.sub(r"<[^>]*>", " ", ssml).split())
+
+
+def test_split_text_round_trips_and_respects_limit():
+    text = "\n\n".join(" ".join(f"Sentence {i} of paragraph {p} goes on for a while." for i in range(20))
+                       for p in range(10))
+    chunks = split_text(text, 500)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert "".join(chunks) == text
+
+
+def test_split_text_prefers_sentence_ends():
+    text = " ".join(f"This is sentence number {i}." for i in range(100))
+    for chunk in split_text(text, 300)[:-1]:
+        assert chunk.rstrip().endswith(".")
+
+
+def test_split_text_hard_cuts_runs_without_whitespace():
+    chunks = split_text("x" * 5000, 3000)
+    assert [len(chunk) for chunk in chunks] == [3000, 2000]
+
+    text = "Start. " + "y" * 7000 + " end."
+    chunks = split_text(text, 3000)
+    assert all(len(chunk) <= 3000 for chunk in chunks)
+    assert "".join(chunks) == text
+
+
+def test_split_ssml_chunks_are_well_formed_and_reopen_elements():
+    body = "".join(f"<p>Paragraph {i}. " + "Some words to read out loud. " * 8 + "</p>" for i in range(20))
+    ssml = f'<speak><prosody rate="slow">{body}</prosody></speak>'
+    chunks = split_ssml(ssml, 600)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= 600
+        root = ElementTree.fromstring(chunk)
+        assert root.tag == "speak"
+        assert root[0].tag == "prosody" and root[0].get("rate") == "slow"
+    assert _text(" ".join(chunks)) == _text(ssml)
+
+
+def test_split_ssml_keeps_atomic_elements_whole():
+    say_as = '<say-as interpret-as="characters">' + " ".join("abcdefghij") + "</say-as>"
+    ssml = "<speak>" + ("Read this out. " + say_as + " ") * 30 + "</speak>"
+    for chunk in split_ssml(ssml, 200):
+        ElementTree.fromstring(chunk)
+        assert chunk.count("<say-as") == chunk.count("</say-as>")
+        for match in re.finditer(r"<say-as[^>]*>(.*?)</say-as>", chunk):
+            assert match.group(1) == " ".join("abcdefghij")
+
+
+def test_split_ssml_hard_cuts_runs_without_whitespace():
+    ssml = '<speak><prosody rate="slow">' + "z" * 5000 + " tail.</prosody></speak>"
+    chunks = split_ssml(ssml, 3000)
+    assert all(len(chunk) <= 3000 for chunk in chunks)
+    for chunk in chunks:
+        ElementTree.fromstring(chunk)
+    assert _text("".join(re.sub(r"<[^>]*>", "", chunk) for chunk in chunks)) == "z" * 5000 + " tail."
+
+
+def test_short_input_is_one_chunk():
+    assert split_text("Hello there.") == ["Hello there."]
+    assert split_ssml("<speak>Hello there.</speak>") == ["<speak>Hello there.</speak>"]
+    assert split_text("   ") == []
+
+
+def test_hard_cut_does_not_split_entities():
+    run = "R&amp;D&#x1F600;&lt;" * 400
+    for max_characters in range(100, 140):
+        chunks = split_ssml(f"<speak>{run}</speak>", max_characters)
+        assert all(len(chunk) <= max_characters for chunk in chunks)
+        for chunk in chunks:
+            ElementTree.fromstring(chunk)
+        assert "".join(re.sub(r"</?speak>", "", chunk) for chunk in chunks) == run
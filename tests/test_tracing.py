@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+import tracing
+from tracing import JsonLinesSink, MemorySink, configure, count, record, set_sink, span, timed_iter
+
+
+@pytest.fixture
+def sink():
+    sink = MemorySink()
+    set_sink(sink)
+    yield sink
+    set_sink(None)
+
+
+def test_nested_spans_are_recorded_inner_first(sink):
+    with span("outer", service="s3") as outer:
+        with span("inner"):
+            pass
+        outer.set(status="ok")
+
+    assert [name for name, _, _, _ in sink.spans] == ["inner", "outer"]
+    (_, inner_start, inner_duration, _), (_, outer_start, outer_duration, attributes) = sink.spans
+    assert outer_start <= inner_start
+    assert 0 <= inner_duration <= outer_duration
+    assert attributes == {"service": "s3", "status": "ok"}
+
+
+def test_span_records_the_error_and_reraises(sink):
+    with pytest.raises(ValueError):
+        with span("job_submit", kind="transcribe"):
+            raise ValueError("boom")
+    assert sink.spans[0][0] == "job_submit"
+    assert sink.spans[0][3] == {"kind": "transcribe", "error": "ValueError"}
+
+
+def test_record_count_and_timed_iter(sink):
+    record("job_wait", 2.5, kind="transcribe")
+    count("job_polls")
+    count("bytes_written", 10)
+    count("bytes_written", 5)
+    assert list(timed_iter("transcript_format", iter("abc"), format="text")) == ["a", "b", "c"]
+
+    assert sink.durations("job_wait") == [2.5]
+    assert sink.counters == {"job_polls": 1, "bytes_written": 15}
+    assert sink.spans[-1][0] == "transcript_format"
+    assert sink.spans[-1][3] == {"format": "text"}
+
+
+def test_null_sink_records_nothing():
+    assert tracing.get_sink() is None
+    first = span("outer", service="s3")
+    with first as entered:
+        entered.set(status="ok")
+        with span("inner"):
+            pass
+    assert first is span("other")
+    record("job_wait", 1.0)
+    count("job_polls")
+    items = [1, 2]
+    assert list(timed_iter("transcript_format", items)) == items
+
+
+def test_configure_enables_a_json_lines_sink(tmp_path):
+    trace_file = str(tmp_path / "trace.jsonl")
+    try:
+        assert configure(None) is None
+        sink = configure(trace_file)
+        assert isinstance(sink, JsonLinesSink)
+        assert configure(str(tmp_path / "other.jsonl")) is sink
+        with span("diarize", service="transcribe"):
+            count("job_polls", kind="transcribe")
+        sink.close()
+    finally:
+        set_sink(None)
+
+    with open(trace_file) as file:
+        records = [json.loads(line) for line in file]
+    assert [(entry["type"], entry["name"]) for entry in records] == [("counter", "job_polls"), ("span", "diarize")]
+    assert records[0]["kind"] == "transcribe"
+    assert records[1]["service"] == "transcribe"
+
+
+def test_configure_keeps_a_sink_set_in_code(sink, tmp_path):
+    assert configure(str(tmp_path / "trace.jsonl")) is sink
+    assert not (tmp_path / "trace.jsonl").exists()
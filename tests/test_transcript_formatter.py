@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+import transcript_formatter
+from bench_transcript_formatter import PRODUCED_AT, check_equivalence, legacy_process_to_text
+from synthetic_transcripts import make_transcript
+from transcript_formatter import format_transcript, iter_transcript_json_lines
+
+
+@pytest.fixture(params=["ijson", "json"])
+def json_backend(request, monkeypatch):
+    if request.param == "ijson":
+        if transcript_formatter.ijson is None:
+            pytest.skip("ijson is not installed")
+    else:
+        monkeypatch.setattr(transcript_formatter, "ijson", None)
+    return request.param
+
+
+@pytest.mark.parametrize("size", [0, 1, 50, 1000])
+@pytest.mark.parametrize("seed", range(3))
+def test_dict_and_streaming_paths_match_legacy_output(json_backend, size, seed):
+    data = make_transcript(size, seed=seed, punctuation_rate=0.4, low_confidence_rate=0.4)
+    expected = legacy_process_to_text(data).encode("utf-8")
+    source = json.dumps(data)
+
+    assert format_transcript(data, produced_at=PRODUCED_AT).encode("utf-8") == expected
+    assert "".join(iter_transcript_json_lines(source, produced_at=PRODUCED_AT)).encode("utf-8") == expected
+    assert "".join(iter_transcript_json_lines(source.encode("utf-8"), produced_at=PRODUCED_AT)).encode("utf-8") == expected
+
+
+def test_streaming_path_handles_segments_after_items(json_backend):
+    data = make_transcript(200, seed=7, punctuation_rate=0.4, low_confidence_rate=0.4)
+    results = data["results"]
+    reordered = dict(data, results={"transcripts": results["transcripts"], "items": results["items"],
+                                    "speaker_labels": results["speaker_labels"]})
+
+    assert "".join(iter_transcript_json_lines(json.dumps(reordered), produced_at=PRODUCED_AT)) == \
+        legacy_process_to_text(data)
+
+
+def test_check_equivalence_passes():
+    check_equivalence(sizes=(0, 50), seeds=range(2))
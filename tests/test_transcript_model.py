@@ -0,0 +1,143 @@
+import datetime
+import json
+
+import pytest
+
+from transcript_formatter import format_transcript
+from transcript_model import ColumnarTranscript
+
+PRODUCED_AT = datetime.datetime(2023, 7, 1, 12, 0, 0)
+
+
+def _word(content, start, end, confidence):
+    return {"type": "pronunciation", "start_time": start, "end_time": end,
+            "alternatives": [{"content": content, "confidence": confidence}]}
+
+
+def _punctuation(content):
+    return {"type": "punctuation", "alternatives": [{"content": content, "confidence": "0.0"}]}
+
+
+def _segment(speaker, start, end, words):
+    return {"speaker_label": speaker, "start_time": start, "end_time": end,
+            "items": [{"speaker_label": speaker, "start_time": word["start_time"], "end_time": word["end_time"]}
+                      for word in words]}
+
+
+HELLO = _word("Hello", "0.0", "0.5", "0.99")
+WORLD = _word("world", "0.6", "1.0", "0.5")
+AGAIN = _word("again", "1.2", "2.4996", "0.99")
+YES = _word("Yes", "2.9996", "3.5", "0.8")
+BYE = _word("Bye", "3661.2346", "3662.0", "0.99")
+
+# Three segments: a speaker change, a change back, sub-millisecond times that round up
+# to the next second, and a segment past the hour.
+TRANSCRIPT = {
+    "jobName": "golden",
+    "results": {
+        "transcripts": [{"transcript": "Hello, world. again Yes? Bye!"}],
+        "speaker_labels": {"speakers": 2, "segments": [
+            _segment("spk_0", "0.0", "2.4996", [HELLO, WORLD, AGAIN]),
+            _segment("spk_1", "2.9996", "3.5", [YES]),
+            _segment("spk_0", "3661.2346", "3662.0", [BYE]),
+        ]},
+        "items": [HELLO, _punctuation(","), WORLD, _punctuation("."), AGAIN, YES, _punctuation("?"),
+                  BYE, _punctuation("!")],
+    },
+}
+
+GOLDEN_SRT = (
+    "1\n"
+    "00:00:00,000 --> 00:00:02,500\n"
+    "spk_0: Hello, world. again\n"
+    "\n"
+    "2\n"
+    "00:00:03,000 --> 00:00:03,500\n"
+    "spk_1: Yes?\n"
+    "\n"
+    "3\n"
+    "01:01:01,235 --> 01:01:02,000\n"
+    "spk_0: Bye!\n"
+    "\n"
+)
+
+GOLDEN_VTT = (
+    "WEBVTT\n"
+    "\n"
+    "00:00:00.000 --> 00:00:02.500\n"
+    "<v spk_0>Hello, world. again\n"
+    "\n"
+    "00:00:03.000 --> 00:00:03.500\n"
+    "<v spk_1>Yes?\n"
+    "\n"
+    "01:01:01.235 --> 01:01:02.000\n"
+    "<v spk_0>Bye!\n"
+    "\n"
+)
+
+GOLDEN_JSONL = (
+    '{"speaker":"spk_0","start":0.0,"end":2.4996,"text":"Hello, world. again","low_confidence":[[0.6,1.0]]}\n'
+    '{"speaker":"spk_1","start":2.9996,"end":3.5,"text":"Yes?","low_confidence":[[2.9996,3.5]]}\n'
+    '{"speaker":"spk_0","start":3661.2346,"end":3662.0,"text":"Bye!","low_confidence":[]}\n'
+)
+
+GOLDEN_TEXT = (
+    "Transcription of golden\n"
+    "\n"
+    "Transcription using AWS Transcribe automatic speech recognition and the 'tscribe' python package.\n"
+    "Document produced on Saturday 01 July 2023 at 12:00:00.\n"
+    "\n"
+    "0:00:00 spk_0:Hello,  [world.  again] \n"
+    "0:00:02 spk_1: [Yes?  ] \n"
+    "1:01:01 spk_0:Bye!  \n"
+)
+
+
+@pytest.fixture
+def transcript():
+    return ColumnarTranscript.from_json(json.dumps(TRANSCRIPT))
+
+
+def test_from_json_builds_columns(transcript):
+    assert transcript.job_name == "golden"
+    assert transcript.speakers == ["spk_0", "spk_1"]
+    assert transcript.segment_speaker.tolist() == [0, 1, 0]
+    assert transcript.segment_offsets.tolist() == [0, 3, 4, 5]
+    assert transcript.segment_start.tolist() == [0.0, 2.9996, 3661.2346]
+    assert [transcript.content(item) for item in transcript.word_item.tolist()] == ["Hello", "world", "again",
+                                                                                    "Yes", "Bye"]
+    assert transcript.word_punctuation.tolist() == [1, 3, -1, 6, 8]
+    assert transcript.word_confidence.tolist() == [0.99, 0.5, 0.99, 0.8, 0.99]
+
+
+def test_from_json_matches_from_dict(transcript):
+    expected = ColumnarTranscript.from_dict(TRANSCRIPT)
+    for output_format in ("text", "srt", "vtt", "jsonl"):
+        assert list(transcript.render(output_format)) == list(expected.render(output_format))
+
+
+def test_from_json_requires_job_name():
+    with pytest.raises(KeyError):
+        ColumnarTranscript.from_json(json.dumps({"results": TRANSCRIPT["results"]}))
+
+
+def test_srt_golden_output(transcript):
+    assert "".join(transcript.render("srt")) == GOLDEN_SRT
+
+
+def test_vtt_golden_output(transcript):
+    assert "".join(transcript.render("vtt")) == GOLDEN_VTT
+
+
+def test_jsonl_golden_output(transcript):
+    assert "".join(transcript.render("jsonl")) == GOLDEN_JSONL
+
+
+def test_text_golden_output_matches_formatter(transcript):
+    assert "".join(transcript.iter_text(produced_at=PRODUCED_AT)) == GOLDEN_TEXT
+    assert format_transcript(TRANSCRIPT, produced_at=PRODUCED_AT) == GOLDEN_TEXT
+
+
+def test_render_rejects_unknown_format(transcript):
+    with pytest.raises(ValueError):
+        transcript.render("docx")
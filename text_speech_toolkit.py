@@ -3,6 +3,7 @@ from typing import List
 from superagi.tools.base_tool import BaseTool, BaseToolkit
 from aws_diarization import AWSDiarizationTool
 from aws_text_to_speech import AWSTextToSpeechTool
+from aws_batch_diarization import AWSBatchDiarizationTool
 
 
 class LLMDirectToolkit(BaseToolkit, ABC):
@@ -11,7 +12,7 @@ class LLMDirectToolkit(BaseToolkit, ABC):
 
     def get_tools(self) -> List[BaseTool]:
         return [
-            AWSDiarizationTool(), AWSTextToSpeechTool()
+            AWSDiarizationTool(), AWSBatchDiarizationTool(), AWSTextToSpeechTool()
         ]
 
     def get_env_keys(self) -> List[str]:
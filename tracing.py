@@ -0,0 +1,269 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+# Spans and counters recorded by the tools:
+#   spans    client_setup, job_submit, job_wait, job_poll, s3_fetch, s3_upload, transcript_parse,
+#            transcript_merge, transcript_format, resource_write, resource_register, audio_decode,
+#            audio_vad, audio_encode, speech_chunk, diarize, synthesize
+#   counters job_polls, bytes_downloaded, bytes_uploaded, bytes_written, characters_synthesized
+
+
+class Sink:
+    """
+    Receives finished spans and counter increments. Sinks must be thread safe.
+    """
+
+    def record_span(self, name: str, start: float, duration: float, attributes: dict):
+        pass
+
+    def add(self, name: str, value: float, attributes: dict):
+        pass
+
+
+class MemorySink(Sink):
+    """
+    Keeps every span and counter increment in memory, for tests and benchmarks.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.counters = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def record_span(self, name: str, start: float, duration: float, attributes: dict):
+        with self._lock:
+            self.spans.append((name, start, duration, attributes))
+
+    def add(self, name: str, value: float, attributes: dict):
+        with self._lock:
+            self.counters[name] += value
+
+    def durations(self, name: str):
+        with self._lock:
+            return [duration for span_name, _, duration, _ in self.spans if span_name == name]
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+
+
+class JsonLinesSink(Sink):
+    """
+    Appends one JSON object per span and counter increment to a file.
+
+    :param path: File to append to.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def _write(self, record: dict):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def record_span(self, name: str, start: float, duration: float, attributes: dict):
+        self._write({"type": "span", "name": name, "start": start, "duration": duration, **attributes})
+
+    def add(self, name: str, value: float, attributes: dict):
+        self._write({"type": "counter", "name": name, "time": time.time(), "value": value, **attributes})
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusSink(Sink):
+    """
+    Aggregates spans into duration summaries and counters into totals, rendered in the
+    Prometheus text exposition format.
+
+    Only attributes named in ``label_names`` become labels, so per-job values such as job
+    names do not create new series.
+
+    :param namespace: Prefix of every metric name.
+    :param label_names: Attributes kept as labels.
+    """
+
+    def __init__(self, namespace: str = "text_speech", label_names: Iterable[str] = ("service", "kind", "format", "status")):
+        self.namespace = namespace
+        self.label_names = tuple(label_names)
+        self._spans: Dict[Tuple, list] = defaultdict(lambda: [0, 0.0])
+        self._counters: Dict[Tuple, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def _labels(self, attributes: dict) -> Tuple:
+        return tuple((name, str(attributes[name])) for name in self.label_names if name in attributes)
+
+    def record_span(self, name: str, start: float, duration: float, attributes: dict):
+        key = (name, self._labels(attributes))
+        with self._lock:
+            summary = self._spans[key]
+            summary[0] += 1
+            summary[1] += duration
+
+    def add(self, name: str, value: float, attributes: dict):
+        with self._lock:
+            self._counters[(name, self._labels(attributes))] += value
+
+    @staticmethod
+    def _format_labels(labels: Tuple) -> str:
+        if not labels:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in labels)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+    def render(self) -> str:
+        with self._lock:
+            spans = sorted(self._spans.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        if spans:
+            metric = f"{self.namespace}_span_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for (name, labels), (count, total) in spans:
+                label_text = self._format_labels((("span", name),) + labels)
+                lines.append(f"{metric}_count{label_text} {count}")
+                lines.append(f"{metric}_sum{label_text} {total!r}")
+        previous = None
+        for (name, labels), value in counters:
+            metric = f"{self.namespace}_{name}_total"
+            if metric != previous:
+                lines.append(f"# TYPE {metric} counter")
+                previous = metric
+            lines.append(f"{metric}{self._format_labels(labels)} {value!r}")
+        return "\n".join(lines) + "\n"
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    A timed section, recorded on exit. Attributes can be added while it runs with ``set``.
+    """
+    __slots__ = ("sink", "name", "attributes", "start", "_started")
+
+    def __init__(self, sink: Sink, name: str, attributes: dict):
+        self.sink = sink
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.sink.record_span(self.name, self.start, time.perf_counter() - self._started, self.attributes)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+_sink: Optional[Sink] = None
+_sink_lock = threading.Lock()
+
+
+def set_sink(sink: Optional[Sink]):
+    """
+    Send spans and counters to sink from now on. None (the default) disables tracing.
+    """
+    global _sink
+    _sink = sink
+
+
+def configure(trace_file: Optional[str]) -> Optional[Sink]:
+    """
+    Append spans and counters to trace_file with a JsonLinesSink, unless a sink is already set.
+    An empty trace_file leaves tracing as it is.
+
+    :return: The sink in use afterwards.
+    """
+    global _sink
+    with _sink_lock:
+        if _sink is None and trace_file:
+            _sink = JsonLinesSink(trace_file)
+        return _sink
+
+
+def get_sink() -> Optional[Sink]:
+    return _sink
+
+
+def span(name: str, **attributes):
+    """
+    Time a block: ``with span("job_submit", service="transcribe"): ...``.
+
+    When tracing is disabled this returns a shared no-op object.
+    """
+    sink = _sink
+    if sink is None:
+        return _NULL_SPAN
+    return Span(sink, name, attributes)
+
+
+def record(name: str, duration: float, **attributes):
+    """
+    Record a span whose duration was measured elsewhere, e.g. the time a job waited.
+    """
+    sink = _sink
+    if sink is not None:
+        sink.record_span(name, time.time() - duration, duration, attributes)
+
+
+def count(name: str, value: float = 1, **attributes):
+    sink = _sink
+    if sink is not None:
+        sink.add(name, value, attributes)
+
+
+def timed_iter(name: str, iterable: Iterable, **attributes) -> Iterator:
+    """
+    Iterate over iterable, recording the time spent producing its items (not consuming them)
+    as one span once it is exhausted or closed.
+    """
+    sink = _sink
+    if sink is None:
+        return iter(iterable)
+    return _timed_iter(sink, name, iterable, attributes)
+
+
+def _timed_iter(sink: Sink, name: str, iterable: Iterable, attributes: dict) -> Iterator:
+    start = time.time()
+    elapsed = 0.0
+    iterator = iter(iterable)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                return
+            elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        sink.record_span(name, start, elapsed, attributes)
@@ -0,0 +1,314 @@
+import datetime
+import io
+import json
+from typing import IO, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+SENTENCE_END = (".", "?", "!")
+CLAUSE_END = (",", ";")
+
+# Formats rendered by transcript_model.ColumnarTranscript, defined here so they can be
+# checked without importing numpy
+OUTPUT_FORMATS = ("text", "srt", "vtt", "jsonl")
+FILE_EXTENSIONS = {"text": "", "srt": ".srt", "vtt": ".vtt", "jsonl": ".jsonl"}
+
+
+def convert_time_stamp(timestamp: str) -> str:
+    """
+    Function to help convert timestamps from s to H:M:S
+    """
+    delta = datetime.timedelta(seconds=float(timestamp))
+    seconds = delta - datetime.timedelta(microseconds=delta.microseconds)
+    return str(seconds)
+
+
+def best_alternative(alternatives: list) -> dict:
+    """
+    Return the alternative with the highest confidence.
+
+    Mirrors ``sorted(alternatives, key=lambda x: x["confidence"])[-1]`` (including
+    which alternative wins a tie) without building a sorted copy.
+    """
+    best = alternatives[0]
+    for alternative in alternatives[1:]:
+        if not alternative["confidence"] < best["confidence"]:
+            best = alternative
+    return best
+
+
+def render_word(content: str, punctuation: Optional[str]) -> str:
+    """
+    Render a word followed by the punctuation token that comes right after it, if any.
+    """
+    word_to_write = content + " "
+    if punctuation is None:
+        return word_to_write
+    if punctuation in SENTENCE_END:
+        return word_to_write.rstrip() + punctuation + "  "
+    if punctuation in CLAUSE_END:
+        return word_to_write.rstrip() + punctuation + " "
+    return word_to_write + punctuation
+
+
+class ItemIndex:
+    """
+    Incrementally built (start_time, end_time) -> (rendered word, confidence) index.
+
+    The rendered word already carries the punctuation token that follows the first
+    pronunciation with that timing, and the confidence comes from the best alternative
+    of the last pronunciation with that timing, exactly as the original lookup did.
+    Items must be added in document order.
+    """
+
+    def __init__(self):
+        self.contents: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self.punctuation: Dict[Tuple[str, str], Optional[str]] = {}
+        # Key of the previous item when it was the first pronunciation with its timing
+        self.pending_key = None
+
+    def add(self, item: dict):
+        if item["type"] == "pronunciation":
+            key = (item["start_time"], item["end_time"])
+            result = best_alternative(item["alternatives"])
+            self.contents[key] = (result["content"], float(result["confidence"]))
+            if key in self.punctuation:
+                self.pending_key = None
+            else:
+                self.punctuation[key] = None
+                self.pending_key = key
+        else:
+            if self.pending_key is not None and item["type"] == "punctuation" and item["alternatives"]:
+                self.punctuation[self.pending_key] = item["alternatives"][0]["content"]
+            self.pending_key = None
+
+    def finish(self) -> Dict[Tuple[str, str], Tuple[str, float]]:
+        index = {key: (render_word(content, self.punctuation[key]), confidence)
+                 for key, (content, confidence) in self.contents.items()}
+        self.contents.clear()
+        self.punctuation.clear()
+        return index
+
+
+def index_items(items: Iterable[dict]) -> Dict[Tuple[str, str], Tuple[str, float]]:
+    """
+    Build a (start_time, end_time) -> (rendered word, confidence) index in one pass over ``items``.
+
+    :param items: The ``results.items`` of a Transcribe output, in order.
+    :return: Dictionary keyed on the raw start/end time strings.
+    """
+    item_index = ItemIndex()
+    for item in items:
+        item_index.add(item)
+    return item_index.finish()
+
+
+def render_words(start_time: str, speaker_label: str, keys: Iterable[Tuple[str, str]],
+                 index: Dict[Tuple[str, str], Tuple[str, float]], threshold_for_grey: float = 0.96,
+                 time_stamp: Callable[[str], str] = convert_time_stamp) -> str:
+    """
+    Render one speaker segment, given as the timing keys of its words, as a single line.
+    """
+    parts = [f"{time_stamp(start_time)} {speaker_label}:"]
+    low_confidence_open = False
+    for key in keys:
+        word_to_write, confidence = index[key]
+        if confidence < threshold_for_grey:
+            if not low_confidence_open:
+                parts.append(" [")
+                low_confidence_open = True
+            parts.append(word_to_write)
+        elif low_confidence_open:
+            parts.append(word_to_write.rstrip())
+            parts.append("] ")
+            low_confidence_open = False
+        else:
+            parts.append(word_to_write)
+
+    if low_confidence_open:
+        parts.append("] ")
+    parts.append("\n")
+    return "".join(parts)
+
+
+def segment_keys(segment: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple((word["start_time"], word["end_time"]) for word in segment["items"])
+
+
+def render_segment(segment: dict, index: Dict[Tuple[str, str], Tuple[str, float]],
+                   threshold_for_grey: float = 0.96,
+                   time_stamp: Callable[[str], str] = convert_time_stamp) -> str:
+    """
+    Render one speaker segment as a single line, bracketing low-confidence word runs.
+
+    :param segment: A ``results.speaker_labels.segments`` entry with at least one item.
+    :param index: Output of :func:`index_items`.
+    :param threshold_for_grey: Confidence level below which transcriptions are uncertain.
+    :param time_stamp: Converts the raw segment start time into the printed timestamp.
+    :return: The formatted line, including its trailing newline.
+    """
+    return render_words(segment["start_time"], segment["speaker_label"], segment_keys(segment),
+                        index, threshold_for_grey, time_stamp)
+
+
+def header_lines(job_name: str, produced_at: Optional[datetime.datetime] = None) -> Iterator[str]:
+    """
+    Yield the header written at the top of every transcript.
+    """
+    produced_at = produced_at or datetime.datetime.now()
+    yield f"Transcription of {job_name}\n\n"
+    yield ("Transcription using AWS Transcribe automatic speech recognition and"
+           " the 'tscribe' python package.\n")
+    yield produced_at.strftime("Document produced on %A %d %B %Y at %X.\n\n")
+
+
+# Events produced while walking a Transcribe document, in document order
+JOB_NAME = "jobName"
+ITEM = "item"
+ITEMS_END = "items_end"
+SEGMENT = "segment"
+
+ITEM_PREFIX = "results.items.item"
+SEGMENT_PREFIX = "results.speaker_labels.segments.item"
+
+
+def dict_events(data: dict) -> Iterator[Tuple[str, object]]:
+    """
+    Walk an already parsed Transcribe output as a stream of events.
+    """
+    yield JOB_NAME, data["jobName"]
+    results = data["results"]
+    for item in results["items"]:
+        yield ITEM, item
+    yield ITEMS_END, None
+    if "speaker_labels" in results:
+        for segment in results["speaker_labels"]["segments"]:
+            yield SEGMENT, segment
+
+
+def json_events(source: Union[str, bytes, IO]) -> Iterator[Tuple[str, object]]:
+    """
+    Parse a Transcribe JSON document incrementally, yielding one event per item and
+    per speaker segment without materializing the whole document.
+
+    Uses ``ijson`` when it is installed and falls back to ``json.load`` otherwise.
+
+    :param source: The JSON as a string, bytes, or a binary file-like object.
+    """
+    if ijson is None:
+        if hasattr(source, "read"):
+            data = json.load(source)
+        else:
+            data = json.loads(source)
+        yield from dict_events(data)
+        return
+
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    builder = None
+    builder_prefix = None
+    for prefix, event, value in ijson.parse(source):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == builder_prefix and event == "end_map":
+                yield (ITEM if builder_prefix == ITEM_PREFIX else SEGMENT), builder.value
+                builder = None
+        elif event == "start_map" and prefix in (ITEM_PREFIX, SEGMENT_PREFIX):
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            builder_prefix = prefix
+        elif prefix == "jobName" and event == "string":
+            yield JOB_NAME, value
+        elif prefix == "results.items" and event == "end_array":
+            yield ITEMS_END, None
+
+
+def iter_event_lines(events: Iterable[Tuple[str, object]], threshold_for_grey: float = 0.96,
+                     time_stamp: Callable[[str], str] = convert_time_stamp,
+                     produced_at: Optional[datetime.datetime] = None) -> Iterator[str]:
+    """
+    Yield the formatted transcript from a stream of document events, header first and
+    then one line per non-empty speaker segment.
+
+    Segments that arrive after ``results.items`` are rendered as soon as they are read.
+    Segments that arrive before it (the usual Transcribe layout) are kept only as their
+    word timing keys until the item index is complete. Either way the full document is
+    never held in memory, only the compact word index.
+    """
+    header = None
+    item_index = ItemIndex()
+    index = None
+    pending_segments = []
+    pending_lines = []
+
+    def emit(line):
+        if header is None:
+            pending_lines.append(line)
+            return ()
+        return (line,)
+
+    for kind, value in events:
+        if kind == JOB_NAME:
+            header = list(header_lines(value, produced_at))
+            yield from header
+            yield from pending_lines
+            pending_lines.clear()
+        elif kind == ITEM:
+            item_index.add(value)
+        elif kind == ITEMS_END:
+            index = item_index.finish()
+            for start_time, speaker_label, keys in pending_segments:
+                yield from emit(render_words(start_time, speaker_label, keys, index,
+                                             threshold_for_grey, time_stamp))
+            pending_segments.clear()
+        elif kind == SEGMENT and len(value["items"]) > 0:
+            if index is None:
+                pending_segments.append((value["start_time"], value["speaker_label"], segment_keys(value)))
+            else:
+                yield from emit(render_segment(value, index, threshold_for_grey, time_stamp))
+
+    if header is None:
+        raise KeyError("jobName")
+
+
+def iter_transcript_lines(data: dict, threshold_for_grey: float = 0.96,
+                          time_stamp: Callable[[str], str] = convert_time_stamp,
+                          produced_at: Optional[datetime.datetime] = None) -> Iterator[str]:
+    """
+    Yield the formatted transcript of a parsed Transcribe output, header first and then
+    one line per non-empty speaker segment.
+
+    Runs in time linear in the number of items and segment words.
+    """
+    return iter_event_lines(dict_events(data), threshold_for_grey, time_stamp, produced_at)
+
+
+def iter_transcript_json_lines(source: Union[str, bytes, IO], threshold_for_grey: float = 0.96,
+                               time_stamp: Callable[[str], str] = convert_time_stamp,
+                               produced_at: Optional[datetime.datetime] = None) -> Iterator[str]:
+    """
+    Streaming counterpart of :func:`iter_transcript_lines` that parses the Transcribe
+    JSON incrementally from a string, bytes or binary file-like object.
+    """
+    return iter_event_lines(json_events(source), threshold_for_grey, time_stamp, produced_at)
+
+
+def format_transcript(data: dict, threshold_for_grey: float = 0.96,
+                      time_stamp: Callable[[str], str] = convert_time_stamp,
+                      produced_at: Optional[datetime.datetime] = None) -> str:
+    """
+    Format a parsed Transcribe output into the transcript text.
+
+    :param data: Transcribe output, already parsed from JSON.
+    :param threshold_for_grey: Confidence level below which transcriptions are uncertain.
+    :param time_stamp: Converts raw segment start times into printed timestamps.
+    :param produced_at: Time written in the header, defaults to now.
+    :return: Transcription formatted as a text string
+    """
+    return "".join(iter_transcript_lines(data, threshold_for_grey, time_stamp, produced_at))
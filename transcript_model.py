@@ -0,0 +1,298 @@
+import datetime
+import json
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from transcript_formatter import (ITEM, JOB_NAME, OUTPUT_FORMATS, SEGMENT, best_alternative, convert_time_stamp,
+                                  dict_events, header_lines, json_events, render_word)
+
+PRONUNCIATION = 0
+PUNCTUATION = 1
+OTHER = 2
+
+ITEM_TYPES = {"pronunciation": PRONUNCIATION, "punctuation": PUNCTUATION}
+
+
+class ColumnarTranscript:
+    """
+    Array-backed Transcribe output.
+
+    Items are stored as parallel arrays (type, start, end, best confidence) with their
+    contents concatenated into one string and addressed by offsets. Speaker segments are
+    stored as parallel arrays too, and their words as indices into the item arrays. This
+    takes a few dozen bytes per word instead of the kilobyte or so of nested dicts, and
+    every renderer reads from the same model.
+
+    Build one with :meth:`from_json` or :meth:`from_dict`.
+    """
+
+    def __init__(self, job_name: str, item_type: np.ndarray, item_start: np.ndarray, item_end: np.ndarray,
+                 item_confidence: np.ndarray, content_offsets: np.ndarray, contents: str, speakers: List[str],
+                 segment_start: np.ndarray, segment_end: np.ndarray, segment_speaker: np.ndarray,
+                 segment_offsets: np.ndarray, word_item: np.ndarray, word_punctuation: np.ndarray):
+        self.job_name = job_name
+        self.item_type = item_type
+        self.item_start = item_start
+        self.item_end = item_end
+        self.item_confidence = item_confidence
+        self.content_offsets = content_offsets
+        self.contents = contents
+        self.speakers = speakers
+        self.segment_start = segment_start
+        self.segment_end = segment_end
+        self.segment_speaker = segment_speaker
+        # Words of segment i are word_item[segment_offsets[i]:segment_offsets[i + 1]]
+        self.segment_offsets = segment_offsets
+        # Item holding the word's content and confidence
+        self.word_item = word_item
+        # Punctuation item written right after the word, -1 for none
+        self.word_punctuation = word_punctuation
+
+    @classmethod
+    def from_json(cls, source: Union[str, bytes, IO]) -> "ColumnarTranscript":
+        """
+        Build the model while parsing the Transcribe JSON incrementally.
+        """
+        return cls.from_events(json_events(source))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ColumnarTranscript":
+        return cls.from_events(dict_events(data))
+
+    @classmethod
+    def from_events(cls, events: Iterable[Tuple[str, object]]) -> "ColumnarTranscript":
+        job_name = None
+        item_type, item_start, item_end, item_confidence, content_lengths, contents = [], [], [], [], [], []
+        # (start_time, end_time) -> [first item, last item] of the pronunciations with that timing
+        timings: Dict[Tuple[str, str], List[int]] = {}
+        segments = []
+
+        for kind, value in events:
+            if kind == JOB_NAME:
+                job_name = value
+            elif kind == ITEM:
+                index = len(item_type)
+                if value["type"] == "pronunciation":
+                    result = best_alternative(value["alternatives"])
+                    item_start.append(float(value["start_time"]))
+                    item_end.append(float(value["end_time"]))
+                    item_confidence.append(float(result["confidence"]))
+                    content = result["content"]
+                    timing = timings.setdefault((value["start_time"], value["end_time"]), [index, index])
+                    timing[1] = index
+                else:
+                    item_start.append(np.nan)
+                    item_end.append(np.nan)
+                    item_confidence.append(np.nan)
+                    content = value["alternatives"][0]["content"] if value["alternatives"] else ""
+                item_type.append(ITEM_TYPES.get(value["type"], OTHER))
+                content_lengths.append(len(content))
+                contents.append(content)
+            elif kind == SEGMENT and len(value["items"]) > 0:
+                segments.append((value["start_time"], value["end_time"], value["speaker_label"],
+                                 [(word["start_time"], word["end_time"]) for word in value["items"]]))
+
+        if job_name is None:
+            raise KeyError("jobName")
+
+        item_type = np.array(item_type, dtype=np.int8)
+        content_offsets = np.zeros(len(content_lengths) + 1, dtype=np.int64)
+        np.cumsum(content_lengths, out=content_offsets[1:])
+
+        speakers = sorted({segment[2] for segment in segments})
+        speaker_ids = {speaker: number for number, speaker in enumerate(speakers)}
+        segment_offsets = np.zeros(len(segments) + 1, dtype=np.int64)
+        np.cumsum([len(segment[3]) for segment in segments], out=segment_offsets[1:])
+        first_items = np.empty(int(segment_offsets[-1]), dtype=np.int64)
+        word_item = np.empty(int(segment_offsets[-1]), dtype=np.int64)
+        position = 0
+        for segment in segments:
+            for timing in segment[3]:
+                first_items[position], word_item[position] = timings[timing]
+                position += 1
+
+        # The punctuation that follows the first pronunciation with the word's timing
+        following = first_items + 1
+        has_following = following < len(item_type)
+        word_punctuation = np.full(len(word_item), -1, dtype=np.int64)
+        punctuated = has_following.copy()
+        punctuated[has_following] = item_type[following[has_following]] == PUNCTUATION
+        word_punctuation[punctuated] = following[punctuated]
+
+        return cls(job_name, item_type, np.array(item_start, dtype=np.float64), np.array(item_end, dtype=np.float64),
+                   np.array(item_confidence, dtype=np.float64), content_offsets, "".join(contents), speakers,
+                   np.array([float(segment[0]) for segment in segments], dtype=np.float64),
+                   np.array([float(segment[1]) for segment in segments], dtype=np.float64),
+                   np.array([speaker_ids[segment[2]] for segment in segments], dtype=np.int16),
+                   segment_offsets, word_item, word_punctuation)
+
+    def nbytes(self) -> int:
+        """
+        Memory held by the arrays and the content buffer.
+        """
+        arrays = (self.item_type, self.item_start, self.item_end, self.item_confidence, self.content_offsets,
+                  self.segment_start, self.segment_end, self.segment_speaker, self.segment_offsets,
+                  self.word_item, self.word_punctuation)
+        return sum(array.nbytes for array in arrays) + len(self.contents.encode("utf-8"))
+
+    def content(self, item: int) -> str:
+        return self.contents[self.content_offsets[item]:self.content_offsets[item + 1]]
+
+    @property
+    def word_confidence(self) -> np.ndarray:
+        return self.item_confidence[self.word_item]
+
+    @property
+    def word_start(self) -> np.ndarray:
+        return self.item_start[self.word_item]
+
+    @property
+    def word_end(self) -> np.ndarray:
+        return self.item_end[self.word_item]
+
+    @property
+    def word_speaker(self) -> np.ndarray:
+        return np.repeat(self.segment_speaker, np.diff(self.segment_offsets))
+
+    def rendered_words(self) -> List[str]:
+        """
+        Each segment word followed by its punctuation, as written in the text transcript.
+        """
+        offsets = self.content_offsets
+        contents = self.contents
+        return [render_word(contents[offsets[item]:offsets[item + 1]],
+                            contents[offsets[punctuation]:offsets[punctuation + 1]] if punctuation >= 0 else None)
+                for item, punctuation in zip(self.word_item.tolist(), self.word_punctuation.tolist())]
+
+    def _shifted(self, low: np.ndarray, step: int) -> np.ndarray:
+        # low of the previous (step 1) or next (step -1) word in the same segment
+        shifted = np.zeros_like(low)
+        if step == 1:
+            shifted[1:] = low[:-1]
+            shifted[self.segment_offsets[:-1]] = False
+        else:
+            shifted[:-1] = low[1:]
+            shifted[self.segment_offsets[1:] - 1] = False
+        return shifted
+
+    def low_confidence(self, threshold_for_grey: float = 0.96) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the bracketed low-confidence runs with array operations.
+
+        A run opens at a low-confidence word whose predecessor in the same segment is not
+        low-confidence, and closes on the next confident word (which is written inside the
+        brackets) or at the end of the segment.
+
+        :return: ``(low, opens, closes)`` boolean arrays over segment words, where ``closes``
+            marks the confident words that end a run.
+        """
+        low = self.word_confidence < threshold_for_grey
+        previous_low = self._shifted(low, 1)
+        return low, low & ~previous_low, ~low & previous_low
+
+    def low_confidence_spans(self, threshold_for_grey: float = 0.96) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Start and end word index (exclusive) of every run of low-confidence words, never
+        crossing a segment boundary.
+        """
+        low = self.word_confidence < threshold_for_grey
+        starts = np.flatnonzero(low & ~self._shifted(low, 1))
+        ends = np.flatnonzero(low & ~self._shifted(low, -1)) + 1
+        return starts, ends
+
+    def remap_times(self, mapping: Callable[[np.ndarray], np.ndarray]):
+        """
+        Replace every timestamp with ``mapping(timestamps)``, e.g. to undo trimmed silences.
+        """
+        self.item_start = mapping(self.item_start)
+        self.item_end = mapping(self.item_end)
+        self.segment_start = mapping(self.segment_start)
+        self.segment_end = mapping(self.segment_end)
+
+    def iter_text(self, threshold_for_grey: float = 0.96, time_stamp: Callable[[str], str] = convert_time_stamp,
+                  produced_at: Optional[datetime.datetime] = None) -> Iterator[str]:
+        """
+        The transcript in the format of AWSDiarizationTool.process_to_text, line by line.
+        """
+        yield from header_lines(self.job_name, produced_at)
+        words = self.rendered_words()
+        low, opens, closes = self.low_confidence(threshold_for_grey)
+        opens, closes, low = opens.tolist(), closes.tolist(), low.tolist()
+        offsets = self.segment_offsets.tolist()
+        for segment, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+            parts = [f"{time_stamp(self.segment_start[segment])} {self.speakers[self.segment_speaker[segment]]}:"]
+            for word in range(start, end):
+                if opens[word]:
+                    parts.append(" [")
+                if closes[word]:
+                    parts.append(words[word].rstrip())
+                    parts.append("] ")
+                else:
+                    parts.append(words[word])
+            if low[end - 1]:
+                parts.append("] ")
+            parts.append("\n")
+            yield "".join(parts)
+
+    def _cues(self) -> Iterator[Tuple[float, float, str, str]]:
+        words = self.rendered_words()
+        offsets = self.segment_offsets.tolist()
+        for segment, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+            text = " ".join("".join(words[start:end]).split())
+            yield (float(self.segment_start[segment]), float(self.segment_end[segment]),
+                   self.speakers[self.segment_speaker[segment]], text)
+
+    @staticmethod
+    def _cue_time(seconds: float, separator: str) -> str:
+        milliseconds = int(round(seconds * 1000))
+        hours, milliseconds = divmod(milliseconds, 3600000)
+        minutes, milliseconds = divmod(milliseconds, 60000)
+        seconds, milliseconds = divmod(milliseconds, 1000)
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+    def iter_srt(self) -> Iterator[str]:
+        """
+        One SubRip cue per speaker segment, prefixed with the speaker label.
+        """
+        for number, (start, end, speaker, text) in enumerate(self._cues(), 1):
+            yield (f"{number}\n{self._cue_time(start, ',')} --> {self._cue_time(end, ',')}\n"
+                   f"{speaker}: {text}\n\n")
+
+    def iter_vtt(self) -> Iterator[str]:
+        """
+        One WebVTT cue per speaker segment, with the speaker as a voice span.
+        """
+        yield "WEBVTT\n\n"
+        for start, end, speaker, text in self._cues():
+            yield f"{self._cue_time(start, '.')} --> {self._cue_time(end, '.')}\n<v {speaker}>{text}\n\n"
+
+    def iter_jsonl(self, threshold_for_grey: float = 0.96) -> Iterator[str]:
+        """
+        One JSON object per speaker segment with its text and low-confidence time spans.
+        """
+        span_starts, span_ends = self.low_confidence_spans(threshold_for_grey)
+        word_start, word_end = self.word_start, self.word_end
+        span_segments = np.searchsorted(self.segment_offsets, span_starts, side="right") - 1
+        spans_by_segment = {}
+        for segment, start, end in zip(span_segments.tolist(), span_starts.tolist(), span_ends.tolist()):
+            spans_by_segment.setdefault(segment, []).append([float(word_start[start]), float(word_end[end - 1])])
+
+        for segment, (start, end, speaker, text) in enumerate(self._cues()):
+            yield json.dumps({"speaker": speaker, "start": start, "end": end, "text": text,
+                              "low_confidence": spans_by_segment.get(segment, [])}, separators=(",", ":")) + "\n"
+
+    def render(self, output_format: str, threshold_for_grey: float = 0.96,
+               time_stamp: Callable[[str], str] = convert_time_stamp) -> Iterator[str]:
+        """
+        Lines of the transcript in one of OUTPUT_FORMATS.
+        """
+        if output_format == "text":
+            return self.iter_text(threshold_for_grey, time_stamp)
+        if output_format == "srt":
+            return self.iter_srt()
+        if output_format == "vtt":
+            return self.iter_vtt()
+        if output_format == "jsonl":
+            return self.iter_jsonl(threshold_for_grey)
+        raise ValueError(f"Unknown output format {output_format!r}, expected one of {', '.join(OUTPUT_FORMATS)}")